@@ -1,9 +1,8 @@
 /**
- * Validation Middleware
- * Checks if mandatory fields are present in the request body
+ * Returns a validation error for a flow object, or null if it is valid
  */
-const validateFlow = (req, res, next) => {
-  const { flow_id, timestamp, src_ip, dst_ip, attack_type, is_malicious, severity_score } = req.body;
+const getFlowValidationError = (flow) => {
+  const { flow_id, timestamp, src_ip, dst_ip, attack_type, is_malicious, severity_score } = flow || {};
 
   const missingFields = [];
   if (!flow_id) missingFields.push('flow_id');
@@ -17,21 +16,34 @@ const validateFlow = (req, res, next) => {
   if (severity_score === undefined) missingFields.push('severity_score');
 
   if (missingFields.length > 0) {
-    return res.status(400).json({
+    return {
       success: false,
       error: 'Validation failed',
       missingFields: missingFields,
       message: `The following fields are required: ${missingFields.join(', ')}`
-    });
+    };
   }
 
   // Type checks
   if (typeof is_malicious !== 'boolean') {
-    return res.status(400).json({ success: false, error: 'is_malicious must be a boolean' });
+    return { success: false, error: 'is_malicious must be a boolean' };
   }
   
   if (isNaN(parseFloat(severity_score))) {
-    return res.status(400).json({ success: false, error: 'severity_score must be a number' });
+    return { success: false, error: 'severity_score must be a number' };
+  }
+
+  return null;
+};
+
+/**
+ * Validation Middleware
+ * Checks if mandatory fields are present in the request body
+ */
+const validateFlow = (req, res, next) => {
+  const error = getFlowValidationError(req.body);
+  if (error) {
+    return res.status(400).json(error);
   }
 
   next();
@@ -64,6 +76,7 @@ const validateBlockRequest = (req, res, next) => {
 };
 
 module.exports = {
+  getFlowValidationError,
   validateFlow,
   validateBlockRequest
 };
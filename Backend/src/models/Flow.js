@@ -62,6 +62,10 @@ const flowSchema = new mongoose.Schema({
   flow_start_time: { type: Date },
   flow_end_time: { type: Date },
   
+  // Summary alerts: one document standing for flow_count similar flows
+  aggregated: { type: Boolean, default: false },
+  flow_count: { type: Number, default: 1 },
+  
   // Performance Metrics
   flow_bytes_per_sec: { type: Number },
   flow_packets_per_sec: { type: Number },
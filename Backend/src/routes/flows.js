@@ -6,57 +6,65 @@ const { broadcastNewAttack } = require('../websocket/socket');
 const autoBlockService = require('../services/autoBlock');
 const threatIntelService = require('../services/threatIntel');
 const emailService = require('../services/emailService');
-const { validateFlow } = require('../middleware/validator');
+const { validateFlow, getFlowValidationError } = require('../middleware/validator');
 const { auth, idsAuth } = require('../middleware/auth');
 
-// POST /api/flows - Receive flow from IDS (Protected by API Key)
-router.post('/', idsAuth, validateFlow, async (req, res) => {
-  try {
-    const flowData = req.body;
+/**
+ * Save one IDS flow and run the malicious-flow side effects
+ * (alert, WebSocket broadcast, auto-block, email, threat intel)
+ */
+async function ingestFlow(flowData) {
+  const flow = new Flow(flowData);
+  await flow.save();
+  
+  const emoji = flowData.is_malicious ? '🚨' : '✅';
+  console.log(
+    `${emoji} Flow saved: ${flow.flow_id} | ` +
+    `${flow.attack_type} | ` +
+    `Confidence: ${(flow.confidence * 100).toFixed(1)}% | ` +
+    `Severity: ${flow.severity_score}/10`
+  );
+  
+  // Process malicious flows
+  if (flow.is_malicious) {
+    // 0. Save persistent alert
+    const alert = new Alert({
+      flow_id: flow.flow_id,
+      attack_type: flow.attack_type,
+      severity_score: flow.severity_score,
+      src_ip: flow.src_ip,
+      dst_ip: flow.dst_ip,
+      status: 'new'
+    });
+    await alert.save();
+
+    // 1. Broadcast to WebSocket
+    broadcastNewAttack(flowData);
     
-    const flow = new Flow(flowData);
-    await flow.save();
+    // 2. Check auto-block
+    const shouldBlock = await autoBlockService.shouldBlock(flow);
+    if (shouldBlock) {
+      await autoBlockService.blockIP(flow);
+    }
     
-    const emoji = flowData.is_malicious ? '🚨' : '✅';
-    console.log(
-      `${emoji} Flow saved: ${flow.flow_id} | ` +
-      `${flow.attack_type} | ` +
-      `Confidence: ${(flow.confidence * 100).toFixed(1)}% | ` +
-      `Severity: ${flow.severity_score}/10`
-    );
+    // 3. Send email alert for critical attacks (async, don't wait)
+    emailService.sendCriticalAlert(flow).catch(err => {
+      console.error('Email alert failed:', err.message);
+    });
     
-    // Process malicious flows
-    if (flow.is_malicious) {
-      // 0. Save persistent alert
-      const alert = new Alert({
-        flow_id: flow.flow_id,
-        attack_type: flow.attack_type,
-        severity_score: flow.severity_score,
-        src_ip: flow.src_ip,
-        dst_ip: flow.dst_ip,
-        status: 'new'
-      });
-      await alert.save();
+    // 4. Enrich with threat intelligence (async, don't wait)
+    threatIntelService.enrichFlow(flow.flow_id).catch(err => {
+      console.error('Threat intel enrichment failed:', err.message);
+    });
+  }
+  
+  return flow;
+}
 
-      // 1. Broadcast to WebSocket
-      broadcastNewAttack(flowData);
-      
-      // 2. Check auto-block
-      const shouldBlock = await autoBlockService.shouldBlock(flow);
-      if (shouldBlock) {
-        await autoBlockService.blockIP(flow);
-      }
-      
-      // 3. Send email alert for critical attacks (async, don't wait)
-      emailService.sendCriticalAlert(flow).catch(err => {
-        console.error('Email alert failed:', err.message);
-      });
-      
-      // 4. Enrich with threat intelligence (async, don't wait)
-      threatIntelService.enrichFlow(flow.flow_id).catch(err => {
-        console.error('Threat intel enrichment failed:', err.message);
-      });
-    }
+// POST /api/flows - Receive flow from IDS (Protected by API Key)
+router.post('/', idsAuth, validateFlow, async (req, res) => {
+  try {
+    const flow = await ingestFlow(req.body);
     
     res.status(201).json({ 
       success: true,
@@ -82,6 +90,59 @@ router.post('/', idsAuth, validateFlow, async (req, res) => {
   }
 });
 
+// POST /api/flows/bulk - Receive a batch of flows from IDS (Protected by API Key)
+// Body: { flows: [ ...flow objects ] }. Invalid and duplicate flows are reported
+// per item and are not retried by the IDS; a 500 means the batch should be retried.
+router.post('/bulk', idsAuth, async (req, res) => {
+  const flows = req.body && req.body.flows;
+  
+  if (!Array.isArray(flows)) {
+    return res.status(400).json({
+      success: false,
+      error: 'Validation failed',
+      message: 'flows must be an array'
+    });
+  }
+  
+  const result = { accepted: 0, duplicates: 0, rejected: [] };
+  
+  try {
+    for (const flowData of flows) {
+      const validationError = getFlowValidationError(flowData);
+      if (validationError) {
+        result.rejected.push({ flow_id: flowData && flowData.flow_id, error: validationError.error });
+        continue;
+      }
+      
+      try {
+        await ingestFlow(flowData);
+        result.accepted++;
+      } catch (error) {
+        if (error.code === 11000) {
+          result.duplicates++;
+        } else {
+          throw error;
+        }
+      }
+    }
+    
+    res.status(200).json({
+      success: true,
+      ...result,
+      message: `Received ${flows.length} flows`
+    });
+    
+  } catch (error) {
+    console.error('❌ Error saving flow batch:', error.message);
+    res.status(500).json({
+      success: false,
+      error: 'Failed to save flow batch',
+      accepted: result.accepted,
+      message: error.message
+    });
+  }
+});
+
 // GET /api/flows - Get all flows with filtering (Protected by JWT)
 router.get('/', auth, async (req, res) => {
   try {
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: raw-bytes decoder vs scapy dissection.
+
+Decodes the same mix of Ethernet frames with both paths and reports
+packets/s per core. The scapy path mirrors what sniff() + _enqueue_packet
+do: dissect the frame, then pull the fields out of the IP/TCP/UDP layers.
+
+    python benchmarks/bench_decoder.py [-n PACKETS]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scapy.all import Ether, IP, IPv6, TCP, UDP, ICMP, Raw
+from ids_core.decoder import decode_frame, LINKTYPE_ETHERNET
+
+
+def build_frames(n):
+    templates = [
+        Ether() / IP(src='10.0.0.1', dst='93.184.216.34') / TCP(sport=40000, dport=443, flags='PA') / Raw(b'x' * 512),
+        Ether() / IP(src='93.184.216.34', dst='10.0.0.1') / TCP(sport=443, dport=40000, flags='A'),
+        Ether() / IP(src='10.0.0.2', dst='8.8.8.8') / UDP(sport=53000, dport=53) / Raw(b'q' * 40),
+        Ether() / IP(src='10.0.0.3', dst='10.0.0.1') / ICMP(),
+        Ether() / IPv6(src='2001:db8::1', dst='2001:db8::2') / TCP(sport=50000, dport=80, flags='S'),
+    ]
+    frames = [bytes(p) for p in templates]
+    return [frames[i % len(frames)] for i in range(n)]
+
+
+def scapy_path(frame):
+    packet = Ether(frame)
+    if IP not in packet:
+        return None
+    ip = packet[IP]
+    hdr_len = ip.ihl * 4
+    src_port = dst_port = tcp_flags = 0
+    if TCP in packet:
+        tcp = packet[TCP]
+        src_port, dst_port = tcp.sport, tcp.dport
+        hdr_len += tcp.dataofs * 4
+        tcp_flags = int(tcp.flags)
+    elif UDP in packet:
+        udp = packet[UDP]
+        src_port, dst_port = udp.sport, udp.dport
+        hdr_len += 8
+    return (ip.src, ip.dst, ip.proto, src_port, dst_port, hdr_len, len(packet), tcp_flags,
+            max(ip.len - hdr_len, 0))
+
+
+def raw_path(frame):
+    return decode_frame(frame, LINKTYPE_ETHERNET)
+
+
+def bench(fn, frames):
+    start = time.perf_counter()
+    for frame in frames:
+        fn(frame)
+    elapsed = time.perf_counter() - start
+    return len(frames) / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Decoder micro-benchmark')
+    parser.add_argument('-n', '--packets', type=int, default=20000,
+                        help='Frames to decode per path (default: 20000)')
+    args = parser.parse_args()
+
+    frames = build_frames(args.packets)
+
+    # Both paths must agree on the IPv4 frames the scapy path understands
+    for frame in frames[:4]:
+        expected = scapy_path(frame)
+        if expected is not None and expected != raw_path(frame):
+            sys.exit(f"[!] Decoder mismatch: {expected} != {raw_path(frame)}")
+
+    scapy_rate = bench(scapy_path, frames)
+    raw_rate = bench(raw_path, frames)
+
+    print(f"{'path':<10} {'packets/s':>14}")
+    print(f"{'scapy':<10} {scapy_rate:>14,.0f}")
+    print(f"{'raw':<10} {raw_rate:>14,.0f}")
+    print(f"speedup: {raw_rate / scapy_rate:.1f}x")
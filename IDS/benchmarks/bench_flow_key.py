@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: packed integer flow keys vs flow-id strings.
+
+Builds the canonical key for a stream of packets (both directions, IPv4
+and IPv6) and looks it up in a table of the active flows, the way
+RealtimeIDS._ingest() does, once with the get_flow_key() string and once
+with the flow_key() int. Reports packets/s per core for key building alone
+and for key building plus dict lookup.
+
+    python benchmarks/bench_flow_key.py [-n PACKETS] [--flows FLOWS]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ids_core.utils import get_flow_key, flow_key
+
+SERVERS = ('93.184.216.34', '8.8.8.8', '2001:db8::80')
+
+
+def build_packets(n_packets, n_flows, seed=1):
+    rng = random.Random(seed)
+    flows = []
+    for i in range(n_flows):
+        server = SERVERS[i % len(SERVERS)]
+        if ':' in server:
+            client = f"2001:db8:1::{i:x}"
+        else:
+            client = f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"
+        flows.append((client, server, 1024 + i % 60000, 443, 6 if i % 4 else 17))
+    packets = []
+    for _ in range(n_packets):
+        client, server, sport, dport, proto = rng.choice(flows)
+        if rng.random() < 0.5:
+            packets.append((client, server, sport, dport, proto))
+        else:
+            packets.append((server, client, dport, sport, proto))
+    return packets
+
+
+def bench_build(make_key, packets):
+    start = time.perf_counter()
+    for src, dst, sport, dport, proto in packets:
+        make_key(src, dst, sport, dport, proto)
+    return len(packets) / (time.perf_counter() - start)
+
+
+def bench_lookup(make_key, packets):
+    table = {make_key(*packet): packet for packet in packets}
+    get = table.get
+    start = time.perf_counter()
+    for src, dst, sport, dport, proto in packets:
+        get(make_key(src, dst, sport, dport, proto))
+    return len(packets) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Flow key micro-benchmark')
+    parser.add_argument('-n', '--packets', type=int, default=200000,
+                        help='Packets per measurement (default: 200000)')
+    parser.add_argument('--flows', type=int, default=10000,
+                        help='Distinct flows in the stream (default: 10000)')
+    args = parser.parse_args()
+
+    packets = build_packets(args.packets, args.flows)
+
+    # Both schemes must group the packets into the same flows
+    strings = {get_flow_key(*packet) for packet in packets}
+    ints = {flow_key(*packet) for packet in packets}
+    if len(strings) != len(ints):
+        sys.exit(f"[!] Key mismatch: {len(strings)} string keys, {len(ints)} int keys")
+
+    print(f"{'key':<8} {'build/s':>14} {'build+get/s':>14}")
+    rates = {}
+    for name, make_key in (('string', get_flow_key), ('int', flow_key)):
+        rates[name] = (bench_build(make_key, packets), bench_lookup(make_key, packets))
+        print(f"{name:<8} {rates[name][0]:>14,.0f} {rates[name][1]:>14,.0f}")
+    print(f"speedup: {rates['int'][1] / rates['string'][1]:.1f}x")
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Per-flow memory benchmark.
+
+Builds a flow table of N flows with P packets each through the same
+key + FlowRecord.update() path the detector uses and reports the traced
+allocation per flow (key and table slot included).
+
+    python benchmarks/bench_flow_memory.py [-n FLOWS]
+"""
+import os
+import sys
+import gc
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ids_core.flow import FlowRecord
+from ids_core.utils import flow_key
+
+SERVER = '93.184.216.34'
+
+
+def build_table(n_flows, packets_per_flow):
+    flows = {}
+    for i in range(n_flows):
+        client = f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"
+        for k in range(packets_per_flow):
+            ts = 1000.0 + k * 0.001
+            if k % 2 == 0:
+                src, dst, sport, dport, length = client, SERVER, 40000, 80, 60 + k
+            else:
+                src, dst, sport, dport, length = SERVER, client, 80, 40000, 1500
+            key = flow_key(src, dst, sport, dport, 6)
+            flow = flows.get(key)
+            if flow is None:
+                flow = flows[key] = FlowRecord(key, src, dst, sport, dport, 6, ts)
+            flow.update(src, sport, 40, length, ts, 0x10, length - 54)
+    return flows
+
+
+def measure(n_flows, packets_per_flow):
+    gc.collect()
+    tracemalloc.start()
+    flows = build_table(n_flows, packets_per_flow)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del flows
+    return current / n_flows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-flow memory benchmark')
+    parser.add_argument('-n', '--flows', type=int, default=2000,
+                        help='Flows per measurement (default: 2000)')
+    args = parser.parse_args()
+
+    print(f"{'packets/flow':>12} {'bytes/flow':>12}")
+    for packets in (1, 10, 100, 1000):
+        print(f"{packets:>12} {measure(args.flows, packets):>12,.0f}")
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+End-to-end pipeline benchmark suite.
+
+Synthesizes each traffic mix (see traffic.py) and measures, per mix:
+
+    decode            decode_frame() on raw frames                packets/s
+    process_packet    scapy path, pre-dissected packets           packets/s
+    process_frame     raw-decoder ingest into the flow table      packets/s
+    extract_features  feature extraction over the flow table      flows/s
+    classify_flow     one flow per call                           us/flow
+    classify_batch    batch_size flows per call                   us/flow
+    process_flows     full sweep: features, classify, outputs     flows/s
+    memory            traced allocation of the flow table         bytes/flow
+    end_to_end        replay_pcaps() of the mix written as a pcap,
+                      alerts posted to a local stub backend       packets/s
+
+process_packet and process_frame run the live path's capture half
+(_enqueue_packet / _enqueue_frame) and flow half (_ingest_queued) back to
+back on one thread, INGEST_BATCH packets at a time.
+
+Runs use the stub model (stubs.py) unless real artifacts are given, and
+time-based stages report the best of --repeats runs. Results are printed
+and written as JSON; --compare prints the change against an earlier run.
+
+    python benchmarks/bench_pipeline.py [--mix web --mix synflood] [--scale 0.5]
+                                        [-o results.json] [--compare base.json]
+"""
+import os
+import io
+import sys
+import json
+import time
+import socket
+import platform
+import tempfile
+import argparse
+import subprocess
+import statistics
+import contextlib
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ids_core.detector import RealtimeIDS
+from ids_core.decoder import decode_frame, LINKTYPE_ETHERNET
+from ids_core.features import extract_features
+from ids_core.backend import close_log_forwarders
+from ids_core.pipeline import IngestPipeline, INGEST_BATCH
+
+from traffic import MIXES, build_mix, write_pcap
+from stubs import StubBackend, write_artifacts
+
+STAGES = ('decode', 'process_packet', 'process_frame', 'extract_features', 'classify_flow',
+          'classify_batch', 'process_flows', 'memory', 'end_to_end')
+
+# Headline metric per stage and whether larger is better (for --compare)
+PRIMARY = {
+    'decode': ('packets_per_s', True),
+    'process_packet': ('packets_per_s', True),
+    'process_frame': ('packets_per_s', True),
+    'extract_features': ('flows_per_s', True),
+    'classify_flow': ('us_per_flow', False),
+    'classify_batch': ('us_per_flow', False),
+    'process_flows': ('flows_per_s', True),
+    'memory': ('bytes_per_flow', False),
+    'end_to_end': ('packets_per_s', True),
+}
+
+FLOW_TIMEOUT = 120
+
+
+def feed(ids, items, enqueue):
+    """Push items through enqueue (the capture half) and drain the queue
+    with _ingest_queued (the flow half) every INGEST_BATCH items"""
+    ids.pipeline = pipeline = IngestPipeline(ids, capacity=INGEST_BATCH)
+    queued = pipeline._packets
+    for offset in range(0, len(items), INGEST_BATCH):
+        for item in items[offset:offset + INGEST_BATCH]:
+            enqueue(item)
+        ids._ingest_queued(queued, len(queued))
+
+
+def feed_frames(ids, packets):
+    feed(ids, packets, lambda packet: ids._enqueue_frame(packet[1], LINKTYPE_ETHERNET, packet[0]))
+
+
+@contextlib.contextmanager
+def quiet():
+    """Discard the IDS's console output (alerts, periodic stats)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def best_of(repeats, fn, key, higher=True):
+    runs = [fn() for _ in range(repeats)]
+    return (max if higher else min)(runs, key=lambda r: r[key])
+
+
+class Bench:
+    def __init__(self, artifacts, workdir, batch_size, process_packet_limit):
+        self.artifacts = artifacts
+        self.workdir = workdir
+        self.batch_size = batch_size
+        self.process_packet_limit = process_packet_limit
+        self.runs = 0
+
+    def make_ids(self, backend_url=None):
+        self.runs += 1
+        out = os.path.join(self.workdir, f"run{self.runs}")
+        os.makedirs(out)
+        with quiet():
+            return RealtimeIDS(*self.artifacts, geoip_db_path=os.path.join(out, 'none.mmdb'),
+                               backend_url=backend_url, enable_backend=backend_url is not None,
+                               json_output=os.path.join(out, 'alerts.json'),
+                               csv_output=os.path.join(out, 'flows.csv'),
+                               features_output=os.path.join(out, 'features.csv'),
+                               save_interval=10 ** 9, flow_timeout=FLOW_TIMEOUT,
+                               batch_size=self.batch_size)
+
+    def ingest(self, packets):
+        """Fresh detector with every packet of the mix in its flow table"""
+        ids = self.make_ids()
+        with quiet():
+            feed_frames(ids, packets)
+        return ids
+
+    def decode(self, packets):
+        start = time.perf_counter()
+        for _, frame in packets:
+            decode_frame(frame, LINKTYPE_ETHERNET)
+        elapsed = time.perf_counter() - start
+        return {'packets': len(packets), 'seconds': elapsed, 'packets_per_s': len(packets) / elapsed}
+
+    def process_packet(self, packets):
+        from scapy.all import Ether
+        dissected = []
+        for ts, frame in packets[:self.process_packet_limit]:
+            packet = Ether(frame)
+            packet.time = ts
+            dissected.append(packet)
+        ids = self.make_ids()
+        with quiet():
+            start = time.perf_counter()
+            feed(ids, dissected, ids._enqueue_packet)
+            elapsed = time.perf_counter() - start
+        return {'packets': len(dissected), 'seconds': elapsed,
+                'packets_per_s': len(dissected) / elapsed}
+
+    def process_frame(self, packets):
+        ids = self.make_ids()
+        with quiet():
+            start = time.perf_counter()
+            feed_frames(ids, packets)
+            elapsed = time.perf_counter() - start
+        return {'packets': len(packets), 'flows': len(ids.flows), 'seconds': elapsed,
+                'packets_per_s': len(packets) / elapsed}
+
+    def extract_features(self, ids):
+        flows = list(ids.flows.values())
+        start = time.perf_counter()
+        for flow in flows:
+            extract_features(flow)
+        elapsed = time.perf_counter() - start
+        return {'flows': len(flows), 'seconds': elapsed, 'flows_per_s': len(flows) / elapsed}
+
+    def classify_flow(self, flows, features):
+        latencies = []
+        for flow, feats in zip(flows, features):
+            start = time.perf_counter()
+            self.classifier.classify_flow(feats, flow)
+            latencies.append((time.perf_counter() - start) * 1e6)
+        latencies.sort()
+        return {'flows': len(latencies), 'us_per_flow': statistics.median(latencies),
+                'p99_us': latencies[int(len(latencies) * 0.99)]}
+
+    def classify_batch(self, features):
+        start = time.perf_counter()
+        for offset in range(0, len(features), self.batch_size):
+            self.classifier.classify_batch(features[offset:offset + self.batch_size])
+        elapsed = time.perf_counter() - start
+        return {'flows': len(features), 'batch_size': self.batch_size, 'seconds': elapsed,
+                'us_per_flow': elapsed / len(features) * 1e6}
+
+    def process_flows(self, packets):
+        ids = self.ingest(packets)
+        flows = len(ids.flows)
+        with quiet():
+            start = time.perf_counter()
+            ids.process_flows(now=packets[-1][0] + FLOW_TIMEOUT + 1)
+            elapsed = time.perf_counter() - start
+            ids.close()
+        return {'flows': flows, 'alerts': ids.stats_snapshot()['malicious_flows'], 'seconds': elapsed,
+                'flows_per_s': flows / elapsed}
+
+    def memory(self, packets):
+        ids = self.make_ids()
+        with quiet():
+            tracemalloc.start()
+            feed_frames(ids, packets)
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        flows = max(len(ids.flows), 1)
+        return {'flows': len(ids.flows), 'bytes': current, 'peak_bytes': peak,
+                'bytes_per_flow': current / flows}
+
+    def end_to_end(self, pcap, n_packets):
+        backend = StubBackend()
+        try:
+            ids = self.make_ids(backend.url)
+            with quiet():
+                start = time.perf_counter()
+                ids.replay_pcaps([pcap])
+                ids.close()
+                elapsed = time.perf_counter() - start
+            stats = ids.stats_snapshot()
+            flows = stats['total_flows']
+            return {'packets': n_packets, 'flows': flows,
+                    'alerts': stats['malicious_flows'],
+                    'delivered': backend.counts['flows'], 'seconds': elapsed,
+                    'packets_per_s': n_packets / elapsed, 'flows_per_s': flows / elapsed}
+        finally:
+            backend.close()
+
+    def run_mix(self, name, scale, seed, repeats, stages):
+        packets = build_mix(name, scale, seed)
+        results = {'packets': len(packets)}
+
+        if 'decode' in stages:
+            results['decode'] = best_of(repeats, lambda: self.decode(packets), 'packets_per_s')
+        if 'process_packet' in stages:
+            results['process_packet'] = best_of(
+                repeats, lambda: self.process_packet(packets), 'packets_per_s')
+        if 'process_frame' in stages:
+            results['process_frame'] = best_of(
+                repeats, lambda: self.process_frame(packets), 'packets_per_s')
+
+        if {'extract_features', 'classify_flow', 'classify_batch'} & set(stages):
+            self.classifier = ids = self.ingest(packets)
+            flows = list(ids.flows.values())
+            features = [extract_features(flow) for flow in flows]
+            if 'extract_features' in stages:
+                results['extract_features'] = best_of(
+                    repeats, lambda: self.extract_features(ids), 'flows_per_s')
+            if 'classify_flow' in stages:
+                sample = slice(0, 1000)
+                results['classify_flow'] = best_of(
+                    repeats, lambda: self.classify_flow(flows[sample], features[sample]),
+                    'us_per_flow', higher=False)
+            if 'classify_batch' in stages:
+                results['classify_batch'] = best_of(
+                    repeats, lambda: self.classify_batch(features), 'us_per_flow', higher=False)
+            self.classifier = None
+
+        if 'process_flows' in stages:
+            results['process_flows'] = best_of(
+                repeats, lambda: self.process_flows(packets), 'flows_per_s')
+        if 'memory' in stages:
+            results['memory'] = self.memory(packets)
+        if 'end_to_end' in stages:
+            pcap = os.path.join(self.workdir, f"{name}.pcap")
+            write_pcap(pcap, packets)
+            results['end_to_end'] = best_of(
+                repeats, lambda: self.end_to_end(pcap, len(packets)), 'packets_per_s')
+        return results
+
+
+def environment():
+    def version(module):
+        try:
+            return __import__(module).__version__
+        except ImportError:
+            return None
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'host': socket.gethostname(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'sklearn': version('sklearn'),
+        'scapy': version('scapy'),
+    }
+
+
+def print_results(results):
+    for mix, stages in results.items():
+        print(f"\n{mix} ({stages['packets']:,} packets)")
+        for stage in STAGES:
+            if stage in stages:
+                key, _ = PRIMARY[stage]
+                print(f"  {stage:<18} {stages[stage][key]:>14,.1f} {key}")
+
+
+def print_comparison(base, results):
+    print(f"\nChange vs {base['meta'].get('commit') or 'baseline'} "
+          f"(> 1.00x is better)")
+    for mix, stages in results.items():
+        old_stages = base['results'].get(mix, {})
+        for stage in STAGES:
+            if stage in stages and stage in old_stages:
+                key, higher = PRIMARY[stage]
+                new, old = stages[stage][key], old_stages[stage][key]
+                if new and old:
+                    ratio = new / old if higher else old / new
+                    print(f"  {mix:<10} {stage:<18} {old:>14,.1f} -> {new:>14,.1f} "
+                          f"{key:<15} {ratio:>6.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='IDS pipeline benchmark suite')
+    parser.add_argument('--mix', action='append', choices=sorted(MIXES),
+                        help='Traffic mix to run; repeatable (default: all)')
+    parser.add_argument('--stage', action='append', choices=STAGES,
+                        help='Stage to run; repeatable (default: all)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Multiply the size of every mix (default: 1.0)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Traffic generator seed (default: 0)')
+    parser.add_argument('-r', '--repeats', type=int, default=3,
+                        help='Runs per timed stage, best is reported (default: 3)')
+    parser.add_argument('-b', '--batch-size', type=int, default=1024,
+                        help='Detector batch size (default: 1024)')
+    parser.add_argument('--process-packet-limit', type=int, default=20000,
+                        help='Packets per mix for the scapy process_packet stage (default: 20000)')
+    parser.add_argument('-m', '--model', help='Model pickle (default: stub model)')
+    parser.add_argument('-f', '--features', help='Selected features pickle (with -m)')
+    parser.add_argument('-e', '--encoder', help='Label encoder pickle (with -m)')
+    parser.add_argument('-o', '--output', help='Write results as JSON to this file')
+    parser.add_argument('--compare', metavar='JSON', help='Earlier results to compare against')
+    args = parser.parse_args()
+
+    if args.model and not (args.features and args.encoder):
+        parser.error('-m needs -f and -e')
+
+    mixes = args.mix or list(MIXES)
+    stages = args.stage or list(STAGES)
+
+    with tempfile.TemporaryDirectory(prefix='ids-bench-') as workdir:
+        if args.model:
+            artifacts = [args.model, args.features, args.encoder]
+        else:
+            artifacts = write_artifacts(workdir, args.seed)
+        bench = Bench(artifacts, workdir, args.batch_size, args.process_packet_limit)
+
+        results = {}
+        for mix in mixes:
+            print(f"[*] {mix}...", file=sys.stderr)
+            results[mix] = bench.run_mix(mix, args.scale, args.seed, args.repeats, stages)
+        close_log_forwarders()
+
+    report = {
+        'meta': dict(environment(), model='stub' if not args.model else args.model,
+                     scale=args.scale, seed=args.seed, repeats=args.repeats,
+                     batch_size=args.batch_size),
+        'results': results,
+    }
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n[+] Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
@@ -0,0 +1,118 @@
+"""
+Stand-ins for the trained model and the Express backend.
+
+StubModel has the predict_proba() / classes_ interface of the scikit-learn
+model but costs a few vector operations, so pipeline benchmarks measure
+the IDS rather than the forest (bench_inference.py covers the forest).
+StubBackend accepts the IDS's HTTP calls on a local port and counts them.
+"""
+import os
+import json
+import pickle
+import threading
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+from sklearn.preprocessing import LabelEncoder
+
+from ids_core.config import FEATURE_COLUMNS_ORDERED
+
+STUB_LABELS = ['BENIGN', 'DDoS', 'DoS slowloris', 'PortScan']
+
+
+class StubModel:
+    """Deterministic rule-based classifier over the CIC feature columns.
+
+    Half-open connections with no reply score as DDoS, single probes that
+    are reset as PortScan, long connections with tiny segments as
+    slowloris and everything else as BENIGN; a fixed random projection of
+    the features adds some spread to the confidences.
+    """
+
+    def __init__(self, features, labels, seed=0):
+        column = {name: i for i, name in enumerate(features)}
+        self.syn = column['SYN Flag Count']
+        self.rst = column['RST Flag Count']
+        self.fwd = column['Total Fwd Packets']
+        self.bwd = column['Total Backward Packets']
+        self.duration = column['Flow Duration']
+        self.segment = column['Avg Fwd Segment Size']
+        self.label_index = {label: i for i, label in enumerate(labels)}
+
+        rng = np.random.default_rng(seed)
+        self.weights = rng.normal(0, 0.02, size=(len(features), len(labels))).astype(np.float32)
+        self.classes_ = np.arange(len(labels))
+        self.n_features_in_ = len(features)
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        logits = np.log1p(np.abs(X)) @ self.weights
+        logits[:, self.label_index['BENIGN']] += 2.0
+        logits[:, self.label_index['DDoS']] += 4.0 * (
+            (X[:, self.syn] > 0) & (X[:, self.bwd] == 0))
+        logits[:, self.label_index['PortScan']] += 4.0 * (
+            (X[:, self.rst] > 0) & (X[:, self.fwd] <= 2))
+        logits[:, self.label_index['DoS slowloris']] += 4.0 * (
+            (X[:, self.duration] > 60e6) & (X[:, self.segment] < 40))
+        logits -= logits.max(axis=1, keepdims=True)
+        proba = np.exp(logits)
+        return proba / proba.sum(axis=1, keepdims=True)
+
+
+def write_artifacts(directory, seed=0):
+    """Pickle a stub model, feature list and label encoder; returns their paths"""
+    features = list(dict.fromkeys(FEATURE_COLUMNS_ORDERED))
+    encoder = LabelEncoder().fit(STUB_LABELS)
+    model = StubModel(features, list(encoder.classes_), seed)
+
+    paths = []
+    for name, obj in (('model.pkl', model), ('features.pkl', features), ('encoder.pkl', encoder)):
+        path = os.path.join(directory, name)
+        with open(path, 'wb') as f:
+            pickle.dump(obj, f)
+        paths.append(path)
+    return paths
+
+
+class StubBackend:
+    """Local HTTP server answering the IDS backend API with 200 OK"""
+
+    def __init__(self, port=0):
+        self.counts = {'flows': 0, 'bulk_posts': 0, 'log_posts': 0}
+        counts = self.counts
+        lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._reply()
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])) or b'{}')
+                with lock:
+                    if self.path == '/api/flows/bulk':
+                        counts['bulk_posts'] += 1
+                        counts['flows'] += len(body.get('flows', ()))
+                    elif self.path == '/api/flows':
+                        counts['flows'] += 1
+                    elif self.path == '/api/logs':
+                        counts['log_posts'] += 1
+                self._reply()
+
+            def _reply(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(b'{"success": true}')
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,176 @@
+"""
+Synthetic traffic mixes for the benchmarks.
+
+Every mix is a time-ordered list of (ts, frame) pairs with raw Ethernet /
+IPv4 / TCP-UDP frames built with struct (checksums are left at zero, the
+decoder never reads them). Generation is seeded, so the same mix, scale and
+seed always produce byte-identical traffic.
+
+    web        benign HTTPS sessions: handshake, request, response, FIN
+    synflood   spoofed SYNs to one server port, one packet per source
+    portscan   one scanner probing a range of ports, RST replies
+    slowloris  long-lived connections trickling partial headers
+    mixed      all of the above interleaved
+"""
+import heapq
+import random
+import struct
+
+from ids_core.decoder import LINKTYPE_ETHERNET
+
+TCP_FIN, TCP_SYN, TCP_RST, TCP_PSH, TCP_ACK = 0x01, 0x02, 0x04, 0x08, 0x10
+
+_ETH = struct.Struct('!6s6sH')
+_IPV4 = struct.Struct('!BBHHHBBH4s4s')
+_TCP = struct.Struct('!HHIIBBHHH')
+_UDP = struct.Struct('!HHHH')
+_MAC_A = b'\x02\x00\x00\x00\x00\x01'
+_MAC_B = b'\x02\x00\x00\x00\x00\x02'
+
+_PCAP_HEADER = struct.Struct('<IHHiIII')
+_PCAP_RECORD = struct.Struct('<IIII')
+
+START_TIME = 1700000000.0
+
+
+def _ip(addr):
+    return bytes(int(part) for part in addr.split('.'))
+
+
+def tcp_frame(src, dst, sport, dport, flags, payload=0, window=64240):
+    """Ethernet/IPv4/TCP frame with `payload` zero bytes of data"""
+    total = 40 + payload
+    return (_ETH.pack(_MAC_A, _MAC_B, 0x0800) +
+            _IPV4.pack(0x45, 0, total, 0, 0x4000, 64, 6, 0, _ip(src), _ip(dst)) +
+            _TCP.pack(sport, dport, 0, 0, 5 << 4, flags, window, 0, 0) +
+            bytes(payload))
+
+
+def udp_frame(src, dst, sport, dport, payload=0):
+    total = 28 + payload
+    return (_ETH.pack(_MAC_A, _MAC_B, 0x0800) +
+            _IPV4.pack(0x45, 0, total, 0, 0x4000, 64, 17, 0, _ip(src), _ip(dst)) +
+            _UDP.pack(sport, dport, 8 + payload, 0) +
+            bytes(payload))
+
+
+def _client(rng):
+    return f"10.{rng.randrange(1, 255)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+
+
+def web(n_flows, rng, span=60.0):
+    """Benign request/response sessions with a proper close"""
+    packets = []
+    for _ in range(n_flows):
+        client, server = _client(rng), f"93.184.216.{rng.randrange(1, 255)}"
+        sport, dport = rng.randrange(32768, 61000), rng.choice((80, 443))
+        t = START_TIME + rng.uniform(0, span)
+        rtt = rng.uniform(0.005, 0.08)
+
+        def out(flags, payload=0):
+            packets.append((t, tcp_frame(client, server, sport, dport, flags, payload)))
+
+        def back(flags, payload=0):
+            packets.append((t, tcp_frame(server, client, dport, sport, flags, payload, 65160)))
+
+        out(TCP_SYN)
+        t += rtt
+        back(TCP_SYN | TCP_ACK)
+        t += 0.0002
+        out(TCP_ACK)
+        out(TCP_PSH | TCP_ACK, rng.randrange(200, 700))
+        t += rtt + rng.uniform(0.001, 0.05)
+        for _ in range(rng.randrange(2, 20)):
+            back(TCP_ACK, 1460)
+            t += rng.uniform(0.0001, 0.002)
+        back(TCP_PSH | TCP_ACK, rng.randrange(100, 1460))
+        t += rtt / 2
+        out(TCP_ACK)
+        t += rng.uniform(0.01, 2.0)
+        out(TCP_FIN | TCP_ACK)
+        t += rtt
+        back(TCP_FIN | TCP_ACK)
+        t += 0.0002
+        out(TCP_ACK)
+    return packets
+
+
+def synflood(n_packets, rng, span=10.0):
+    """Spoofed SYNs to one server port; every packet opens a new flow"""
+    target = '93.184.216.34'
+    step = span / max(n_packets, 1)
+    return [(START_TIME + i * step,
+             tcp_frame(_client(rng), target, rng.randrange(1024, 65536), 80, TCP_SYN, window=512))
+            for i in range(n_packets)]
+
+
+def portscan(n_ports, rng, span=10.0):
+    """SYN probes from one scanner to consecutive ports, answered by RST"""
+    scanner, target = '10.66.6.6', '93.184.216.50'
+    sport = rng.randrange(40000, 60000)
+    step = span / max(n_ports, 1)
+    packets = []
+    for i in range(n_ports):
+        t = START_TIME + i * step
+        port = 1 + i % 65535
+        packets.append((t, tcp_frame(scanner, target, sport, port, TCP_SYN, window=1024)))
+        packets.append((t + 0.0003, tcp_frame(target, scanner, port, sport, TCP_RST | TCP_ACK, window=0)))
+    return packets
+
+
+def slowloris(n_flows, rng, span=300.0, interval=10.0):
+    """Connections that send a few header bytes every `interval` seconds"""
+    packets = []
+    target = '93.184.216.80'
+    for _ in range(n_flows):
+        client, sport = _client(rng), rng.randrange(32768, 61000)
+        t = START_TIME + rng.uniform(0, interval)
+        packets.append((t, tcp_frame(client, target, sport, 80, TCP_SYN)))
+        packets.append((t + 0.02, tcp_frame(target, client, 80, sport, TCP_SYN | TCP_ACK)))
+        packets.append((t + 0.0202, tcp_frame(client, target, sport, 80, TCP_ACK)))
+        t += 0.03
+        while t < START_TIME + span:
+            packets.append((t, tcp_frame(client, target, sport, 80, TCP_PSH | TCP_ACK,
+                                         rng.randrange(5, 30))))
+            packets.append((t + 0.02, tcp_frame(target, client, 80, sport, TCP_ACK)))
+            t += interval * rng.uniform(0.8, 1.2)
+    return packets
+
+
+def dns(n_queries, rng, span=60.0):
+    """Background UDP request/response pairs"""
+    packets = []
+    for _ in range(n_queries):
+        client, sport = _client(rng), rng.randrange(1024, 65536)
+        t = START_TIME + rng.uniform(0, span)
+        packets.append((t, udp_frame(client, '10.0.0.53', sport, 53, rng.randrange(30, 60))))
+        packets.append((t + 0.001, udp_frame('10.0.0.53', client, 53, sport, rng.randrange(60, 300))))
+    return packets
+
+
+# Mix name -> list of (generator, size at scale 1.0)
+MIXES = {
+    'web': [(web, 2000), (dns, 1000)],
+    'synflood': [(synflood, 20000), (web, 200)],
+    'portscan': [(portscan, 10000), (web, 200)],
+    'slowloris': [(slowloris, 500), (web, 200)],
+    'mixed': [(web, 1000), (dns, 500), (synflood, 5000), (portscan, 2500), (slowloris, 100)],
+}
+
+
+def build_mix(name, scale=1.0, seed=0):
+    """(ts, frame) list for a named mix, sorted by timestamp"""
+    rng = random.Random(f"{name}:{seed}")
+    parts = [sorted(gen(max(1, int(size * scale)), rng), key=lambda p: p[0])
+             for gen, size in MIXES[name]]
+    return list(heapq.merge(*parts, key=lambda p: p[0]))
+
+
+def write_pcap(path, packets, linktype=LINKTYPE_ETHERNET):
+    """Write (ts, frame) pairs as a classic microsecond pcap file"""
+    with open(path, 'wb') as f:
+        f.write(_PCAP_HEADER.pack(0xA1B2C3D4, 2, 4, 0, 0, 65535, linktype))
+        for ts, frame in packets:
+            sec, usec = divmod(int(round(ts * 1e6)), 1000000)
+            f.write(_PCAP_RECORD.pack(sec, usec, len(frame), len(frame)))
+            f.write(frame)
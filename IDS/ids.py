@@ -7,13 +7,17 @@ Entry Point Script
 import sys
 import os
 import argparse
+import signal
 import threading
 import time
 
 # Ensure we can import ids_core from current directory
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from ids_core.detector import RealtimeIDS
+# First, so that startup phases are timed from here. The detector (numpy,
+# requests, ...) is imported only once the arguments are known to need it
+import ids_core.startup
+from ids_core.sampling import build_bpf_filter, TrustFilter
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -26,39 +30,147 @@ EXAMPLES:
 
   List interfaces:
     sudo python ids.py --list
+
+  Replay a capture file (no root required):
+    python ids.py -m models/rf_model.pkl -f models/features.pkl -e models/encoder.pkl --read-pcap capture.pcap
+
+  Convert the model once into a memory-mapped bundle for fast startup:
+    python -m ids_core.bundle -m models/rf_model.pkl -f models/features.pkl -e models/encoder.pkl -o models/rf.bundle
+    sudo python ids.py -m models/rf.bundle
+
+  Swap in a retrained model without restarting (flows in progress are kept):
+    sudo python ids.py -m models/rf.bundle --reload-interval 10
+    kill -HUP <pid>    # or rewrite the bundle; reloaded within 2 intervals
         """)
     
-    parser.add_argument('-m', '--model', required=True,
-                        help='Path to Random Forest model pickle file')
-    parser.add_argument('-f', '--features', required=True,
-                        help='Path to selected features pickle file')
-    parser.add_argument('-e', '--encoder', required=True,
-                        help='Path to label encoder pickle file')
+    parser.add_argument('-m', '--model',
+                        help='Path to Random Forest model pickle file, or a model bundle directory '
+                             '(python -m ids_core.bundle)')
+    parser.add_argument('-f', '--features',
+                        help='Path to selected features pickle file (not needed with a bundle)')
+    parser.add_argument('-e', '--encoder',
+                        help='Path to label encoder pickle file (not needed with a bundle)')
+    parser.add_argument('--reload-interval', type=float, default=0, metavar='SECONDS',
+                        help='Check the model files for changes this often and hot-reload them; '
+                             'SIGHUP reloads regardless (default: 0, SIGHUP only)')
     parser.add_argument('--geoip-db', default='GeoDB/GeoLite2-City.mmdb',
                         help='Path to GeoIP2 database (default: GeoDB/GeoLite2-City.mmdb)')
+    parser.add_argument('--geoip-mode', choices=['auto', 'mmap', 'memory', 'file'], default='auto',
+                        help='How to open the GeoIP2 database (default: auto)')
+    parser.add_argument('--geoip-cache-size', type=int, default=65536,
+                        help='GeoIP results cached per IP and per /24 or /48 prefix, 0 disables (default: 65536)')
     parser.add_argument('--backend-url', default='http://localhost:3000',
                         help='Backend API URL (default: http://localhost:3000)')
     parser.add_argument('--no-backend', action='store_true',
                         help='Disable backend POST (offline mode)')
+    parser.add_argument('--backend-batch-size', type=int, default=200,
+                        help='Alerts per bulk POST to the backend (default: 200)')
+    parser.add_argument('--backend-queue-size', type=int, default=10000,
+                        help='Alerts buffered in memory before spilling to disk (default: 10000)')
+    parser.add_argument('--backend-spool',
+                        help='Spill file for undelivered alerts (default: backend_spool.jsonl next to --json)')
     parser.add_argument('-i', '--interface',
                         help='Network interface to capture from')
     parser.add_argument('--json', default='output/malicious_flows.json',
                         help='JSON output file (default: output/malicious_flows.json)')
+    parser.add_argument('--json-format', choices=['array', 'jsonl'], default='array',
+                        help='Alert file format: one JSON array rewritten per sweep, or append-only '
+                             'JSON Lines (default: array)')
+    parser.add_argument('--json-rotate-size', type=float, default=0,
+                        help='JSONL: rotate the alert file after this many MB, 0 disables (default: 0)')
+    parser.add_argument('--json-rotate-interval', type=int, default=0,
+                        help='JSONL: rotate the alert file after this many seconds, 0 disables (default: 0)')
+    parser.add_argument('--json-compress', choices=['none', 'gzip', 'zstd'], default='none',
+                        help='JSONL: compress rotated alert files (default: none)')
+    parser.add_argument('--json-fsync', default='rotate',
+                        help='JSONL: fsync policy - always, rotate, never, or seconds between '
+                             'fsyncs (default: rotate)')
     parser.add_argument('--csv', default='output/all_flows.csv',
                         help='CSV output file (default: output/all_flows.csv)')
     parser.add_argument('--features-output', default='output/ml_features.csv',
                         help='ML features CSV (default: output/ml_features.csv)')
+    parser.add_argument('--table-format', choices=['csv', 'parquet', 'arrow'], default='csv',
+                        help='Format of the flow record and ML feature outputs; parquet/arrow write '
+                             'a directory of part files named after --csv/--features-output and '
+                             'need pyarrow (default: csv)')
+    parser.add_argument('--table-row-group', type=int, default=50000,
+                        help='Parquet/Arrow: rows per row group (default: 50000)')
+    parser.add_argument('--table-flush-interval', type=float, default=60,
+                        help='Parquet/Arrow: flush a partial row group after this many seconds (default: 60)')
     parser.add_argument('-s', '--save-interval', type=int, default=10,
                         help='Flow check interval in seconds (default: 10)')
     parser.add_argument('-t', '--timeout', type=int, default=120,
                         help='Flow timeout in seconds (default: 120)')
     parser.add_argument('-c', '--confidence', type=float, default=0.7,
                         help='Confidence threshold 0-1 (default: 0.7)')
+    parser.add_argument('--inference', choices=['sklearn', 'compiled'], default='sklearn',
+                        help='Classifier engine: scikit-learn predict_proba, or the forest compiled '
+                             'to flat NumPy arrays at startup, used for batches under 512 flows '
+                             '(default: sklearn)')
+    parser.add_argument('--early-packets', type=int, default=0,
+                        help='Classify open flows every N packets without ending them, 0 disables (default: 0)')
+    parser.add_argument('--early-interval', type=float, default=0,
+                        help='Classify open flows every N seconds without ending them, 0 disables (default: 0)')
+    parser.add_argument('--early-max-backoff', type=int, default=16,
+                        help='Flows already scored malicious are rescored up to this many times less '
+                             'often (default: 16)')
+    parser.add_argument('--prediction-cache', type=int, default=0, metavar='SIZE',
+                        help='Memoize classifier results for up to SIZE quantized feature vectors, '
+                             '0 disables (default: 0)')
+    parser.add_argument('--prediction-cache-bits', type=int, default=8,
+                        help='Mantissa bits kept per feature when building cache keys; fewer bits '
+                             'means coarser bins, 23 keeps float32 values exact (default: 8)')
+    parser.add_argument('--alert-window', type=float, default=0,
+                        help='Collapse alerts with the same source, destination, port and attack type '
+                             'into one summary alert per this many seconds, 0 disables (default: 0)')
+    parser.add_argument('-b', '--batch-size', type=int, default=1024,
+                        help='Max flows per classification batch (default: 1024)')
     parser.add_argument('-n', '--count', type=int, default=0,
                         help='Number of packets to capture (0=infinite)')
-    parser.add_argument('--filter', help='BPF filter expression')
+    parser.add_argument('--filter', help='BPF filter expression (live capture only)')
+    parser.add_argument('--trust-net', action='append', default=[], metavar='CIDR',
+                        help='Drop traffic to/from this subnet in the kernel (BPF), or in software '
+                             'when replaying captures; repeatable')
+    parser.add_argument('--trust-port', action='append', default=[], type=int, metavar='PORT',
+                        help='Drop traffic on this port in the kernel (BPF), or in software '
+                             'when replaying captures; repeatable')
+    parser.add_argument('--sample', type=int, default=1, metavar='N',
+                        help='Track only 1/N of new flows, chosen by flow hash (default: 1 = all)')
+    parser.add_argument('--auto-sample', action='store_true',
+                        help='Tighten flow sampling automatically when the flow table or processing lag '
+                             'exceeds --max-flows / --max-lag')
+    parser.add_argument('--max-sample', type=int, default=64, metavar='N',
+                        help='Coarsest automatic sampling rate, 1/N flows (default: 64)')
+    parser.add_argument('--max-flows', type=int, default=200000,
+                        help='Active flows above which --auto-sample tightens sampling (default: 200000)')
+    parser.add_argument('--max-lag', type=float, default=1.0,
+                        help='Capture-to-processing lag in seconds above which --auto-sample '
+                             'tightens sampling (default: 1.0)')
+    parser.add_argument('--decoder', choices=['raw', 'scapy'], default='raw',
+                        help='Live packet decoder: raw header parser or full scapy dissection (default: raw)')
+    parser.add_argument('--capture', choices=['socket', 'ring'], default='socket',
+                        help='Live capture backend: scapy socket, or AF_PACKET TPACKET_V3 mmap ring '
+                             '(Linux, raw decoder) (default: socket)')
+    parser.add_argument('--ring-size', type=int, default=64, metavar='MB',
+                        help='TPACKET_V3 ring size in MiB (default: 64)')
+    parser.add_argument('--fanout', type=int, metavar='GROUP',
+                        help='Join PACKET_FANOUT group GROUP so several IDS processes on the same '
+                             'interface split its flows between them (ring capture only)')
+    parser.add_argument('--ingest-queue', type=int, default=65536, metavar='PACKETS',
+                        help='Decoded packets buffered between the capture and flow threads; '
+                             'packets arriving when it is full are dropped and counted (default: 65536)')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help='Serve Prometheus metrics at http://HOST:PORT/metrics (default: off)')
+    parser.add_argument('--metrics-host', default='127.0.0.1',
+                        help='Address for the metrics endpoint (default: 127.0.0.1)')
     parser.add_argument('-d', '--duration', type=int,
                         help='Capture duration in seconds')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Worker processes for sharded flow tracking and classification (default: 1)')
+    parser.add_argument('--read-pcap', metavar='FILE',
+                        help='Replay a pcap/pcapng file instead of live capture')
+    parser.add_argument('--read-pcap-dir', metavar='DIR',
+                        help='Replay every pcap/pcapng file in a directory (sorted by name)')
     parser.add_argument('--list', action='store_true',
                         help='List available network interfaces')
     
@@ -78,45 +190,200 @@ EXAMPLES:
             print("Error: scapy not installed. Cannot list interfaces.")
             sys.exit(1)
     
+    from ids_core.bundle import is_bundle
+    
     # Validate files
-    for fpath, fname in [(args.model, 'Model'), 
-                         (args.features, 'Features'), 
-                         (args.encoder, 'Encoder')]:
+    if not args.model:
+        parser.error("the following arguments are required: -m/--model")
+    model_files = [(args.model, 'Model')]
+    if not is_bundle(args.model):
+        if not args.features or not args.encoder:
+            parser.error("-f/--features and -e/--encoder are required unless -m is a model bundle")
+        model_files += [(args.features, 'Features'), (args.encoder, 'Encoder')]
+    for fpath, fname in model_files:
         if not os.path.exists(fpath):
             print(f"\n[!] Error: {fname} file not found: {fpath}\n")
             sys.exit(1)
     
+    pcap_files = []
+    if args.read_pcap:
+        if not os.path.isfile(args.read_pcap):
+            print(f"\n[!] Error: Capture file not found: {args.read_pcap}\n")
+            sys.exit(1)
+        pcap_files.append(args.read_pcap)
+    if args.read_pcap_dir:
+        if not os.path.isdir(args.read_pcap_dir):
+            print(f"\n[!] Error: Capture directory not found: {args.read_pcap_dir}\n")
+            sys.exit(1)
+        from ids_core.pcap import list_capture_files
+        pcap_files.extend(list_capture_files(args.read_pcap_dir))
+        if not pcap_files:
+            print(f"\n[!] Error: No capture files in {args.read_pcap_dir}\n")
+            sys.exit(1)
+    
     if not 0 <= args.confidence <= 1:
         print(f"\n[!] Error: Confidence must be between 0 and 1\n")
         sys.exit(1)
     
+    if args.workers < 1:
+        print(f"\n[!] Error: Workers must be at least 1\n")
+        sys.exit(1)
+    
+    if args.batch_size < 1:
+        print(f"\n[!] Error: Batch size must be at least 1\n")
+        sys.exit(1)
+    
+    if args.capture == 'ring' and args.decoder == 'scapy':
+        print(f"\n[!] Error: --capture ring requires the raw decoder\n")
+        sys.exit(1)
+    
+    if args.workers > 1 and args.decoder == 'scapy':
+        print(f"\n[!] Error: --workers requires the raw decoder\n")
+        sys.exit(1)
+    
+    if args.fanout is not None and (args.capture != 'ring' or not 0 <= args.fanout < 65536):
+        print(f"\n[!] Error: --fanout needs --capture ring and a group id from 0 to 65535\n")
+        sys.exit(1)
+    
+    if args.ingest_queue < 1:
+        print(f"\n[!] Error: --ingest-queue must be at least 1\n")
+        sys.exit(1)
+    
+    if args.reload_interval < 0:
+        print(f"\n[!] Error: --reload-interval cannot be negative\n")
+        sys.exit(1)
+    
+    if args.sample < 1:
+        print(f"\n[!] Error: --sample must be at least 1\n")
+        sys.exit(1)
+    
+    if pcap_files and args.filter:
+        print(f"\n[!] Error: --filter applies to live capture only; "
+              f"--trust-net / --trust-port also work with --read-pcap\n")
+        sys.exit(1)
+    
+    try:
+        args.filter = build_bpf_filter(args.filter, args.trust_net, args.trust_port)
+        trust = TrustFilter(args.trust_net, args.trust_port)
+    except ValueError as e:
+        print(f"\n[!] Error: invalid --trust-net / --trust-port: {e}\n")
+        sys.exit(1)
+    
+    if args.json_fsync not in ('always', 'rotate', 'never'):
+        try:
+            float(args.json_fsync)
+        except ValueError:
+            print(f"\n[!] Error: --json-fsync must be always, rotate, never or a number of seconds\n")
+            sys.exit(1)
+    
+    if args.json_format == 'jsonl' and args.json.endswith('.json'):
+        args.json += 'l'
+    
+    ids_kwargs = dict(
+        model_path=args.model,
+        features_path=args.features,
+        encoder_path=args.encoder,
+        geoip_db_path=args.geoip_db,
+        backend_url=args.backend_url,
+        enable_backend=not args.no_backend,
+        json_output=args.json,
+        csv_output=args.csv,
+        features_output=args.features_output,
+        save_interval=args.save_interval,
+        flow_timeout=args.timeout,
+        confidence_threshold=args.confidence,
+        batch_size=args.batch_size,
+        backend_batch_size=args.backend_batch_size,
+        backend_queue_size=args.backend_queue_size,
+        backend_spool=args.backend_spool,
+        geoip_mode=args.geoip_mode,
+        geoip_cache_size=args.geoip_cache_size,
+        json_format=args.json_format,
+        json_rotate_bytes=int(args.json_rotate_size * 1024 * 1024),
+        json_rotate_seconds=args.json_rotate_interval,
+        json_compress=None if args.json_compress == 'none' else args.json_compress,
+        json_fsync=args.json_fsync,
+        table_format=args.table_format,
+        table_row_group=args.table_row_group,
+        table_flush_interval=args.table_flush_interval,
+        inference=args.inference,
+        early_packets=args.early_packets,
+        early_interval=args.early_interval,
+        early_max_backoff=args.early_max_backoff,
+        prediction_cache_size=args.prediction_cache,
+        prediction_cache_bits=args.prediction_cache_bits,
+        alert_window=args.alert_window,
+        sample_rate=args.sample,
+        auto_sample=args.auto_sample,
+        sample_max_rate=args.max_sample,
+        sample_max_flows=args.max_flows,
+        sample_max_lag=args.max_lag,
+        metrics_port=args.metrics_port,
+        metrics_host=args.metrics_host,
+        ingest_queue_size=args.ingest_queue
+    )
+    
+    if args.workers > 1:
+        from ids_core.sharding import ShardedIDS
+        try:
+            sharded = ShardedIDS(ids_kwargs, args.workers,
+                                 clock='packet' if pcap_files else 'wall')
+        except Exception as e:
+            print(f"\n[!] Failed to initialize IDS: {e}\n")
+            sys.exit(1)
+        
+        sharded.enable_hot_reload(args.reload_interval)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, lambda sig, frame: sharded.reload_model())
+        
+        if pcap_files:
+            sharded.replay_pcaps(pcap_files, args.count, trust)
+            sharded.ids.close()
+            sharded.ids.print_stats()
+            sys.exit(0)
+        
+        if args.duration:
+            def timeout():
+                time.sleep(args.duration)
+                print(f"\n[*] Duration limit reached - stopping...")
+                sharded.stop()
+            threading.Thread(target=timeout, daemon=True).start()
+        
+        print(f"[+] IDS Ready - Starting capture...\n")
+        sharded.start_capture(args.interface, args.count, args.filter,
+                              args.capture, args.ring_size << 20, args.fanout)
+        sys.exit(0)
+    
+    from ids_core.detector import RealtimeIDS
+    from ids_core.backend import close_log_forwarders
+    
     try:
-        ids = RealtimeIDS(
-            model_path=args.model,
-            features_path=args.features,
-            encoder_path=args.encoder,
-            geoip_db_path=args.geoip_db,
-            backend_url=args.backend_url,
-            enable_backend=not args.no_backend,
-            json_output=args.json,
-            csv_output=args.csv,
-            features_output=args.features_output,
-            save_interval=args.save_interval,
-            flow_timeout=args.timeout,
-            confidence_threshold=args.confidence
-        )
+        ids = RealtimeIDS(**ids_kwargs)
     except Exception as e:
         print(f"\n[!] Failed to initialize IDS: {e}\n")
         sys.exit(1)
     
+    ids.enable_hot_reload(args.reload_interval)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda sig, frame: ids.reload_model())
+    
+    if pcap_files:
+        ids.replay_pcaps(pcap_files, args.count, trust)
+        ids.close()
+        ids.print_stats()
+        sys.exit(0)
+    
     if args.duration:
         def timeout():
             time.sleep(args.duration)
             print(f"\n[*] Duration limit reached - stopping...")
-            ids.process_flows()
+            ids.stop_pipeline()
+            ids.close()
             ids.print_stats()
+            close_log_forwarders()
             os._exit(0) # Force exit
         threading.Thread(target=timeout, daemon=True).start()
     
     print(f"[+] IDS Ready - Starting capture...\n")
-    ids.start_capture(args.interface, args.count, args.filter)
\ No newline at end of file
+    ids.start_capture(args.interface, args.count, args.filter, args.decoder,
+                      args.capture, args.ring_size << 20, args.fanout)
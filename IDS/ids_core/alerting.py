@@ -52,17 +52,17 @@ def get_recommended_action(result):
 
 def create_enhanced_alert(flow, result, features, geo_data):
     """Create streamlined alert object for backend (no bloat)"""
-    duration = flow['last_time'] - flow['start_time']
-    total_packets = flow['fwd_packets'] + flow['bwd_packets']
-    total_bytes = flow['fwd_bytes'] + flow['bwd_bytes']
+    duration = flow.last_time - flow.start_time
+    total_packets = flow.total_packets
+    total_bytes = flow.total_bytes
     
     severity = calculate_severity(result)
     action = get_recommended_action(result)
     
     return {
         # Identifiers
-        'flow_id': flow['flow_id'],
-        'timestamp': datetime.fromtimestamp(flow['start_time']).isoformat(),
+        'flow_id': flow.flow_id,
+        'timestamp': datetime.fromtimestamp(flow.start_time).isoformat(),
         
         # Classification
         'prediction': result['prediction'],
@@ -80,8 +80,8 @@ def create_enhanced_alert(flow, result, features, geo_data):
         )[:5]),
         
         # Source Information
-        'src_ip': flow['src_ip'],
-        'src_port': flow['src_port'],
+        'src_ip': flow.src_ip,
+        'src_port': flow.src_port,
         'src_country': geo_data['country_code'],
         'src_country_name': geo_data['country_name'],
         'src_city': geo_data['city'],
@@ -89,25 +89,25 @@ def create_enhanced_alert(flow, result, features, geo_data):
         'src_longitude': geo_data['longitude'],
         
         # Destination Information
-        'dst_ip': flow['dst_ip'],
-        'dst_port': flow['dst_port'],
+        'dst_ip': flow.dst_ip,
+        'dst_port': flow.dst_port,
         
         # Protocol
-        'protocol': protocol_name(flow['protocol']),
-        'protocol_number': flow['protocol'],
+        'protocol': protocol_name(flow.protocol),
+        'protocol_number': flow.protocol,
         
         # Flow Statistics
         'duration': round(duration, 3),
         'total_packets': total_packets,
         'total_bytes': total_bytes,
-        'fwd_packets': flow['fwd_packets'],
-        'bwd_packets': flow['bwd_packets'],
-        'fwd_bytes': flow['fwd_bytes'],
-        'bwd_bytes': flow['bwd_bytes'],
+        'fwd_packets': flow.fwd_packets,
+        'bwd_packets': flow.bwd_packets,
+        'fwd_bytes': flow.fwd_bytes,
+        'bwd_bytes': flow.bwd_bytes,
         
         # Timing
-        'flow_start_time': datetime.fromtimestamp(flow['start_time']).isoformat(),
-        'flow_end_time': datetime.fromtimestamp(flow['last_time']).isoformat(),
+        'flow_start_time': datetime.fromtimestamp(flow.start_time).isoformat(),
+        'flow_end_time': datetime.fromtimestamp(flow.last_time).isoformat(),
         
         # Key Performance Indicators (only important ones)
         'flow_bytes_per_sec': round(features.get('Flow Bytes/s', 0), 2),
@@ -116,11 +116,11 @@ def create_enhanced_alert(flow, result, features, geo_data):
         
         # TCP Flags (condensed)
         'tcp_flags': {
-            'syn': flow['syn_count'],
-            'fin': flow['fin_count'],
-            'rst': flow['rst_count'],
-            'psh': flow['psh_count'],
-            'ack': flow['ack_count']
+            'syn': flow.syn_count,
+            'fin': flow.fin_count,
+            'rst': flow.rst_count,
+            'psh': flow.psh_count,
+            'ack': flow.ack_count
         },
         
         # Metadata
@@ -130,38 +130,146 @@ def create_enhanced_alert(flow, result, features, geo_data):
 
 def create_csv_record(flow, result, features, geo_data):
     """Create CSV record with enhanced columns (no ISP)"""
-    duration = flow['last_time'] - flow['start_time']
-    total_packets = flow['fwd_packets'] + flow['bwd_packets']
-    total_bytes = flow['fwd_bytes'] + flow['bwd_bytes']
+    duration = flow.last_time - flow.start_time
+    total_packets = flow.total_packets
+    total_bytes = flow.total_bytes
     
     return {
-        'Timestamp': datetime.fromtimestamp(flow['start_time']).strftime('%Y-%m-%d %H:%M:%S'),
-        'Flow_ID': flow['flow_id'],
+        'Timestamp': datetime.fromtimestamp(flow.start_time).strftime('%Y-%m-%d %H:%M:%S'),
+        'Flow_ID': flow.flow_id,
         'Prediction': result['prediction'],
         'Confidence': f"{result['confidence']:.4f}",
         'Is_Malicious': result['is_malicious'],
         'Severity_Score': calculate_severity(result),
         'Recommended_Action': get_recommended_action(result),
-        'Src_IP': flow['src_ip'],
-        'Src_Port': flow['src_port'],
+        'Src_IP': flow.src_ip,
+        'Src_Port': flow.src_port,
         'Src_Country': geo_data['country_code'],
         'Src_Country_Name': geo_data['country_name'],
         'Src_City': geo_data['city'],
         'Src_Latitude': geo_data['latitude'],
         'Src_Longitude': geo_data['longitude'],
-        'Dst_IP': flow['dst_ip'],
-        'Dst_Port': flow['dst_port'],
-        'Protocol': protocol_name(flow['protocol']),
-        'Protocol_Number': flow['protocol'],
+        'Dst_IP': flow.dst_ip,
+        'Dst_Port': flow.dst_port,
+        'Protocol': protocol_name(flow.protocol),
+        'Protocol_Number': flow.protocol,
         'Duration': duration,
         'Total_Packets': total_packets,
         'Total_Bytes': total_bytes,
-        'Fwd_Packets': flow['fwd_packets'],
-        'Bwd_Packets': flow['bwd_packets'],
+        'Fwd_Packets': flow.fwd_packets,
+        'Bwd_Packets': flow.bwd_packets,
         'Flow_Bytes_Per_Sec': features.get('Flow Bytes/s', 0),
         'Flow_Packets_Per_Sec': features.get('Flow Packets/s', 0)
     }
 
+class AlertGroup:
+    """Malicious flows from one source to one service with one attack type"""
+    __slots__ = ('flow', 'result', 'features', 'opened', 'flows', 'packets', 'bytes',
+                 'fwd_packets', 'bwd_packets', 'fwd_bytes', 'bwd_bytes',
+                 'first_seen', 'last_seen', 'max_confidence')
+
+    def __init__(self, flow, result, features, opened):
+        # The first flow is alerted on immediately and represents the group;
+        # the counters only cover the flows collapsed after it
+        self.flow = flow
+        self.result = result
+        self.features = features
+        self.opened = opened
+        self.flows = 0
+        self.packets = self.bytes = 0
+        self.fwd_packets = self.bwd_packets = 0
+        self.fwd_bytes = self.bwd_bytes = 0
+        self.first_seen = float('inf')
+        self.last_seen = float('-inf')
+        self.max_confidence = 0.0
+
+    def add(self, flow, result):
+        self.flows += 1
+        self.packets += flow.total_packets
+        self.bytes += flow.total_bytes
+        self.fwd_packets += flow.fwd_packets
+        self.bwd_packets += flow.bwd_packets
+        self.fwd_bytes += flow.fwd_bytes
+        self.bwd_bytes += flow.bwd_bytes
+        self.first_seen = min(self.first_seen, flow.start_time)
+        self.last_seen = max(self.last_seen, flow.last_time)
+        self.max_confidence = max(self.max_confidence, result['confidence'])
+
+class AlertAggregator:
+    """Collapse repeated alerts per (src_ip, dst_ip, dst_port, attack_type).
+
+    The first malicious flow of a key is alerted on as usual and opens a
+    window of `window` seconds. Further flows with the same key only update
+    the group's counters; when the window closes, a single summary alert
+    covers those collapsed flows (if any joined). The first flow is not
+    counted again in the summary.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.groups = {}
+        self.collapsed = 0  # flows folded into a summary instead of alerted
+
+    def add(self, flow, result, features, now):
+        """Returns True if this flow should be alerted on individually"""
+        key = (flow.src_ip, flow.dst_ip, flow.dst_port, result['prediction'])
+        group = self.groups.get(key)
+        if group is None:
+            self.groups[key] = AlertGroup(flow, result, features, now)
+            return True
+        group.add(flow, result)
+        self.collapsed += 1
+        return False
+
+    def pop_closed(self, now=None):
+        """Remove and return groups whose window has passed (all if now is None)
+        that collapsed at least one flow"""
+        closed = [key for key, group in self.groups.items()
+                  if now is None or now - group.opened >= self.window]
+        summaries = []
+        for key in closed:
+            group = self.groups.pop(key)
+            if group.flows:
+                summaries.append(group)
+        return summaries
+
+def create_summary_alert(group, geo_data):
+    """Alert covering the collapsed flows of an AlertGroup"""
+    result = dict(group.result, confidence=group.max_confidence)
+    alert = create_enhanced_alert(group.flow, result, group.features, geo_data)
+    first = datetime.fromtimestamp(group.first_seen).isoformat()
+    alert.update({
+        'flow_id': f"{alert['flow_id']}-x{group.flows}",
+        'timestamp': first,
+        'duration': round(group.last_seen - group.first_seen, 3),
+        'total_packets': group.packets,
+        'total_bytes': group.bytes,
+        'fwd_packets': group.fwd_packets,
+        'bwd_packets': group.bwd_packets,
+        'fwd_bytes': group.fwd_bytes,
+        'bwd_bytes': group.bwd_bytes,
+        'flow_start_time': first,
+        'flow_end_time': datetime.fromtimestamp(group.last_seen).isoformat(),
+        'aggregated': True,
+        'flow_count': group.flows,
+    })
+    return alert
+
+def create_summary_csv_record(group, geo_data):
+    """CSV record covering the collapsed flows of an AlertGroup"""
+    result = dict(group.result, confidence=group.max_confidence)
+    record = create_csv_record(group.flow, result, group.features, geo_data)
+    record.update({
+        'Timestamp': datetime.fromtimestamp(group.first_seen).strftime('%Y-%m-%d %H:%M:%S'),
+        'Flow_ID': f"{record['Flow_ID']}-x{group.flows}",
+        'Duration': group.last_seen - group.first_seen,
+        'Total_Packets': group.packets,
+        'Total_Bytes': group.bytes,
+        'Fwd_Packets': group.fwd_packets,
+        'Bwd_Packets': group.bwd_packets,
+    })
+    return record
+
 from .backend import send_log_to_backend
 
 def log_message(backend_url, message, level='info'):
@@ -170,9 +278,10 @@ def log_message(backend_url, message, level='info'):
     if backend_url:
         send_log_to_backend(backend_url, message, level)
 
-def print_alert(alert, backend_sent=False, backend_url=None):
+def print_alert(alert, backend_sent=False, backend_url=None, backend_status=None):
     """Print colored alert to console and send to backend logs"""
-    backend_status = "✓ Sent to backend" if backend_sent else "✗ Backend offline (saved to file)"
+    if backend_status is None:
+        backend_status = "✓ Sent to backend" if backend_sent else "✗ Backend offline (saved to file)"
     
     lines = [
         f"\n{'='*70}",
@@ -184,6 +293,11 @@ def print_alert(alert, backend_sent=False, backend_url=None):
         f"Source: {alert['src_ip']}:{alert['src_port']} ({alert['src_city']}, {alert['src_country']})",
         f"Destination: {alert['dst_ip']}:{alert['dst_port']}",
         f"Protocol: {alert['protocol']} | Packets: {alert['total_packets']:,} | Bytes: {alert['total_bytes']:,}",
+    ]
+    if alert.get('aggregated'):
+        lines.append(f"Summary: {alert['flow_count']:,} flows between "
+                     f"{alert['flow_start_time']} and {alert['flow_end_time']}")
+    lines += [
         f"Backend: {backend_status}",
         f"Top Probabilities:"
     ]
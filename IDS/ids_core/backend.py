@@ -2,8 +2,13 @@
 Backend communication logic.
 """
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import os
+import atexit
+import time
+import threading
+from collections import deque
 
 # Default API key for the IDS engine (should match backend .env)
 IDS_API_KEY = os.environ.get('IDS_API_KEY', 'ids_engine_secret_key_7788')
@@ -35,54 +40,413 @@ def check_backend_health(backend_url):
         print(err_msg)
         return False
 
-def send_to_backend(backend_url, flow_data):
-    """Send classified flow to Express backend via HTTP POST"""
-    try:
-        headers = {
+def send_log_to_backend(backend_url, message, level='info'):
+    """Queue a terminal log message for the backend (never blocks)"""
+    get_log_forwarder(backend_url).submit(message, level)
+
+_log_forwarders = {}
+_log_forwarders_lock = threading.Lock()
+
+def get_log_forwarder(backend_url):
+    """Shared LogForwarder for a backend URL (created on first use)"""
+    with _log_forwarders_lock:
+        forwarder = _log_forwarders.get(backend_url)
+        if forwarder is None:
+            forwarder = _log_forwarders[backend_url] = LogForwarder(backend_url)
+        return forwarder
+
+def close_log_forwarders(timeout=2):
+    """Flush and stop every log forwarder (also runs at interpreter exit)"""
+    with _log_forwarders_lock:
+        forwarders = list(_log_forwarders.values())
+        _log_forwarders.clear()
+    for forwarder in forwarders:
+        forwarder.close(timeout)
+
+atexit.register(close_log_forwarders)
+
+class LogForwarder:
+    """Background forwarding of terminal log lines to /api/logs.
+
+    submit() only appends to a bounded queue. A worker thread wakes every
+    flush_interval, coalesces consecutive messages of the same level into a
+    single newline-joined message and posts them over a pooled session.
+    Messages beyond max_rate per second, or that do not fit in the queue, are
+    dropped and counted; the next post carries a note with the count. Logs
+    are best effort, so a failed post is dropped rather than retried: 429,
+    5xx and connection errors also shed the following messages for a few
+    seconds, other 4xx only count the rejected messages as failed.
+    """
+
+    def __init__(self, backend_url, max_queue=1000, max_rate=200, max_batch=100,
+                 flush_interval=0.25, timeout=1):
+        self.backend_url = backend_url
+        self.max_queue = max_queue
+        self.max_rate = max_rate
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers.update({
             'Content-Type': 'application/json',
             'X-IDS-Key': IDS_API_KEY
-        }
-        
-        response = requests.post(
-            f"{backend_url}/api/flows",
-            json=flow_data,
-            timeout=2,
-            headers=headers
-        )
-        
-        if response.status_code in [200, 201]:
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closing = False
+        self._tokens = float(max_rate)
+        self._refill_at = time.monotonic()
+        self._retry_at = 0.0        # backend considered down until this time
+        self._unreported = 0        # drops not yet announced to the backend
+
+        self.counters = {'submitted': 0, 'sent': 0, 'dropped': 0, 'failed': 0,
+                         'posts': 0, 'failed_posts': 0}
+
+        self._thread = threading.Thread(target=self._run, name='log-forwarder', daemon=True)
+        self._thread.start()
+
+    def submit(self, message, level='info'):
+        """Queue a message; returns False if it was dropped"""
+        with self._cond:
+            self.counters['submitted'] += 1
+            now = time.monotonic()
+            self._tokens = min(self.max_rate, self._tokens + (now - self._refill_at) * self.max_rate)
+            self._refill_at = now
+            if self._closing or self._tokens < 1 or len(self._queue) >= self.max_queue:
+                self.counters['dropped'] += 1
+                self._unreported += 1
+                return False
+            self._tokens -= 1
+            self._queue.append((level, message))
             return True
-        else:
-            print(f"[!] Backend returned status {response.status_code}")
-            return False
-            
-    except requests.exceptions.ConnectionError:
-        return False
-    except requests.exceptions.Timeout:
-        return False
-    except Exception as e:
-        print(f"[!] Backend error: {e}")
-        return False
 
-def send_log_to_backend(backend_url, message, level='info'):
-    """Send terminal log message to backend via HTTP POST"""
-    try:
-        headers = {
+    def metrics(self):
+        with self._cond:
+            snapshot = dict(self.counters)
+            snapshot['queue_depth'] = len(self._queue)
+        return snapshot
+
+    def close(self, timeout=2):
+        """Send what is queued (bounded by timeout) and stop the worker thread"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self.session.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closing:
+                    self._cond.wait(self.flush_interval)
+                batch = [self._queue.popleft()
+                         for _ in range(min(self.max_batch, len(self._queue)))]
+                dropped, self._unreported = self._unreported, 0
+                if not batch and self._closing:
+                    return
+
+            if dropped:
+                batch.append(('warning', f"[!] Log forwarder dropped {dropped} message(s)"))
+            if not batch:
+                continue
+            if time.time() < self._retry_at and not self._closing:
+                # Backend is down: shed instead of waiting on timeouts
+                with self._cond:
+                    self.counters['dropped'] += len(batch)
+                continue
+
+            runs = self._coalesce(batch)
+            for i, (level, messages) in enumerate(runs):
+                outcome = self._post("\n".join(messages), level)
+                if outcome is None:
+                    # Backend down or throttling: back off and shed
+                    self._retry_at = time.time() + 5
+                    with self._cond:
+                        self.counters['dropped'] += sum(len(m) for _, m in runs[i:])
+                    break
+                self.counters[outcome] += len(messages)
+
+    @staticmethod
+    def _coalesce(batch):
+        """Group consecutive same-level messages: [(level, [message, ...])]"""
+        runs = []
+        for level, message in batch:
+            if runs and runs[-1][0] == level:
+                runs[-1][1].append(message)
+            else:
+                runs.append((level, [message]))
+        return runs
+
+    def _post(self, message, level):
+        """One POST: 'sent', 'failed' (rejected) or None (backend down)"""
+        try:
+            response = self.session.post(
+                f"{self.backend_url}/api/logs",
+                json={'message': message, 'level': level},
+                timeout=self.timeout
+            )
+        except requests.exceptions.RequestException:
+            self.counters['failed_posts'] += 1
+            return None
+        self.counters['posts'] += 1
+        if 200 <= response.status_code < 300:
+            return 'sent'
+        self.counters['failed_posts'] += 1
+        if response.status_code == 429 or response.status_code >= 500:
+            return None
+        return 'failed'
+
+class AlertShipper:
+    """Asynchronous, batched alert delivery to the backend.
+
+    submit() never blocks on the network: alerts go on a bounded in-memory
+    queue that a background thread drains over a pooled keep-alive session,
+    POSTing batches to /api/flows/bulk with retries and exponential backoff.
+    Batches that still fail, and alerts that do not fit in the queue, are
+    spilled to a local JSON Lines file and re-sent once the backend answers
+    again. Only 400/422 (the batch itself is invalid) drop a batch; spool
+    lines that no longer decode are set aside in <spool>.bad.
+
+    Each alert is counted once per outcome: 'sent' when delivered (of which
+    'resent' came back from the spool), 'spilled' when first written to the
+    spool, 'failed' when rejected for good.
+    """
+
+    def __init__(self, backend_url, spool_path, max_queue=10000, batch_size=200,
+                 flush_interval=0.5, max_retries=3, backoff=0.5, max_backoff=30.0,
+                 timeout=5, post_histogram=None):
+        self.backend_url = backend_url
+        self.spool_path = spool_path
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.post_histogram = post_histogram  # metrics.Histogram of POST latency (seconds)
+
+        self.session = requests.Session()
+        self.session.headers.update({
             'Content-Type': 'application/json',
             'X-IDS-Key': IDS_API_KEY
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._spool_lock = threading.Lock()
+        self._closing = False
+        self._retry_at = 0.0        # backend considered down until this time
+        self._down_backoff = backoff
+        self._inflight = None       # batch the worker is posting (see close())
+
+        self.counters = {
+            'submitted': 0, 'sent': 0, 'resent': 0, 'failed': 0, 'spilled': 0, 'corrupt': 0,
+            'batches': 0, 'last_batch_size': 0, 'last_latency_ms': 0.0,
+            'total_latency_ms': 0.0
         }
-        
-        payload = {
-            'message': message,
-            'level': level
-        }
-        
-        requests.post(
-            f"{backend_url}/api/logs",
-            json=payload,
-            timeout=1, # Very short timeout for logs to avoid blocking
-            headers=headers
-        )
-    except:
-        # Fail silently for logs to not interrupt capture
-        pass
+
+        self._thread = threading.Thread(target=self._run, name='alert-shipper', daemon=True)
+        self._thread.start()
+
+    def submit(self, alert):
+        """Queue an alert for delivery; returns False if it had to be spilled"""
+        with self._cond:
+            self.counters['submitted'] += 1
+            if len(self._queue) < self.max_queue:
+                self._queue.append(alert)
+                if len(self._queue) >= self.batch_size:
+                    self._cond.notify()
+                return True
+        self._spill([alert])
+        return False
+
+    def metrics(self):
+        """Snapshot of the delivery counters plus current queue depth"""
+        with self._cond:
+            snapshot = dict(self.counters)
+            snapshot['queue_depth'] = len(self._queue)
+        batches = snapshot['batches']
+        snapshot['avg_latency_ms'] = snapshot['total_latency_ms'] / batches if batches else 0.0
+        snapshot['spool_pending'] = os.path.exists(self.spool_path)
+        return snapshot
+
+    def close(self, timeout=None):
+        """Deliver (or spill) what is queued and stop the worker thread.
+
+        The wait defaults to one batch's worth of POST attempts; if the
+        worker is still stuck on a POST after that, its batch is spilled here
+        (it may then reach the backend twice, which dedups on flow_id).
+        """
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if timeout is None:
+            timeout = self.max_retries * self.timeout + self.flush_interval
+        self._thread.join(timeout)
+        stuck = self._thread.is_alive()
+        with self._cond:
+            leftover = list(self._queue)
+            self._queue.clear()
+            if stuck and self._inflight is not None:
+                leftover = self._inflight + leftover
+                self._inflight = None
+        if leftover:
+            self._spill(leftover)
+        if not stuck:
+            self.session.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._queue) < self.batch_size and not self._closing:
+                    self._cond.wait(self.flush_interval)
+                if not self._queue and self._closing:
+                    return
+                batch = [self._queue.popleft()
+                         for _ in range(min(self.batch_size, len(self._queue)))]
+                self._inflight = batch or None
+
+            try:
+                self._deliver(batch)
+            except Exception as e:
+                # Keep the thread alive; the spool is retried on the next pass
+                print(f"[!] Alert shipper error: {e}")
+                with self._cond:
+                    orphan, self._inflight = self._inflight, None
+                if orphan:
+                    self._spill(orphan)
+
+    def _deliver(self, batch):
+        if batch:
+            # Backend is down: do not stall the queue (or shutdown) on it
+            outcome = time.time() >= self._retry_at and self._post_with_retry(batch)
+            with self._cond:
+                owned = self._inflight is batch
+                self._inflight = None
+            if outcome:
+                if outcome == 'sent':
+                    self.counters['sent'] += len(batch)
+                if not self._closing:
+                    # The spool stays on disk for the next run at shutdown
+                    self._drain_spool()
+            elif owned:
+                self._spill(batch)
+        elif time.time() >= self._retry_at:
+            self._drain_spool()
+
+    def _post_with_retry(self, batch):
+        """POST a batch with retries; returns _post()'s outcome, or None if
+        every attempt failed"""
+        delay = self.backoff
+        for attempt in range(self.max_retries):
+            outcome = self._post(batch)
+            if outcome:
+                self._retry_at = 0.0
+                self._down_backoff = self.backoff
+                return outcome
+            if attempt + 1 < self.max_retries and not self._closing:
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+        self._retry_at = time.time() + self._down_backoff
+        self._down_backoff = min(self._down_backoff * 2, self.max_backoff)
+        return None
+
+    def _post(self, batch):
+        """One POST: 'sent', 'rejected' (dropped for good) or None (retry)"""
+        start = time.time()
+        try:
+            response = self.session.post(
+                f"{self.backend_url}/api/flows/bulk",
+                json={'flows': batch},
+                timeout=self.timeout
+            )
+        except requests.exceptions.RequestException:
+            return None
+        if self.post_histogram is not None:
+            self.post_histogram.observe(time.time() - start)
+
+        if response.status_code in (400, 422):
+            # A malformed batch will not succeed on retry
+            print(f"[!] Backend rejected alert batch with status {response.status_code}")
+            self.counters['failed'] += len(batch)
+            return 'rejected'
+        if response.status_code not in [200, 201]:
+            # Server errors, auth (401/403), 413 and 429: retry, then spill
+            return None
+
+        latency = (time.time() - start) * 1000
+        self.counters['batches'] += 1
+        self.counters['last_batch_size'] = len(batch)
+        self.counters['last_latency_ms'] = latency
+        self.counters['total_latency_ms'] += latency
+        return 'sent'
+
+    def _spill(self, alerts, respill=False):
+        """Append alerts to the spool; respill marks alerts read back from it,
+        which were already counted as spilled"""
+        try:
+            with self._spool_lock, open(self.spool_path, 'a') as f:
+                for alert in alerts:
+                    f.write(json.dumps(alert) + '\n')
+            if not respill:
+                self.counters['spilled'] += len(alerts)
+        except Exception as e:
+            print(f"[!] Error spilling alerts to {self.spool_path}: {e}")
+
+    def _drain_spool(self):
+        """Re-send alerts spilled while the backend was unreachable"""
+        sending = self.spool_path + '.sending'
+        with self._spool_lock:
+            if not os.path.exists(sending):
+                if not os.path.exists(self.spool_path):
+                    return
+                os.replace(self.spool_path, sending)
+
+        with open(sending) as f:
+            batch = []
+            for line in f:
+                alert = self._decode_spooled(line)
+                if alert is not None:
+                    batch.append(alert)
+                if len(batch) >= self.batch_size:
+                    if not self._resend(batch):
+                        rest = (self._decode_spooled(l) for l in f)
+                        self._spill(batch + [a for a in rest if a is not None], respill=True)
+                        break
+                    batch = []
+            else:
+                if batch and not self._resend(batch):
+                    self._spill(batch, respill=True)
+        os.remove(sending)
+
+    def _resend(self, batch):
+        outcome = self._post_with_retry(batch)
+        if outcome == 'sent':
+            self.counters['sent'] += len(batch)
+            self.counters['resent'] += len(batch)
+        return outcome is not None
+
+    def _decode_spooled(self, line):
+        """Parse one spool line; lines that do not decode (e.g. cut short by a
+        crash during _spill) are counted and appended to <spool>.bad"""
+        if not line.strip():
+            return None
+        try:
+            return json.loads(line)
+        except ValueError:
+            self.counters['corrupt'] += 1
+            try:
+                with open(self.spool_path + '.bad', 'a') as f:
+                    f.write(line if line.endswith('\n') else line + '\n')
+            except OSError as e:
+                print(f"[!] Error writing {self.spool_path}.bad: {e}")
+            return None
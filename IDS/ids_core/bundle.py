@@ -0,0 +1,140 @@
+"""
+Memory-mappable model bundles.
+
+Unpickling the scikit-learn forest imports scikit-learn and rebuilds every
+tree object, which dominates IDS startup. A bundle is a directory holding
+the forest already compiled for ids_core.inference as plain .npy arrays,
+plus a meta.json with the selected feature names and the label of every
+model output:
+
+    model.bundle/
+        meta.json
+        feature.npy  threshold.npy  children.npy  is_leaf.npy
+        value.npy    roots.npy      classes_.npy
+
+Loading maps the arrays read-only (np.load mmap_mode='r'), so it costs a
+few milliseconds whatever the size of the forest, needs neither pickle nor
+scikit-learn, and shard workers share one copy in the page cache. Convert
+a pickled model once with
+
+    python -m ids_core.bundle -m model.pkl -f features.pkl -e encoder.pkl -o model.bundle
+
+and pass the bundle directory to ids.py -m (-f / -e are then not needed).
+
+A bundle has no scikit-learn model to fall back on, so every batch goes
+through CompiledForest. That is faster per flow up to a few hundred rows
+but about 0.9x scikit-learn at 1024 rows and 0.6x at 4096
+(benchmarks/bench_inference.py); CompiledForest caps each walk at
+COMPILED_MAX_ROWS rows, so large -b/--batch-size values add latency
+without lowering the per-flow cost. Use the pickles with --inference
+compiled where large batches are common.
+"""
+import os
+import json
+import time
+
+import numpy as np
+
+from .inference import CompiledForest
+
+BUNDLE_FORMAT = 'ids-model-bundle'
+BUNDLE_VERSION = 1
+META_FILE = 'meta.json'
+
+
+class LabelDecoder:
+    """Stands in for the fitted LabelEncoder: maps model outputs to labels"""
+
+    def __init__(self, labels):
+        self.classes_ = np.array(labels)
+
+    def inverse_transform(self, y):
+        return self.classes_[np.asarray(y)]
+
+
+def is_bundle(path):
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+def save_bundle(path, model, features, encoder):
+    """Compile model and write it, the feature list and the output labels
+    to the bundle directory path; returns the CompiledForest"""
+    forest = CompiledForest(model)
+    # The label of each model output, as the detector would decode it
+    labels = [str(label) for label in encoder.inverse_transform(forest.classes_)]
+    forest.classes_ = np.arange(len(labels), dtype=np.intp)
+
+    os.makedirs(path, exist_ok=True)
+    for name in CompiledForest.ARRAYS:
+        # Replaced, never rewritten in place: processes that still map the
+        # previous bundle keep reading the old files
+        target = os.path.join(path, name + '.npy')
+        with open(target + '.tmp', 'wb') as f:
+            np.save(f, np.ascontiguousarray(getattr(forest, name)), allow_pickle=False)
+        os.replace(target + '.tmp', target)
+
+    meta = {
+        'format': BUNDLE_FORMAT,
+        'version': BUNDLE_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'model_type': type(model).__name__,
+        'n_trees': forest.n_trees,
+        'node_count': forest.node_count,
+        'max_depth': forest.max_depth,
+        'n_features_in': int(forest.n_features_in_),
+        'features': [str(name) for name in features],
+        'labels': labels,
+    }
+    # meta.json is written last: a bundle without it is never loaded
+    tmp = os.path.join(path, META_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, os.path.join(path, META_FILE))
+    return forest
+
+
+def load_bundle(path, mmap_mode='r'):
+    """(CompiledForest, selected features, LabelDecoder) from a bundle
+    directory; mmap_mode=None reads the arrays into memory instead"""
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    if meta.get('format') != BUNDLE_FORMAT or meta.get('version') != BUNDLE_VERSION:
+        raise ValueError(f"Not a version {BUNDLE_VERSION} model bundle: {path}")
+
+    arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode,
+                            allow_pickle=False)
+              for name in CompiledForest.ARRAYS}
+    forest = CompiledForest.from_arrays(arrays, meta['n_features_in'], meta['max_depth'])
+    return forest, list(meta['features']), LabelDecoder(meta['labels'])
+
+
+if __name__ == '__main__':
+    import pickle
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Convert a pickled model, feature list and label encoder into a model bundle')
+    parser.add_argument('-m', '--model', required=True, help='Pickled model')
+    parser.add_argument('-f', '--features', required=True, help='Pickled selected features')
+    parser.add_argument('-e', '--encoder', required=True, help='Pickled label encoder')
+    parser.add_argument('-o', '--output', required=True, help='Bundle directory to write')
+    args = parser.parse_args()
+
+    loaded = []
+    for path in (args.model, args.features, args.encoder):
+        with open(path, 'rb') as f:
+            loaded.append(pickle.load(f))
+    model, features, encoder = loaded
+
+    start = time.perf_counter()
+    forest = save_bundle(args.output, model, features, encoder)
+    print(f"[+] {args.output}: {forest.n_trees} trees, {forest.node_count:,} nodes, "
+          f"{len(features)} features ({time.perf_counter() - start:.2f}s)")
+
+    start = time.perf_counter()
+    mapped, _, _ = load_bundle(args.output)
+    elapsed = time.perf_counter() - start
+    X = np.random.default_rng(0).normal(0, 1e3, size=(256, mapped.n_features_in_)).astype(np.float32)
+    if not np.allclose(mapped.predict_proba(X), model.predict_proba(X)):
+        raise SystemExit("[!] Bundle predictions differ from the pickled model")
+    print(f"[+] Bundle loads in {elapsed * 1000:.1f} ms and matches the pickled model")
@@ -37,3 +37,28 @@ ENHANCED_CSV_COLUMNS = [
     'Duration', 'Total_Packets', 'Total_Bytes', 'Fwd_Packets', 'Bwd_Packets',
     'Flow_Bytes_Per_Sec', 'Flow_Packets_Per_Sec'
 ]
+
+# Column types for the columnar (Parquet / Arrow) outputs.
+# Every ML feature is stored as float64.
+ENHANCED_CSV_TYPES = {
+    'Timestamp': 'string', 'Flow_ID': 'string', 'Prediction': 'string',
+    'Confidence': 'float64', 'Is_Malicious': 'bool',
+    'Severity_Score': 'float64', 'Recommended_Action': 'string',
+    'Src_IP': 'string', 'Src_Port': 'int32', 'Src_Country': 'string',
+    'Src_Country_Name': 'string', 'Src_City': 'string',
+    'Src_Latitude': 'float64', 'Src_Longitude': 'float64',
+    'Dst_IP': 'string', 'Dst_Port': 'int32', 'Protocol': 'string', 'Protocol_Number': 'int16',
+    'Duration': 'float64', 'Total_Packets': 'int64', 'Total_Bytes': 'int64',
+    'Fwd_Packets': 'int64', 'Bwd_Packets': 'int64',
+    'Flow_Bytes_Per_Sec': 'float64', 'Flow_Packets_Per_Sec': 'float64'
+}
+
+# TCP header flag bits (byte 13 of the TCP header)
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+TCP_URG = 0x20
+TCP_ECE = 0x40
+TCP_CWR = 0x80
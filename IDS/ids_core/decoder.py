@@ -0,0 +1,137 @@
+"""
+Raw-bytes packet decoder.
+
+Reads the IPv4/IPv6, TCP, UDP and ICMP header fields the flow tracker needs
+straight from the frame bytes with precompiled structs. Works on bytes or
+memoryview frames and never allocates scapy objects.
+"""
+import socket
+import struct
+
+# Link-layer header types (https://www.tcpdump.org/linktypes.html)
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+# scapy link-layer class name -> linktype, for frames read from scapy sockets
+_LINKTYPE_BY_LAYER = {
+    'Ether': LINKTYPE_ETHERNET,
+    'CookedLinux': LINKTYPE_LINUX_SLL,
+    'CookedLinuxV2': LINKTYPE_LINUX_SLL2,
+    'Loopback': LINKTYPE_NULL,
+    'IP': LINKTYPE_RAW,
+    'IPv6': LINKTYPE_RAW,
+    'IPv46': LINKTYPE_RAW,
+}
+
+_ETHERTYPE_IPV4 = 0x0800
+_ETHERTYPE_IPV6 = 0x86DD
+_ETHERTYPE_VLAN = (0x8100, 0x88A8, 0x9100)
+
+# IPv6 extension headers that may precede the transport header
+_IPV6_EXT_HEADERS = (0, 43, 60)
+_IPV6_FRAGMENT = 44
+_IPV6_AH = 51
+
+_ETH = struct.Struct('!H')
+_IPV4 = struct.Struct('!BxH2xHxB2x4s4s')
+_IPV6 = struct.Struct('!4xHBx16s16s')
+_PORTS = struct.Struct('!HH')
+_TCP = struct.Struct('!HH8xBB')
+
+_inet_ntoa = socket.inet_ntoa
+_inet_ntop = socket.inet_ntop
+_AF_INET6 = socket.AF_INET6
+
+
+def linktype_for_layer(layer):
+    """Map a scapy link-layer class (as returned by recv_raw) to a linktype"""
+    return _LINKTYPE_BY_LAYER.get(getattr(layer, '__name__', None), LINKTYPE_ETHERNET)
+
+
+def decode_frame(frame, linktype=LINKTYPE_ETHERNET):
+    """Decode one captured frame.
+
+    Returns (src_ip, dst_ip, proto, src_port, dst_port, hdr_len, pkt_len,
+    tcp_flags, payload_len) or None for frames that are not IPv4/IPv6 or are
+    truncated. hdr_len covers the IP and transport headers, pkt_len is the
+    whole frame and payload_len the transport payload according to the IP
+    length field (link-layer padding and snaplen truncation do not count).
+    """
+    try:
+        if linktype == LINKTYPE_ETHERNET:
+            ethertype = _ETH.unpack_from(frame, 12)[0]
+            offset = 14
+            while ethertype in _ETHERTYPE_VLAN:
+                ethertype = _ETH.unpack_from(frame, offset + 2)[0]
+                offset += 4
+        elif linktype == LINKTYPE_LINUX_SLL:
+            ethertype = _ETH.unpack_from(frame, 14)[0]
+            offset = 16
+        elif linktype == LINKTYPE_LINUX_SLL2:
+            ethertype = _ETH.unpack_from(frame, 0)[0]
+            offset = 20
+        elif linktype == LINKTYPE_NULL:
+            ethertype = None
+            offset = 4
+        elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+            ethertype = None
+            offset = 0
+        else:
+            return None
+
+        if ethertype is not None and ethertype not in (_ETHERTYPE_IPV4, _ETHERTYPE_IPV6):
+            return None
+        version = frame[offset] >> 4
+
+        if version == 4:
+            ver_ihl, ip_len, frag, proto, src, dst = _IPV4.unpack_from(frame, offset)
+            hdr_len = (ver_ihl & 0x0F) * 4
+            src_ip = _inet_ntoa(src)
+            dst_ip = _inet_ntoa(dst)
+            # Only the first fragment carries the transport header
+            if frag & 0x1FFF:
+                return (src_ip, dst_ip, proto, 0, 0, hdr_len, len(frame), 0,
+                        max(ip_len - hdr_len, 0))
+        elif version == 6:
+            plen, proto, src, dst = _IPV6.unpack_from(frame, offset)
+            hdr_len = 40
+            ip_len = plen + 40
+            src_ip = _inet_ntop(_AF_INET6, src)
+            dst_ip = _inet_ntop(_AF_INET6, dst)
+            while True:
+                ext = offset + hdr_len
+                if proto in _IPV6_EXT_HEADERS:
+                    proto, ext_len = frame[ext], (frame[ext + 1] + 1) * 8
+                elif proto == _IPV6_FRAGMENT:
+                    proto, ext_len = frame[ext], 8
+                    if _ETH.unpack_from(frame, ext + 2)[0] & 0xFFF8:
+                        hdr_len += ext_len
+                        return (src_ip, dst_ip, proto, 0, 0, hdr_len, len(frame), 0,
+                                max(ip_len - hdr_len, 0))
+                elif proto == _IPV6_AH:
+                    proto, ext_len = frame[ext], (frame[ext + 1] + 2) * 4
+                else:
+                    break
+                hdr_len += ext_len
+        else:
+            return None
+
+        l4 = offset + hdr_len
+        if proto == 6:
+            src_port, dst_port, data_offset, tcp_flags = _TCP.unpack_from(frame, l4)
+            hdr_len += (data_offset >> 4) * 4
+            return (src_ip, dst_ip, proto, src_port, dst_port,
+                    hdr_len, len(frame), tcp_flags, max(ip_len - hdr_len, 0))
+        if proto == 17:
+            src_port, dst_port = _PORTS.unpack_from(frame, l4)
+            return (src_ip, dst_ip, proto, src_port, dst_port,
+                    hdr_len + 8, len(frame), 0, max(ip_len - hdr_len - 8, 0))
+        return src_ip, dst_ip, proto, 0, 0, hdr_len, len(frame), 0, max(ip_len - hdr_len, 0)
+
+    except (IndexError, struct.error):
+        return None
@@ -1,7 +1,6 @@
 """
 Main IDS Detector Module.
 """
-import pickle
 import json
 import time
 import signal
@@ -10,20 +9,39 @@ from datetime import datetime
 import threading
 import os
 import warnings
-import pandas as pd
+import contextlib
 import numpy as np
-import geoip2.database
-from scapy.all import sniff, IP, TCP, UDP, ICMP
 
-from .config import FEATURE_COLUMNS_ORDERED, ENHANCED_CSV_COLUMNS
-from .utils import safe_divide, get_flow_key
-from .geo import get_geolocation
+from .config import FEATURE_COLUMNS_ORDERED, ENHANCED_CSV_COLUMNS, ENHANCED_CSV_TYPES, TCP_FIN, TCP_RST
+from .utils import safe_divide, flow_key, LRUCache
+from .geo import get_geolocation, open_geo_reader, GeoCache
 from .features import extract_features
-from .alerting import create_enhanced_alert, create_csv_record, print_alert, save_to_json, log_message
-from .backend import check_backend_health, send_to_backend
+from .flow import FlowRecord
+from .flowtable import FlowTable
+from .alerting import (create_enhanced_alert, create_csv_record, print_alert, save_to_json,
+                       log_message, AlertAggregator, create_summary_alert,
+                       create_summary_csv_record)
+from .backend import check_backend_health, AlertShipper, get_log_forwarder
+from .pcap import iter_pcap
+from .bundle import is_bundle
+from .model import load_model, ModelReloader
+from .startup import StartupTimer
+from .sampling import FlowSampler
+from .sinks import JsonlSink, ColumnarSink, columnar_fields
+from .decoder import decode_frame, linktype_for_layer
+from .ring import PacketRing, RING_SIZE
+from .metrics import Registry, MetricsServer, TimedLock
+from .pipeline import IngestPipeline, INGEST_QUEUE_SIZE
 
 warnings.filterwarnings('ignore')
 
+# Seconds between early-scoring passes over the flows that are due
+EARLY_SCORE_TICK = 0.25
+# Packets between sampling-controller checks
+LOAD_CHECK_PACKETS = 1024
+# With metrics enabled, one packet in this many is timed end to end
+PACKET_TIMING_EVERY = 64
+
 class RealtimeIDS:
     def __init__(self, model_path, features_path, encoder_path, 
                  geoip_db_path='GeoLite2-City.mmdb',
@@ -32,28 +50,116 @@ class RealtimeIDS:
                  json_output='malicious_flows.json', 
                  csv_output='all_flows.csv',
                  features_output='ml_features.csv',
-                 save_interval=10, flow_timeout=120, confidence_threshold=0.7):
+                 save_interval=10, flow_timeout=120, confidence_threshold=0.7,
+                 batch_size=1024, result_sink=None,
+                 backend_batch_size=200, backend_queue_size=10000, backend_spool=None,
+                 geoip_mode='auto', geoip_cache_size=65536,
+                 json_format='array', json_rotate_bytes=0, json_rotate_seconds=0,
+                 json_compress=None, json_fsync='rotate',
+                 table_format='csv', table_row_group=50000, table_flush_interval=60,
+                 inference='sklearn', early_packets=0, early_interval=0, early_max_backoff=16,
+                 prediction_cache_size=0, prediction_cache_bits=8, alert_window=0,
+                 sample_rate=1, auto_sample=False, sample_max_rate=64,
+                 sample_max_flows=200000, sample_max_lag=1.0,
+                 metrics_port=None, metrics_host='127.0.0.1',
+                 ingest_queue_size=INGEST_QUEUE_SIZE, classify=True):
         
-        self.flows = {}
+        # Startup phases are logged with their durations; time to first
+        # packet is measured from the same process start
+        self.startup = StartupTimer()
+        self.startup.mark('imports')
+        self.first_packet_seconds = None
+        self.flows = FlowTable(flow_timeout)
+        # Sharded mode: a worker hands each sweep's results to result_sink
+        # instead of writing outputs itself
+        self.result_sink = result_sink
+        self.shard_flows = 0  # active flows held by shard workers (coordinator only)
+        self.capture_ring = None  # PacketRing of a running ring capture
+        # Live capture hands decoded packets to flow and scoring threads
+        # through an IngestPipeline of ingest_queue_size packets
+        self.ingest_queue_size = ingest_queue_size
+        self.pipeline = None
+        self.packets_ingested = 0  # packets taken off the pipeline by the flow thread
         self.backend_url = backend_url
         self.enable_backend = enable_backend
         self.json_output = json_output
+        # 'array' rewrites one JSON array, 'jsonl' appends through a JsonlSink
+        self.json_format = json_format
+        self.json_sink_options = dict(rotate_bytes=json_rotate_bytes,
+                                      rotate_seconds=json_rotate_seconds,
+                                      compress=json_compress, fsync=json_fsync)
+        self.json_sink = None
+        # 'csv' appends text rows; 'parquet' / 'arrow' write typed row groups
+        # from a background thread through ColumnarSinks
+        self.table_format = table_format
+        self.table_options = dict(fmt=table_format, row_group_size=table_row_group,
+                                  flush_interval=table_flush_interval)
+        self.csv_sink = None
+        self.features_sink = None
         self.csv_output = csv_output
         self.features_output = features_output
+        if table_format != 'csv':
+            # Columnar outputs are directories of part files
+            self.csv_output = os.path.splitext(csv_output)[0]
+            self.features_output = os.path.splitext(features_output)[0]
         self.save_interval = save_interval
         self.flow_timeout = flow_timeout
         self.confidence_threshold = confidence_threshold
+        self.batch_size = max(1, int(batch_size))
+        # Early scoring: re-classify open flows every early_packets packets or
+        # early_interval seconds; flows scored malicious back off up to
+        # early_max_backoff times those periods
+        self.early_packets = early_packets
+        self.early_interval = early_interval
+        self.early_max_backoff = max(1, early_max_backoff)
+        self.early_scoring = bool(early_packets or early_interval)
+        self._score_queue = {}  # insertion-ordered set of flow keys
+        # Flow-consistent sampling of new flows (1/sample_rate), optionally
+        # tightened automatically under load
+        self.sampler = FlowSampler(sample_rate, adaptive=auto_sample, max_rate=sample_max_rate,
+                                   max_flows=sample_max_flows, max_lag=sample_max_lag)
+        if not self.sampler.active:
+            self.sampler = None
+        # Collapse repeated alerts per (src, dst, dst_port, attack) into one
+        # summary per alert_window seconds
+        self.alert_groups = AlertAggregator(alert_window) if alert_window > 0 else None
+        # Memoized predict_proba rows keyed on the feature vector with each
+        # float32 mantissa cut to prediction_cache_bits bits
+        self.prediction_cache = None
+        if prediction_cache_size > 0:
+            self.prediction_cache = LRUCache(prediction_cache_size)
+            bits = min(max(int(prediction_cache_bits), 0), 23)
+            self._cache_mask = np.uint32((0xFFFFFFFF << (23 - bits)) & 0xFFFFFFFF)
         self.last_save_time = time.time()
         self.packets_processed = 0
-        self.lock = threading.Lock()
+        self.metrics = None
+        self.metrics_server = None
+        self.packet_seconds = None
+        if metrics_port is not None:
+            self._init_metrics()
+            self.lock = TimedLock(self.metrics.histogram(
+                'ids_lock_wait_seconds', 'Time spent waiting for the detector lock (sampled)'),
+                self.metrics.histogram(
+                'ids_lock_hold_seconds', 'Time the detector lock was held (sampled)'))
+        else:
+            self.lock = threading.Lock()
         
-        # Statistics
+        # Statistics, split by the stage that writes them so the capture,
+        # flow and scoring threads of live capture never update a shared
+        # counter; read them through stats_snapshot(), which sums the parts
         self.stats = {
-            'total_packets': 0, 'tcp_packets': 0, 'udp_packets': 0, 'icmp_packets': 0,
-            'total_flows': 0, 'benign_flows': 0, 'malicious_flows': 0,
-            'attack_types': {}, 'errors': 0,
+            'total_packets': 0, 'errors': 0,
             'backend_posts': 0, 'backend_failures': 0
         }
+        self.flow_stats = {
+            'tcp_packets': 0, 'udp_packets': 0, 'icmp_packets': 0,
+            'sampled_out_packets': 0, 'errors': 0
+        }
+        self.score_stats = {
+            'total_flows': 0, 'benign_flows': 0, 'malicious_flows': 0,
+            'attack_types': {}, 'early_alerts': 0,
+            'cache_hits': 0, 'cache_misses': 0, 'aggregated_flows': 0, 'errors': 0
+        }
         
         # Load model components
         print(f"\n{'='*70}")
@@ -61,28 +167,44 @@ class RealtimeIDS:
         print(f"{'='*70}")
         print(f"[*] Loading model components...")
         
-        try:
-            with open(model_path, 'rb') as f:
-                self.model = pickle.load(f)
-            print(f"    ✓ Model loaded: {model_path}")
-            
-            with open(features_path, 'rb') as f:
-                self.selected_features = pickle.load(f)
-            print(f"    ✓ Features loaded: {len(self.selected_features)} features")
-            
-            with open(encoder_path, 'rb') as f:
-                self.label_encoder = pickle.load(f)
-            print(f"    ✓ Label encoder loaded")
-            
-            self.attack_classes = self.label_encoder.classes_
-            print(f"    ✓ Attack classes: {list(self.attack_classes)}")
-            
-            self.model_loaded = True
-            
-        except Exception as e:
-            print(f"    ✗ Error loading model: {e}")
-            self.model_loaded = False
-            sys.exit(1)
+        # Where the model came from, for hot reload (enable_hot_reload)
+        self.model_source = (model_path, features_path, encoder_path, inference)
+        self.reloader = None
+        self._next_model = None
+        self.model_generation = 0
+        # classify=False: sharded-mode coordinator, which only owns outputs,
+        # backend delivery and stats while the workers load the model
+        self.model = self.predictor = self.label_encoder = None
+        self.selected_features = []
+        self.attack_classes = ()
+        self.model_loaded = False
+        if classify:
+            try:
+                loaded = load_model(*self.model_source)
+                if is_bundle(model_path):
+                    print(f"    ✓ Model bundle mapped: {model_path} ({loaded.predictor.n_trees} trees, "
+                          f"{loaded.predictor.node_count:,} nodes, depth {loaded.predictor.max_depth})")
+                else:
+                    print(f"    ✓ Model loaded: {model_path}")
+                    if loaded.compiled:
+                        print(f"    ✓ Model compiled: {loaded.predictor.n_trees} trees, "
+                              f"{loaded.predictor.node_count:,} nodes, depth {loaded.predictor.max_depth}")
+                print(f"    ✓ Features loaded: {len(loaded.selected_features)} features")
+                if not is_bundle(model_path):
+                    print(f"    ✓ Label encoder loaded")
+                self._use_model(loaded)
+                
+                print(f"    ✓ Attack classes: {list(self.attack_classes)}")
+                
+                self.model_loaded = True
+                
+            except Exception as e:
+                print(f"    ✗ Error loading model: {e}")
+                self.model_loaded = False
+                sys.exit(1)
+        else:
+            print(f"    - Model loaded by the shard workers only")
+        self.startup.mark('model')
         
         # Load GeoIP database
         print(f"\n[*] Loading GeoIP database...")
@@ -93,26 +215,47 @@ class RealtimeIDS:
                 self.geoip_loaded = False
                 self.geo_reader = None
             else:
-                self.geo_reader = geoip2.database.Reader(geoip_db_path)
-                print(f"    ✓ GeoIP database loaded: {geoip_db_path}")
+                self.geo_reader = open_geo_reader(geoip_db_path, geoip_mode)
+                print(f"    ✓ GeoIP database loaded: {geoip_db_path} (mode: {geoip_mode})")
                 self.geoip_loaded = True
         except Exception as e:
             print(f"    ✗ Error loading GeoIP database: {e}")
             self.geoip_loaded = False
             self.geo_reader = None
         
-        self.init_outputs()
+        self.geo_cache = None
+        if self.geoip_loaded and geoip_cache_size > 0:
+            self.geo_cache = GeoCache(self.geo_reader, maxsize=geoip_cache_size)
+        self.startup.mark('geoip')
+        
+        if self.result_sink is None:
+            self.init_outputs()
+        self.startup.mark('outputs')
         
         log_message(self.backend_url, f"\n[*] Configuration:")
         log_message(self.backend_url, f"    - Flow timeout: {flow_timeout}s")
         log_message(self.backend_url, f"    - Save interval: {save_interval}s")
         log_message(self.backend_url, f"    - Confidence threshold: {confidence_threshold}")
+        log_message(self.backend_url, f"    - Max batch size: {self.batch_size}")
         log_message(self.backend_url, f"    - Backend URL: {backend_url}")
         log_message(self.backend_url, f"    - Backend enabled: {enable_backend}")
         log_message(self.backend_url, f"{'='*70}\n")
         
-        self.saver_thread = threading.Thread(target=self.auto_saver, daemon=True)
-        self.saver_thread.start()
+        # Alerts are delivered by a background shipper; shard workers leave
+        # delivery to the coordinator
+        self.shipper = None
+        if self.enable_backend and self.result_sink is None:
+            if backend_spool is None:
+                backend_spool = os.path.join(os.path.dirname(json_output) or '.',
+                                             'backend_spool.jsonl')
+            post_histogram = None
+            if self.metrics is not None:
+                post_histogram = self.metrics.histogram(
+                    'ids_backend_post_seconds', 'Latency of alert batch POSTs to the backend')
+            self.shipper = AlertShipper(backend_url, backend_spool,
+                                        max_queue=backend_queue_size,
+                                        batch_size=backend_batch_size,
+                                        post_histogram=post_histogram)
         
         # Check backend health if enabled
         if self.enable_backend:
@@ -124,339 +267,829 @@ class RealtimeIDS:
                  # but didn't set self.enable_backend = False explicitly in __init__, 
                  # just printed warnings. We'll keep it enabled but it will fail gracefully.
                  pass
+        
+        if self.metrics is not None:
+            try:
+                self.metrics_server = MetricsServer(self.metrics, metrics_port, metrics_host)
+                host, port = self.metrics_server.address[:2]
+                print(f"[*] Metrics: http://{host}:{port}/metrics")
+            except OSError as e:
+                print(f"[!] Cannot serve metrics on {metrics_host}:{metrics_port}: {e}")
+        
+        self.startup.mark('backend')
+        log_message(self.backend_url, f"[*] Startup: {self.startup.summary()}")
+
+    def _use_model(self, loaded):
+        self.model = loaded.model
+        self.predictor = loaded.predictor
+        self.selected_features = loaded.selected_features
+        self.label_encoder = loaded.label_encoder
+        self.attack_classes = self.label_encoder.classes_
+
+    def enable_hot_reload(self, poll_interval=0):
+        """Reload the model on reload_model() and, with poll_interval > 0,
+        when its files change; the new model is used from the next sweep"""
+        if self.reloader is None:
+            self.reloader = ModelReloader(self._stage_model, *self.model_source,
+                                          poll_interval=poll_interval)
+        return self.reloader
+
+    def reload_model(self):
+        """Ask for a model reload (safe from signal handlers)"""
+        if self.reloader is not None:
+            self.reloader.request()
+
+    def _stage_model(self, loaded):
+        # Picked up by the scoring thread at the start of its next batch
+        # of work, so the attributes never change under classify_batch
+        self._next_model = loaded
+
+    def _swap_model(self):
+        loaded = self._next_model
+        if loaded is None:
+            return
+        self._next_model = None
+        self._use_model(loaded)
+        if self.prediction_cache is not None:
+            # Cached rows are the old model's probabilities
+            self.prediction_cache.clear()
+        self.model_generation += 1
+        log_message(self.backend_url, f"[*] Model generation {self.model_generation} active: "
+                                      f"{loaded.path} ({len(self.attack_classes)} classes)")
+
+    def _init_metrics(self):
+        """Create the metrics registry: hot-path histograms plus scrape-time
+        views of stats_snapshot() and the components' own counters"""
+        m = self.metrics = Registry()
+        self.packet_seconds = m.histogram(
+            'ids_packet_processing_seconds',
+            f'Decode and flow update time per packet, lock wait included '
+            f'(1 in {PACKET_TIMING_EVERY} packets)')
+        self.sweep_seconds = m.histogram(
+            'ids_sweep_seconds', 'Duration of a flow sweep (features, classification, outputs)')
+        self.classify_seconds = m.histogram(
+            'ids_classify_batch_seconds', 'Latency of one classification batch')
+        self.classify_batch_flows = m.histogram(
+            'ids_classify_batch_flows', 'Flows per classification batch',
+            buckets=(1, 4, 16, 64, 256, 1024, 4096, 16384))
+        self.write_seconds = m.histogram(
+            'ids_output_write_seconds', 'Latency of one write to an output file', ('output',))
+        
+        def stat(key):
+            return self.stats_snapshot()[key]
+        m.counter('ids_packets_total', 'Packets seen', fn=lambda: stat('total_packets'))
+        m.counter('ids_packets_by_protocol_total', 'Packets seen per transport protocol',
+                  ('protocol',), fn=lambda: {(p,): stat(f'{p}_packets') for p in ('tcp', 'udp', 'icmp')})
+        m.counter('ids_flows_total', 'Flows classified', ('result',),
+                  fn=lambda: {('benign',): stat('benign_flows'),
+                              ('malicious',): stat('malicious_flows')})
+        m.counter('ids_errors_total', 'Packet and processing errors', fn=lambda: stat('errors'))
+        m.gauge('ids_active_flows', 'Flows in the flow table',
+                fn=lambda: len(self.flows) + self.shard_flows)
+        m.counter('ids_prediction_cache_lookups_total', 'Prediction cache lookups', ('result',),
+                  fn=lambda: {('hit',): stat('cache_hits'), ('miss',): stat('cache_misses')})
+        m.gauge('ids_startup_phase_seconds', 'Duration of each startup phase', ('phase',),
+                fn=lambda: {(name,): seconds for name, seconds in self.startup.phases})
+        m.gauge('ids_first_packet_seconds', 'Seconds from process start to the first captured packet',
+                fn=lambda: self.first_packet_seconds or 0)
+        m.counter('ids_model_reloads_total', 'Model hot reloads by outcome', ('result',),
+                  fn=lambda: {(k,): v for k, v in self.reloader.metrics().items()}
+                  if self.reloader is not None else {})
+        m.gauge('ids_model_generation', 'Model versions swapped in since startup',
+                fn=lambda: self.model_generation)
+        m.counter('ids_sampled_out_packets_total', 'Packets of flows skipped by sampling',
+                  fn=lambda: stat('sampled_out_packets'))
+        
+        def geo(key):
+            return self.geo_cache.metrics()[key] if self.geo_cache is not None else 0
+        m.counter('ids_geo_lookups_total', 'GeoIP lookups', fn=lambda: geo('lookups'))
+        m.counter('ids_geo_reader_lookups_total', 'GeoIP lookups that reached the database',
+                  fn=lambda: geo('reader_lookups'))
+        m.gauge('ids_geo_cache_hit_ratio', 'Share of GeoIP lookups answered from cache',
+                fn=lambda: geo('hit_rate'))
+        
+        def shipper(key):
+            return self.shipper.metrics()[key] if self.shipper is not None else 0
+        m.gauge('ids_backend_queue_depth', 'Alerts waiting for backend delivery',
+                fn=lambda: shipper('queue_depth'))
+        m.counter('ids_backend_alerts_total', 'Alerts by delivery outcome', ('outcome',),
+                  fn=lambda: {(k,): shipper(k) for k in ('sent', 'failed', 'spilled',
+                                                         'corrupt')})
+        m.counter('ids_backend_resent_alerts_total', 'Alerts delivered from the disk spool',
+                  fn=lambda: shipper('resent'))
+        
+        def ring(key):
+            return self.capture_ring.stats()[key] if self.capture_ring is not None else 0
+        m.counter('ids_capture_received_total', 'Frames received by the capture ring',
+                  fn=lambda: ring('received'))
+        m.counter('ids_capture_kernel_drops_total', 'Frames dropped because the ring was full',
+                  fn=lambda: ring('dropped'))
+        
+        def ingest(key):
+            return self.pipeline.metrics()[key] if self.pipeline is not None else 0
+        m.counter('ids_ingest_packets_total', 'Decoded packets offered to the flow thread', ('result',),
+                  fn=lambda: {(k,): ingest(k) for k in ('queued', 'overflow')})
+        m.gauge('ids_ingest_queue_depth', 'Packets waiting for the flow thread',
+                fn=lambda: ingest('depth'))
+        m.gauge('ids_ingest_queue_high_water', 'Largest ingest queue depth seen',
+                fn=lambda: ingest('high_water'))
+        m.gauge('ids_scoring_queue_depth', 'Sweeps waiting for the scoring thread',
+                fn=lambda: ingest('score_depth'))
+        m.counter('ids_scoring_stalls_total', 'Times the flow thread waited for the scoring thread',
+                  fn=lambda: ingest('stalls'))
 
     def init_outputs(self):
         """Initialize output files"""
-        with open(self.json_output, 'w') as f:
-            json.dump([], f)
-        
-        # Enhanced CSV with geolocation
-        pd.DataFrame(columns=ENHANCED_CSV_COLUMNS).to_csv(self.csv_output, index=False)
+        if self.json_format == 'jsonl':
+            self.json_sink = JsonlSink(self.json_output, **self.json_sink_options)
+        else:
+            with open(self.json_output, 'w') as f:
+                json.dump([], f)
         
-        # ML Features CSV - EXACT ORDER
-        pd.DataFrame(columns=FEATURE_COLUMNS_ORDERED).to_csv(self.features_output, index=False)
+        if self.table_format != 'csv':
+            self.csv_sink = ColumnarSink(
+                self.csv_output, columnar_fields(ENHANCED_CSV_COLUMNS, ENHANCED_CSV_TYPES),
+                **self.table_options)
+            self.features_sink = ColumnarSink(
+                self.features_output, columnar_fields(FEATURE_COLUMNS_ORDERED),
+                **self.table_options)
+        else:
+            import pandas as pd  # deferred: slow to import, only the CSV outputs use it
+            
+            # Enhanced CSV with geolocation
+            pd.DataFrame(columns=ENHANCED_CSV_COLUMNS).to_csv(self.csv_output, index=False)
+            
+            # ML Features CSV - EXACT ORDER
+            pd.DataFrame(columns=FEATURE_COLUMNS_ORDERED).to_csv(self.features_output, index=False)
         
         log_message(self.backend_url, f"[+] Output files initialized")
         log_message(self.backend_url, f"    - {self.json_output}")
         log_message(self.backend_url, f"    - {self.csv_output}")
         log_message(self.backend_url, f"    - {self.features_output}\n")
 
-    def auto_saver(self):
-        while True:
-            time.sleep(self.save_interval)
-            self.process_flows()
+    @staticmethod
+    def _decode_packet(packet):
+        """decode_frame()-style tuple from a dissected scapy packet (None if not IP)"""
+        from scapy.all import IP, TCP, UDP
+        if IP not in packet:
+            return None
+        
+        ip = packet[IP]
+        hdr_len = ip.ihl * 4
+        src_port = dst_port = 0
+        tcp_flags = 0
+        
+        if TCP in packet:
+            tcp = packet[TCP]
+            src_port, dst_port = tcp.sport, tcp.dport
+            hdr_len += tcp.dataofs * 4
+            tcp_flags = int(tcp.flags)
+            
+        elif UDP in packet:
+            udp = packet[UDP]
+            src_port, dst_port = udp.sport, udp.dport
+            hdr_len += 8
+        
+        return (ip.src, ip.dst, ip.proto, src_port, dst_port, hdr_len, len(packet), tcp_flags,
+                max(ip.len - hdr_len, 0))
 
-    def process_packet(self, packet):
+    def _enqueue_frame(self, frame, linktype, ts):
+        """Capture-thread half of the live path: count and decode the frame,
+        then queue it for the flow thread (see IngestPipeline)"""
+        self.packets_processed += 1
+        self.stats['total_packets'] += 1
+        if self.packets_processed % 100 == 0:
+            self._print_periodic_stats()
+        elif self.packets_processed == 1:
+            self.log_first_packet()
         try:
-            with self.lock:
-                self.packets_processed += 1
-                self.stats['total_packets'] += 1
-                
-                if self.packets_processed % 100 == 0:
-                    self._print_periodic_stats()
-                
-                if IP not in packet:
-                    return
-                
-                ip = packet[IP]
-                ts = time.time()
-                hdr_len = ip.ihl * 4
-                src_port = dst_port = 0
-                flags = {}
-                
-                if TCP in packet:
-                    tcp = packet[TCP]
-                    src_port, dst_port = tcp.sport, tcp.dport
-                    hdr_len += tcp.dataofs * 4
-                    flags = {
-                        'FIN': int(tcp.flags.F), 'SYN': int(tcp.flags.S),
-                        'RST': int(tcp.flags.R), 'PSH': int(tcp.flags.P),
-                        'ACK': int(tcp.flags.A), 'URG': int(tcp.flags.U),
-                        'ECE': int(tcp.flags.E), 'CWR': int(tcp.flags.C)
-                    }
-                    self.stats['tcp_packets'] += 1
-                    
-                elif UDP in packet:
-                    udp = packet[UDP]
-                    src_port, dst_port = udp.sport, udp.dport
-                    hdr_len += 8
-                    self.stats['udp_packets'] += 1
-                    
-                elif ICMP in packet:
-                    self.stats['icmp_packets'] += 1
-                
-                key = get_flow_key(ip.src, ip.dst, src_port, dst_port, ip.proto)
-                
-                if key not in self.flows:
-                    self.flows[key] = self._init_flow(key, ip, src_port, dst_port, ts)
-                
-                self._update_flow(self.flows[key], ip, src_port, hdr_len, 
-                                len(packet), ts, flags)
-                
+            decoded = decode_frame(frame, linktype)
+        except Exception as e:
+            self.stats['errors'] += 1
+            if self.stats['errors'] < 10:
+                print(f"[!] Packet error: {e}")
+            return
+        if decoded is not None:
+            self.pipeline.push((time.time() if ts is None else ts,) + decoded)
+
+    def _enqueue_packet(self, packet):
+        """sniff() callback queueing a dissected packet for the flow thread"""
+        self.packets_processed += 1
+        self.stats['total_packets'] += 1
+        if self.packets_processed % 100 == 0:
+            self._print_periodic_stats()
+        elif self.packets_processed == 1:
+            self.log_first_packet()
+        try:
+            decoded = self._decode_packet(packet)
         except Exception as e:
             self.stats['errors'] += 1
             if self.stats['errors'] < 10:
                 print(f"[!] Packet error: {e}")
+            return
+        if decoded is not None:
+            self.pipeline.push((time.time(),) + decoded)
+
+    def log_first_packet(self):
+        """Record and log the time from process start to the first packet"""
+        self.first_packet_seconds = self.startup.elapsed()
+        log_message(self.backend_url,
+                    f"[*] First packet {self.first_packet_seconds:.2f}s after process start")
+
+    def _ingest_queued(self, packets, n):
+        """Flow-thread half: pop n decoded packets off the deque and account
+        them to their flows (see IngestPipeline)"""
+        popleft = packets.popleft
+        for _ in range(n):
+            packet = popleft()
+            self.packets_ingested += 1
+            start = None
+            if self.packet_seconds is not None and self.packets_ingested % PACKET_TIMING_EVERY == 0:
+                start = time.perf_counter()
+            try:
+                if self.sampler is not None and self.packets_ingested % LOAD_CHECK_PACKETS == 0:
+                    # Lag includes the time the packet spent queued
+                    self.check_load(time.time() - packet[0])
+                self._ingest(*packet)
+            except Exception as e:
+                self.flow_stats['errors'] += 1
+                if self.flow_stats['errors'] < 10:
+                    print(f"[!] Packet error: {e}")
+            if start is not None:
+                self.packet_seconds.observe(time.perf_counter() - start)
+
+    def _ingest(self, ts, src_ip, dst_ip, proto, src_port, dst_port, hdr_len, pkt_len, tcp_flags,
+                payload_len):
+        """Account one decoded IP packet to its flow (caller holds self.lock,
+        or is the pipeline's flow thread)"""
+        if proto == 6:
+            self.flow_stats['tcp_packets'] += 1
+        elif proto == 17:
+            self.flow_stats['udp_packets'] += 1
+        elif proto == 1 or proto == 58:
+            self.flow_stats['icmp_packets'] += 1
+        
+        key = flow_key(src_ip, dst_ip, src_port, dst_port, proto)
+        
+        flow = self.flows.get(key)
+        if flow is None:
+            if self.sampler is not None and not self.sampler.keep(key):
+                self.flow_stats['sampled_out_packets'] += 1
+                return
+            flow = FlowRecord(key, src_ip, dst_ip, src_port, dst_port, proto, ts)
+            self.flows.add(key, flow)
+            if self.early_scoring:
+                self._schedule_score(flow, 0, ts)
+        
+        flow.update(src_ip, src_port, hdr_len, pkt_len, ts, tcp_flags, payload_len)
+        
+        if tcp_flags & (TCP_FIN | TCP_RST):
+            self.flows.mark_ready(key)
+        elif (flow.fwd_packets + flow.bwd_packets >= flow.next_score_packets or
+              ts >= flow.next_score_time):
+            # Due for early scoring; unscheduled until score_flows() runs
+            flow.next_score_packets = flow.next_score_time = float('inf')
+            self._score_queue[key] = None
+
+    def _schedule_score(self, flow, packets, ts):
+        periods = flow.score_backoff
+        if self.early_packets:
+            flow.next_score_packets = packets + self.early_packets * periods
+        if self.early_interval:
+            flow.next_score_time = ts + self.early_interval * periods
+
+    def check_load(self, lag=None):
+        """Let the sampling controller react to flow-table size and capture lag
+        (seconds between a packet's capture timestamp and its processing)"""
+        rate = self.sampler.adjust(len(self.flows) + self.shard_flows, lag)
+        if rate is not None:
+            lag_text = f", lag {lag:.2f}s" if lag is not None else ""
+            log_message(self.backend_url,
+                        f"[*] Flow sampling now 1/{rate} "
+                        f"({len(self.flows) + self.shard_flows:,} active flows{lag_text})",
+                        'warning')
 
     def _print_periodic_stats(self):
+        self._sync_backend_stats()
+        stats = self.stats_snapshot()
         malicious_rate = 0
-        if self.stats['total_flows'] > 0:
-            malicious_rate = (self.stats['malicious_flows'] / self.stats['total_flows']) * 100
+        if stats['total_flows'] > 0:
+            malicious_rate = (stats['malicious_flows'] / stats['total_flows']) * 100
         
         backend_status = ""
         if self.enable_backend:
-            total_attempts = self.stats['backend_posts'] + self.stats['backend_failures']
+            total_attempts = stats['backend_posts'] + stats['backend_failures']
             if total_attempts > 0:
-                success_rate = (self.stats['backend_posts'] / total_attempts) * 100
+                success_rate = (stats['backend_posts'] / total_attempts) * 100
                 backend_status = f" | Backend: {success_rate:.0f}% success"
             else:
                 backend_status = " | Backend: No sends yet"
         
         log_message(self.backend_url, 
               f"[*] Packets: {self.packets_processed:,} | "
-              f"Flows: {len(self.flows)} | "
-              f"Malicious: {self.stats['malicious_flows']} ({malicious_rate:.1f}%)"
+              f"Flows: {len(self.flows) + self.shard_flows} | "
+              f"Malicious: {stats['malicious_flows']} ({malicious_rate:.1f}%)"
               f"{backend_status}")
 
-    def _init_flow(self, key, ip, src_port, dst_port, ts):
-        return {
-            'flow_id': key, 'src_ip': ip.src, 'dst_ip': ip.dst,
-            'src_port': src_port, 'dst_port': dst_port, 'protocol': ip.proto,
-            'start_time': ts, 'last_time': ts, 'fwd_packets': 0, 'bwd_packets': 0,
-            'fwd_bytes': 0, 'bwd_bytes': 0, 'fwd_header_bytes': 0, 'bwd_header_bytes': 0,
-            'fwd_packet_lengths': [], 'bwd_packet_lengths': [], 'all_packet_lengths': [],
-            'fwd_iat': [], 'bwd_iat': [], 'flow_iat': [],
-            'last_packet_time': ts, 'last_fwd_packet_time': None, 'last_bwd_packet_time': None,
-            'fwd_psh_flags': 0, 'bwd_psh_flags': 0, 'fwd_urg_flags': 0, 'bwd_urg_flags': 0,
-            'fin_count': 0, 'syn_count': 0, 'rst_count': 0, 'psh_count': 0,
-            'ack_count': 0, 'urg_count': 0, 'cwe_count': 0, 'ece_count': 0,
-            'init_win_bytes_fwd': 0, 'init_win_bytes_bwd': 0,
-            'active_times': [], 'idle_times': [], 'last_activity_time': ts, 'is_active': True,
-            'fwd_bulk_bytes': [], 'bwd_bulk_bytes': [], 'fwd_bulk_packets': [],
-            'bwd_bulk_packets': [], 'fwd_bulk_duration': [], 'bwd_bulk_duration': []
-        }
+    def build_feature_matrix(self, features_list):
+        """Build a contiguous float32 matrix in selected_features order"""
+        X = np.array(
+            [[feats.get(name, 0) for name in self.selected_features]
+             for feats in features_list],
+            dtype=np.float64
+        ).astype(np.float32)
+        # inf/NaN (and float32 overflow) are mapped to 0 like the old DataFrame path
+        np.nan_to_num(X, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+        return X
 
-    def _update_flow(self, flow, ip, src_port, hdr_len, pkt_len, ts, flags):
-        is_fwd = (ip.src == flow['src_ip'] and src_port == flow['src_port'])
-        
-        if flow['fwd_packets'] + flow['bwd_packets'] > 0:
-            flow['flow_iat'].append(ts - flow['last_packet_time'])
-        
-        if is_fwd:
-            if flow['last_fwd_packet_time']:
-                flow['fwd_iat'].append(ts - flow['last_fwd_packet_time'])
-            flow['last_fwd_packet_time'] = ts
-            flow['fwd_packets'] += 1
-            flow['fwd_bytes'] += pkt_len
-            flow['fwd_header_bytes'] += hdr_len
-            flow['fwd_packet_lengths'].append(pkt_len)
-        else:
-            if flow['last_bwd_packet_time']:
-                flow['bwd_iat'].append(ts - flow['last_bwd_packet_time'])
-            flow['last_bwd_packet_time'] = ts
-            flow['bwd_packets'] += 1
-            flow['bwd_bytes'] += pkt_len
-            flow['bwd_header_bytes'] += hdr_len
-            flow['bwd_packet_lengths'].append(pkt_len)
-        
-        flow['all_packet_lengths'].append(pkt_len)
-        flow['last_packet_time'] = ts
-        flow['last_time'] = ts
-        
-        if flags:
-            for flag, val in flags.items():
-                if val:
-                    if flag == 'FIN': flow['fin_count'] += 1
-                    elif flag == 'SYN': flow['syn_count'] += 1
-                    elif flag == 'RST': flow['rst_count'] += 1
-                    elif flag == 'PSH':
-                        flow['psh_count'] += 1
-                        flow['fwd_psh_flags' if is_fwd else 'bwd_psh_flags'] += 1
-                    elif flag == 'ACK': flow['ack_count'] += 1
-                    elif flag == 'URG':
-                        flow['urg_count'] += 1
-                        flow['fwd_urg_flags' if is_fwd else 'bwd_urg_flags'] += 1
-                    elif flag == 'CWR': flow['cwe_count'] += 1
-                    elif flag == 'ECE': flow['ece_count'] += 1
+    def classify_batch(self, features_list):
+        """Classify many flows with a single predict_proba pass.
 
-    def classify_flow(self, features, flow):
+        Returns a dict of per-flow arrays (labels, confidence, is_malicious,
+        probabilities) or None on error.
+        """
         try:
             start_time = time.time()
             
-            df = pd.DataFrame([features])
-            
-            for feat in self.selected_features:
-                if feat not in df.columns:
-                    df[feat] = 0
-            
-            df = df[self.selected_features]
-            df.replace([np.inf, -np.inf], np.nan, inplace=True)
-            df.fillna(0, inplace=True)
-            
-            prediction_numeric = self.model.predict(df)[0]
-            probabilities = self.model.predict_proba(df)[0]
-            
-            attack_type = self.label_encoder.inverse_transform([prediction_numeric])[0]
-            confidence = float(np.max(probabilities))
+            X = self.build_feature_matrix(features_list)
+            if self.prediction_cache is not None:
+                probabilities = self._cached_predict_proba(X)
+            else:
+                probabilities = self.predictor.predict_proba(X)
             
-            prob_dict = {
-                str(self.attack_classes[i]): float(probabilities[i])
-                for i in range(len(self.attack_classes))
-            }
+            best = probabilities.argmax(axis=1)
+            labels = self.label_encoder.inverse_transform(self.predictor.classes_[best])
+            confidence = probabilities[np.arange(len(best)), best]
+            is_malicious = labels != 'BENIGN'
             
-            is_malicious = attack_type != 'BENIGN'
             processing_time = (time.time() - start_time) * 1000  # ms
+            if self.metrics is not None:
+                self.classify_seconds.observe(processing_time / 1000)
+                self.classify_batch_flows.observe(len(best))
             
             return {
-                'prediction': str(attack_type),
+                'labels': labels,
                 'confidence': confidence,
                 'is_malicious': is_malicious,
-                'probabilities': prob_dict,
-                'processing_time_ms': round(processing_time, 2)
+                'probabilities': probabilities,
+                'processing_time_ms': processing_time / max(len(best), 1)
             }
             
         except Exception as e:
             print(f"[!] Classification error: {e}")
             return None
 
-    def process_flows(self):
+    def _cached_predict_proba(self, X):
+        """predict_proba through the prediction cache; only misses reach the model"""
+        keys = np.ascontiguousarray(X.view(np.uint32) & self._cache_mask)
+        keys = keys.view(np.dtype((np.void, keys.shape[1] * 4))).ravel()
+        # Rows that quantize to the same key are looked up (or computed) once
+        unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        
+        cache = self.prediction_cache
+        table = [cache.get(key.tobytes()) for key in unique_keys]
+        missing = [u for u, row in enumerate(table) if row is None]
+        if missing:
+            computed = self.predictor.predict_proba(X[first[missing]])
+            for j, u in enumerate(missing):
+                table[u] = computed[j].copy()
+                cache.put(unique_keys[u].tobytes(), table[u])
+        
+        self.score_stats['cache_hits'] += len(X) - len(missing)
+        self.score_stats['cache_misses'] += len(missing)
+        return np.vstack(table)[inverse]
+
+    def batch_result(self, batch, i):
+        """Build the per-flow result dict for row i of a classify_batch() result"""
+        return {
+            'prediction': str(batch['labels'][i]),
+            'confidence': float(batch['confidence'][i]),
+            'is_malicious': bool(batch['is_malicious'][i]),
+            'probabilities': {
+                str(cls): float(p)
+                for cls, p in zip(self.attack_classes, batch['probabilities'][i])
+            },
+            'processing_time_ms': round(batch['processing_time_ms'], 2)
+        }
+
+    def classify_flow(self, features, flow):
+        batch = self.classify_batch([features])
+        if batch is None:
+            return None
+        return self.batch_result(batch, 0)
+
+    def process_flows(self, now=None):
+        """Classify and flush finished flows (now defaults to the wall clock)"""
+        sweep_start = time.perf_counter() if self.metrics is not None else None
+        with self.lock:
+            t = time.time() if now is None else now
+            self._score_ready(self._collect_due(t), t, self.flows.requeue)
+        
+        if sweep_start is not None:
+            self.sweep_seconds.observe(time.perf_counter() - sweep_start)
+
+    def _collect_due(self, now):
+        """Pop the finished flows and extract their features: [(key, flow, features)]"""
+        ready = []
+        # Only flows that are idle past the timeout or saw FIN/RST are returned
+        for fid, f in self.flows.pop_due(now):
+            features = extract_features(f)
+            if features:
+                ready.append((fid, f, features))
+            else:
+                self.flows.requeue(fid, f)
+        return ready
+
+    def _score_ready(self, ready, t, requeue):
+        """Classify the flows from _collect_due() and write the results;
+        requeue(key, flow) takes back the flows of a failed batch"""
+        self._swap_model()
+        malicious_alerts = []
+        all_results = []
+        ml_features_records = []
+        
+        for offset in range(0, len(ready), self.batch_size):
+            chunk = ready[offset:offset + self.batch_size]
+            batch = self.classify_batch([features for _, _, features in chunk])
+            if batch is None:
+                for fid, f, _ in chunk:
+                    requeue(fid, f)
+                continue
+            
+            is_malicious = batch['is_malicious']
+            n_malicious = int(is_malicious.sum())
+            self.score_stats['total_flows'] += len(chunk)
+            self.score_stats['malicious_flows'] += n_malicious
+            self.score_stats['benign_flows'] += len(chunk) - n_malicious
+            
+            attack_names, attack_counts = np.unique(batch['labels'][is_malicious],
+                                                    return_counts=True)
+            for attack_type, count in zip(attack_names, attack_counts):
+                attack_type = str(attack_type)
+                self.score_stats['attack_types'][attack_type] = \
+                    self.score_stats['attack_types'].get(attack_type, 0) + int(count)
+            
+            # ML features record (ALWAYS - for all flows)
+            for fid, f, features in chunk:
+                ml_features_records.append({col: features[col] for col in FEATURE_COLUMNS_ORDERED})
+            
+            alert_mask = is_malicious & (batch['confidence'] >= self.confidence_threshold)
+            for i in np.flatnonzero(alert_mask):
+                fid, f, features = chunk[i]
+                if f.early_label is not None and f.early_label == batch['labels'][i]:
+                    continue  # already alerted on while the flow was open
+                self._add_alert(f, batch, i, features, malicious_alerts, all_results, t)
+        
+        if self.alert_groups is not None:
+            self._add_summaries(self.alert_groups.pop_closed(t), malicious_alerts, all_results)
+        
+        if self.result_sink is not None:
+            self.result_sink(malicious_alerts, all_results, ml_features_records)
+        else:
+            self._emit(malicious_alerts, all_results, ml_features_records)
+
+    def _add_alert(self, f, batch, i, features, malicious_alerts, all_results, now,
+                   early=False):
+        result = self.batch_result(batch, i)
+        
+        if self.alert_groups is not None and not self.alert_groups.add(f, result, features, now):
+            self.score_stats['aggregated_flows'] += 1
+            return
+        
+        # Get geolocation (only needed for alerts)
+        geo_data = get_geolocation(f.src_ip, self.geo_reader, self.geo_cache)
+        
+        # Create streamlined alert
+        alert = create_enhanced_alert(f, result, features, geo_data)
+        
+        # Save to JSON (ALWAYS)
+        malicious_alerts.append(alert)
+        
+        # Create CSV record (ONLY for malicious)
+        csv_record = create_csv_record(f, result, features, geo_data)
+        all_results.append(csv_record)
+        
+        if early:
+            # The backend keys flows by flow_id; an early alert must not take
+            # the id of the flow's final (possibly relabelled) alert
+            flow_id = f"{alert['flow_id']}-early-{result['prediction']}"
+            alert['flow_id'] = csv_record['Flow_ID'] = flow_id
+
+    def _add_summaries(self, groups, malicious_alerts, all_results):
+        for group in groups:
+            geo_data = get_geolocation(group.flow.src_ip, self.geo_reader, self.geo_cache)
+            malicious_alerts.append(create_summary_alert(group, geo_data))
+            all_results.append(create_summary_csv_record(group, geo_data))
+
+    def flush_alert_groups(self):
+        """Emit the summaries of all open alert groups (at shutdown)"""
+        if self.alert_groups is None:
+            return
         with self.lock:
-            t = time.time()
-            to_remove = []
             malicious_alerts = []
             all_results = []
-            ml_features_records = []
+            self._add_summaries(self.alert_groups.pop_closed(), malicious_alerts, all_results)
+            if not malicious_alerts:
+                return
+            if self.result_sink is not None:
+                self.result_sink(malicious_alerts, all_results, [])
+            else:
+                self._emit(malicious_alerts, all_results, [])
+
+    def score_flows(self, now=None):
+        """Re-classify open flows that are due for early scoring.
+
+        Features come from a snapshot of the flow's running statistics and
+        the flow stays open. A flow classified as an attack is alerted on
+        once per attack type (the final classification at flow end does not
+        repeat it), and its scoring period doubles up to early_max_backoff.
+        Early alerts carry the flow id suffixed with -early-<label>, so a
+        flow relabelled at the end still gets its own final alert.
+        Flow totals are still counted once, when the flow ends. now is the
+        clock used for alert aggregation windows.
+        """
+        with self.lock:
+            if not self._score_queue:
+                return
+            t = time.time() if now is None else now
+            self._score_early(self._collect_early(), t, self._reschedule)
+
+    def _collect_early(self):
+        """Snapshots of the flows due for early scoring, taken on the thread
+        that updates them: [(flow, features, score_backoff, packets, last_time)]"""
+        due = []
+        for key in self._score_queue:
+            f = self.flows.get(key)
+            if f is not None:
+                features = extract_features(f)
+                if features:
+                    due.append((f, features, f.score_backoff, f.total_packets, f.last_time))
+        self._score_queue.clear()
+        return due
+
+    def _reschedule(self, flow, backoff, packets, ts):
+        """Apply an early-scoring result's backoff (flow-updating thread)"""
+        flow.score_backoff = backoff
+        self._schedule_score(flow, packets, ts)
+
+    def _score_early(self, due, t, reschedule):
+        """Classify the snapshots from _collect_early() and hand each flow's
+        new backoff to reschedule(flow, backoff, packets, ts), which must run
+        on the thread that updates the flows. Apart from early_label, which
+        only the scoring side touches, no flow field is written here."""
+        self._swap_model()
+        malicious_alerts = []
+        all_results = []
+        for offset in range(0, len(due), self.batch_size):
+            chunk = due[offset:offset + self.batch_size]
+            batch = self.classify_batch([item[1] for item in chunk])
+            if batch is None:
+                for f, _, backoff, packets, last_time in chunk:
+                    reschedule(f, backoff, packets, last_time)
+                continue
             
-            for fid, f in list(self.flows.items()):
-                total_pkt = f['fwd_packets'] + f['bwd_packets']
-                idle_time = t - f['last_time']
+            alert_mask = batch['is_malicious'] & (batch['confidence'] >= self.confidence_threshold)
+            for i, (f, features, backoff, packets, last_time) in enumerate(chunk):
+                if batch['is_malicious'][i]:
+                    backoff = min(backoff * 2, self.early_max_backoff)
+                else:
+                    backoff = 1
+                reschedule(f, backoff, packets, last_time)
                 
-                should_process = (
-                    (idle_time > self.flow_timeout or f['fin_count'] > 0 or f['rst_count'] > 0)
-                    and total_pkt >= 1
-                )
-                
-                if should_process:
-                    features = extract_features(f)
-                    
-                    if features:
-                        result = self.classify_flow(features, f)
-                        
-                        if result:
-                            # Get geolocation
-                            geo_data = get_geolocation(f['src_ip'], self.geo_reader)
-                            
-                            self.stats['total_flows'] += 1
-                            
-                            # ML features record (ALWAYS - for all flows)
-                            ml_record = {col: features[col] for col in FEATURE_COLUMNS_ORDERED}
-                            ml_features_records.append(ml_record)
-                            
-                            if result['is_malicious']:
-                                self.stats['malicious_flows'] += 1
-                                attack_type = result['prediction']
-                                self.stats['attack_types'][attack_type] = \
-                                    self.stats['attack_types'].get(attack_type, 0) + 1
-                                
-                                if result['confidence'] >= self.confidence_threshold:
-                                    # Create streamlined alert
-                                    alert = create_enhanced_alert(f, result, features, geo_data)
-                                    
-                                    # Save to JSON (ALWAYS)
-                                    malicious_alerts.append(alert)
-                                    
-                                    # Create CSV record (ONLY for malicious)
-                                    csv_record = create_csv_record(f, result, features, geo_data)
-                                    all_results.append(csv_record)
-                                    
-                                    # Send to backend (if enabled)
-                                    backend_sent = False
-                                    if self.enable_backend:
-                                        backend_sent = send_to_backend(self.backend_url, alert)
-                                        if backend_sent:
-                                            self.stats['backend_posts'] += 1
-                                        else:
-                                            self.stats['backend_failures'] += 1
-                                    
-                                    # Print alert and send to backend logs
-                                    print_alert(alert, backend_sent, self.backend_url)
-                            else:
-                                self.stats['benign_flows'] += 1
-                            
-                            to_remove.append(fid)
-            
-            # Save to files
-            if malicious_alerts:
-                save_to_json(malicious_alerts, self.json_output)
-                print(f"[+] Saved {len(malicious_alerts)} malicious flows to {self.json_output}")
+                label = batch['labels'][i]
+                if alert_mask[i] and f.early_label != label:
+                    f.early_label = label
+                    self.score_stats['early_alerts'] += 1
+                    self._add_alert(f, batch, i, features, malicious_alerts, all_results, t,
+                                    early=True)
+        
+        if not malicious_alerts:
+            return
+        if self.result_sink is not None:
+            self.result_sink(malicious_alerts, all_results, [])
+        else:
+            self._emit(malicious_alerts, all_results, [])
+
+    def _emit(self, malicious_alerts, all_results, ml_features_records):
+        """Deliver one sweep's results: backend, console and output files"""
+        for alert in malicious_alerts:
+            # Queue for backend delivery (if enabled)
+            backend_status = None
+            if self.shipper is not None:
+                if self.shipper.submit(alert):
+                    backend_status = "⇢ Queued for backend"
+                else:
+                    backend_status = "✗ Backend queue full (spooled to disk)"
             
-            if ml_features_records:
+            # Print alert and send to backend logs
+            print_alert(alert, backend_url=self.backend_url, backend_status=backend_status)
+        
+        # Save to files
+        if malicious_alerts:
+            with self._write_timer('json'):
+                if self.json_sink is not None:
+                    self.json_sink.write(malicious_alerts)
+                else:
+                    save_to_json(malicious_alerts, self.json_output)
+            print(f"[+] Saved {len(malicious_alerts)} malicious flows to {self.json_output}")
+        
+        if self.table_format != 'csv':
+            with self._write_timer('features'):
+                self.features_sink.append(ml_features_records)
+            with self._write_timer('csv'):
+                self.csv_sink.append(all_results)
+            if all_results:
+                print(f"[+] Queued {len(all_results)} malicious flow records for {self.csv_output}")
+            return
+        
+        import pandas as pd
+        if ml_features_records:
+            with self._write_timer('features'):
                 df_ml = pd.DataFrame(ml_features_records)
                 df_ml = df_ml[FEATURE_COLUMNS_ORDERED]
                 df_ml.to_csv(self.features_output, mode='a', header=False, index=False)
-                # print(f"[+] Saved {len(ml_features_records)} ML feature records")
-            
-            if all_results:
+            # print(f"[+] Saved {len(ml_features_records)} ML feature records")
+        
+        if all_results:
+            with self._write_timer('csv'):
                 df = pd.DataFrame(all_results)
                 df.to_csv(self.csv_output, mode='a', header=False, index=False)
-                print(f"[+] Saved {len(all_results)} malicious flow records to {self.csv_output}")
-            
-            for fid in to_remove:
-                del self.flows[fid]
+            print(f"[+] Saved {len(all_results)} malicious flow records to {self.csv_output}")
+
+    def _write_timer(self, output):
+        """Times an output write into ids_output_write_seconds (no-op without metrics)"""
+        if self.metrics is None:
+            return contextlib.nullcontext()
+        return self.write_seconds.labels(output).time()
+
+    def _sync_backend_stats(self):
+        """Mirror the alert shipper's delivery counters into self.stats"""
+        if self.shipper is not None:
+            metrics = self.shipper.metrics()
+            self.stats['backend_posts'] = metrics['sent']
+            self.stats['backend_failures'] = metrics['failed']
+            return metrics
+        return None
+
+    def close(self):
+        """Flush queued backend deliveries and release resources"""
+        if self.result_sink is None:
+            self.flush_alert_groups()
+        
+        if self.shipper is not None:
+            self.shipper.close()
+            print("[*] Backend delivery queue flushed")
+        
+        if self.json_sink is not None:
+            self.json_sink.close()
+        
+        if self.reloader is not None:
+            self.reloader.close()
+        
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+            self.metrics_server = None
+        
+        for sink in (self.features_sink, self.csv_sink):
+            if sink is not None:
+                sink.close()
+                print(f"[*] {sink.rows_written:,} rows written to {sink.directory} "
+                      f"({sink.files} file(s), {sink.row_groups} row group(s))")
+        
+        if self.geoip_loaded and self.geo_reader:
+            try:
+                self.geo_reader.close()
+                print("[*] GeoIP database closed")
+            except:
+                pass
+
+    def stats_snapshot(self):
+        """Totals of the per-stage statistics, as a copy that is safe to hand
+        to another process"""
+        snapshot = {'attack_types': {}}
+        for part in (self.stats, self.flow_stats, self.score_stats):
+            for key, value in list(part.items()):
+                if key == 'attack_types':
+                    for attack, count in dict(value).items():
+                        snapshot[key][attack] = snapshot[key].get(attack, 0) + count
+                else:
+                    snapshot[key] = snapshot.get(key, 0) + value
+        return snapshot
 
     def print_stats(self):
         """Print statistics and send to backend logs"""
+        metrics = self._sync_backend_stats()
+        stats = self.stats_snapshot()
         lines = [
             f"\n{'='*70}",
             f"  IDS STATISTICS",
             f"{'='*70}",
-            f"Packets: {self.stats['total_packets']:,} "
-            f"(TCP: {self.stats['tcp_packets']:,}, "
-            f"UDP: {self.stats['udp_packets']:,}, "
-            f"ICMP: {self.stats['icmp_packets']:,})",
-            f"Flows: Total={self.stats['total_flows']:,}, "
-            f"Active={len(self.flows):,}",
-            f"Classification: Malicious={self.stats['malicious_flows']:,}, "
-            f"Benign={self.stats['benign_flows']:,}"
+            f"Packets: {stats['total_packets']:,} "
+            f"(TCP: {stats['tcp_packets']:,}, "
+            f"UDP: {stats['udp_packets']:,}, "
+            f"ICMP: {stats['icmp_packets']:,})",
+            f"Flows: Total={stats['total_flows']:,}, "
+            f"Active={len(self.flows) + self.shard_flows:,}",
+            f"Classification: Malicious={stats['malicious_flows']:,}, "
+            f"Benign={stats['benign_flows']:,}"
         ]
         
-        if self.enable_backend:
-            lines.append(f"Backend: Posts={self.stats['backend_posts']:,}, "
-                         f"Failures={self.stats['backend_failures']:,}")
+        lookups = stats['cache_hits'] + stats['cache_misses']
+        if lookups:
+            lines.append(f"Prediction cache: Hits={stats['cache_hits']:,}, "
+                         f"Misses={stats['cache_misses']:,}, "
+                         f"Hit rate={stats['cache_hits'] / lookups:.1%}")
+        
+        if self.sampler is not None:
+            lines.append(f"Sampling: 1/{self.sampler.rate} new flows, "
+                         f"{stats['sampled_out_packets']:,} packets shed")
+        
+        if self.capture_ring is not None:
+            ring = self.capture_ring.stats()
+            lines.append(f"Capture ring: Received={ring['received']:,}, "
+                         f"Kernel drops={ring['dropped']:,} "
+                         f"({safe_divide(ring['dropped'], ring['received']):.2%}), "
+                         f"Ring full={ring['freezes']:,}")
+        
+        if self.pipeline is not None:
+            ingest = self.pipeline.metrics()
+            lines.append(f"Ingest queue: Queued={ingest['queued']:,}, "
+                         f"Overflow={ingest['overflow']:,} "
+                         f"({safe_divide(ingest['overflow'], ingest['queued'] + ingest['overflow']):.2%}), "
+                         f"Depth={ingest['depth']:,}, "
+                         f"High water={ingest['high_water']:,}/{ingest['capacity']:,}, "
+                         f"Scoring stalls={ingest['stalls']:,}")
+        
+        if self.alert_groups is not None:
+            lines.append(f"Alert aggregation: {stats['aggregated_flows']:,} flows "
+                         f"folded into summary alerts")
         
-        if self.stats['attack_types']:
+        if self.early_scoring:
+            lines.append(f"Early alerts (open flows): {stats['early_alerts']:,}")
+        
+        if metrics is not None:
+            lines.append(f"Backend: Posts={stats['backend_posts']:,}, "
+                         f"Failures={stats['backend_failures']:,}, "
+                         f"Spilled={metrics['spilled']:,} (resent {metrics['resent']:,})")
+            lines.append(f"Backend queue: Depth={metrics['queue_depth']:,}, "
+                         f"Last batch={metrics['last_batch_size']:,}, "
+                         f"Avg latency={metrics['avg_latency_ms']:.1f}ms")
+        
+        if self.geo_cache is not None:
+            geo = self.geo_cache.metrics()
+            lines.append(f"GeoIP cache: Lookups={geo['lookups']:,}, "
+                         f"Hit rate={geo['hit_rate']:.1%}, "
+                         f"Prefix hits={geo['prefix_hits']:,}, "
+                         f"Skipped={geo['negative']:,}")
+        
+        if self.backend_url:
+            log_metrics = get_log_forwarder(self.backend_url).metrics()
+            lines.append(f"Log forwarding: Sent={log_metrics['sent']:,}, "
+                         f"Dropped={log_metrics['dropped']:,}, "
+                         f"Rejected={log_metrics['failed']:,}, "
+                         f"Posts={log_metrics['posts']:,}")
+        
+        if stats['attack_types']:
             lines.append(f"\nAttack Types Detected:")
-            for attack, count in sorted(self.stats['attack_types'].items(), 
+            for attack, count in sorted(stats['attack_types'].items(), 
                                        key=lambda x: x[1], reverse=True):
                 lines.append(f"  - {attack}: {count:,}")
         
-        lines.append(f"\nErrors: {self.stats['errors']:,}")
+        lines.append(f"\nErrors: {stats['errors']:,}")
         lines.append(f"{'='*70}\n")
         
         full_msg = "\n".join(lines)
         log_message(self.backend_url, full_msg)
 
-    def start_capture(self, interface=None, packet_count=0, filter_exp=None):
-        """Start packet capture"""
+    def start_capture(self, interface=None, packet_count=0, filter_exp=None, decoder='raw',
+                      capture='socket', ring_size=RING_SIZE, fanout_group=None):
+        """Start packet capture.
+
+        decoder='raw' reads undissected frames from a scapy L2 listen socket and
+        decodes them with ids_core.decoder; decoder='scapy' uses sniff() and
+        full scapy dissection. capture='ring' replaces the socket with an
+        AF_PACKET TPACKET_V3 ring (Linux, raw decoder only), optionally in
+        PACKET_FANOUT group fanout_group. The capture thread only decodes;
+        flow tracking and scoring run behind an IngestPipeline.
+        """
         log_message(self.backend_url, f"[*] Starting real-time intrusion detection...")
         log_message(self.backend_url, f"[*] Interface: {interface or 'default'}")
         log_message(self.backend_url, f"[*] Filter: {filter_exp or 'none'}")
+        log_message(self.backend_url, f"[*] Decoder: {decoder}")
+        if capture == 'ring':
+            fanout = f", fanout group {fanout_group}" if fanout_group is not None else ""
+            log_message(self.backend_url, f"[*] Capture: TPACKET_V3 ring, {ring_size >> 20} MiB{fanout}")
         log_message(self.backend_url, f"[*] Press Ctrl+C to stop\n")
+        # scapy is only imported for live capture (pcap replay never needs it)
+        from scapy.all import sniff
         
         def sighandler(sig, frame):
             print("\n" + "="*70)
             print("  SHUTTING DOWN GRACEFULLY")
             print("="*70)
             print("[*] Processing remaining flows...")
-            self.process_flows()
-            
-            if self.geoip_loaded and self.geo_reader:
-                try:
-                    self.geo_reader.close()
-                    print("[*] GeoIP database closed")
-                except:
-                    pass
-            
+            self.stop_pipeline()
+            self.close()
             self.print_stats()
             
             print(f"\n{'='*70}")
@@ -473,6 +1106,8 @@ class RealtimeIDS:
         
         signal.signal(signal.SIGINT, sighandler)
         
+        self.pipeline = IngestPipeline(self, self.ingest_queue_size, EARLY_SCORE_TICK).start()
+        
         def stats_printer():
             while True:
                 time.sleep(60)
@@ -481,8 +1116,15 @@ class RealtimeIDS:
         threading.Thread(target=stats_printer, daemon=True).start()
         
         try:
-            sniff(iface=interface, prn=self.process_packet,
-                  filter=filter_exp, count=packet_count, store=False)
+            if decoder == 'scapy':
+                sniff(iface=interface, prn=self._enqueue_packet,
+                      filter=filter_exp, count=packet_count, store=False)
+            elif capture == 'ring':
+                self._capture_ring(interface, packet_count, filter_exp, ring_size, fanout_group)
+            else:
+                self._capture_raw(interface, packet_count, filter_exp)
+            # Packet count reached: let the pipeline finish what is queued
+            self.stop_pipeline()
         except PermissionError:
             print(f"\n[!] Permission denied!")
             print("Run with elevated privileges (sudo/Administrator)\n")
@@ -490,3 +1132,117 @@ class RealtimeIDS:
         except Exception as e:
             print(f"\n[!] Error: {e}\n")
             sys.exit(1)
+
+    def _capture_raw(self, interface, packet_count, filter_exp):
+        """Read raw frames from a scapy L2 socket without dissecting them"""
+        from scapy.all import conf
+        sock = conf.L2listen(iface=interface, filter=filter_exp)
+        try:
+            captured = 0
+            while not packet_count or captured < packet_count:
+                layer, frame, ts = sock.recv_raw()
+                if frame is None:
+                    continue
+                captured += 1
+                self._enqueue_frame(frame, linktype_for_layer(layer), ts)
+        finally:
+            sock.close()
+
+    def _capture_ring(self, interface, packet_count, filter_exp, ring_size, fanout_group):
+        """Read frame blocks from a TPACKET_V3 ring; frames are decoded in place
+        before the block is handed back to the kernel"""
+        from scapy.all import conf
+        ring = PacketRing(interface or str(conf.iface), ring_size=ring_size,
+                          filter_exp=filter_exp, fanout_group=fanout_group)
+        self.capture_ring = ring
+        try:
+            captured = 0
+            while not packet_count or captured < packet_count:
+                frames = ring.read_block(timeout=1.0)
+                if not frames:
+                    continue
+                if packet_count:
+                    frames = frames[:packet_count - captured]
+                captured += len(frames)
+                linktype = ring.linktype
+                for ts, frame in frames:
+                    self._enqueue_frame(frame, linktype, ts)
+        finally:
+            ring.close()
+
+    def stop_pipeline(self):
+        """Finish live processing: the flow thread ingests the packets still
+        queued and runs a final sweep, which is scored before this returns.
+        Without a running pipeline this is a plain process_flows()."""
+        if self.pipeline is not None:
+            self.pipeline.close()
+        else:
+            self.process_flows()
+
+    def replay_pcaps(self, paths, packet_count=0, trust=None):
+        """Replay capture files through the pipeline using packet timestamps.
+
+        Flows are swept every save_interval seconds of capture time, and any
+        flows still open at the end of the replay are flushed. trust is an
+        optional sampling.TrustFilter; packets it excludes are skipped as the
+        BPF whitelist would drop them in live capture (they are not counted).
+        """
+        log_message(self.backend_url, f"[*] Replaying {len(paths)} capture file(s)...")
+        
+        wall_start = time.time()
+        flows_before = self.score_stats['total_flows']
+        replayed = 0
+        next_sweep = None
+        next_score = None
+        last_ts = None
+        
+        for path in paths:
+            log_message(self.backend_url, f"[*] Reading {path}")
+            try:
+                for ts, linktype, frame in iter_pcap(path):
+                    if packet_count and replayed >= packet_count:
+                        break
+                    decoded = decode_frame(frame, linktype)
+                    if trust and decoded is not None and trust.excludes(decoded):
+                        continue
+                    replayed += 1
+                    if replayed == 1:
+                        self.log_first_packet()
+                    
+                    if next_sweep is None:
+                        next_sweep = ts + self.save_interval
+                    elif ts >= next_sweep:
+                        self.process_flows(now=ts)
+                        next_sweep = ts + self.save_interval
+                    if self.early_scoring:
+                        if next_score is None or ts >= next_score:
+                            self.score_flows(now=ts)
+                            next_score = ts + EARLY_SCORE_TICK
+                    last_ts = ts
+                    
+                    if self.sampler is not None and replayed % LOAD_CHECK_PACKETS == 0:
+                        self.check_load()
+                    
+                    with self.lock:
+                        start = None
+                        if self.packet_seconds is not None and self.packets_processed % PACKET_TIMING_EVERY == 0:
+                            start = time.perf_counter()
+                        self.packets_processed += 1
+                        self.stats['total_packets'] += 1
+                        if decoded is not None:
+                            self._ingest(ts, *decoded)
+                        if start is not None:
+                            self.packet_seconds.observe(time.perf_counter() - start)
+            except (OSError, ValueError) as e:
+                self.stats['errors'] += 1
+                print(f"[!] Error reading {path}: {e}")
+        
+        # Flush everything that is still open at the end of the capture
+        if last_ts is not None:
+            self.process_flows(now=last_ts + self.flow_timeout + 1)
+        
+        elapsed = max(time.time() - wall_start, 1e-9)
+        flows = self.score_stats['total_flows'] - flows_before
+        log_message(self.backend_url, f"\n[+] Replay finished in {elapsed:.2f}s")
+        log_message(self.backend_url, f"    - Packets: {replayed:,} ({replayed / elapsed:,.0f} packets/s)")
+        log_message(self.backend_url, f"    - Flows:   {flows:,} ({flows / elapsed:,.0f} flows/s)")
@@ -1,46 +1,120 @@
 """
 Feature extraction logic.
 """
-import numpy as np
+import math
 from .utils import safe_divide
 
-def calc_stats(values):
-    if not values:
-        return {'max': 0, 'min': 0, 'mean': 0, 'std': 0, 'total': 0}
-    arr = np.array(values, dtype=float)
-    arr = arr[np.isfinite(arr)]
-    if len(arr) == 0:
+class RunningStats:
+    """Online count/sum/min/max/mean/variance accumulator (Welford's method).
+
+    Constant memory regardless of how many values are added.
+    """
+    __slots__ = ('count', 'total', 'min', 'max', 'mean', 'm2')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = 0.0
+        self.max = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        n = self.count + 1
+        self.count = n
+        self.total += x
+        if n == 1:
+            self.min = self.max = x
+        elif x < self.min:
+            self.min = x
+        elif x > self.max:
+            self.max = x
+        delta = x - self.mean
+        self.mean += delta / n
+        self.m2 += delta * (x - self.mean)
+
+    def merged(self, other):
+        """Return a new accumulator combining both (Chan et al. parallel update)"""
+        if not other.count:
+            return self._copy()
+        if not self.count:
+            return other._copy()
+        out = RunningStats()
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        out.count = n
+        out.total = self.total + other.total
+        out.min = min(self.min, other.min)
+        out.max = max(self.max, other.max)
+        out.mean = self.mean + delta * other.count / n
+        out.m2 = self.m2 + other.m2 + delta * delta * self.count * other.count / n
+        return out
+
+    def _copy(self):
+        out = RunningStats()
+        out.count, out.total, out.min, out.max, out.mean, out.m2 = (
+            self.count, self.total, self.min, self.max, self.mean, self.m2)
+        return out
+
+    @property
+    def std(self):
+        """Population standard deviation (same as np.std)"""
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(max(self.m2, 0.0) / self.count)
+
+def calc_stats(acc):
+    """Finished statistics of a RunningStats accumulator"""
+    if not acc.count:
         return {'max': 0, 'min': 0, 'mean': 0, 'std': 0, 'total': 0}
     return {
-        'max': float(np.max(arr)), 'min': float(np.min(arr)),
-        'mean': float(np.mean(arr)),
-        'std': float(np.std(arr)) if len(arr) > 1 else 0.0,
-        'total': float(np.sum(arr))
+        'max': float(acc.max), 'min': float(acc.min),
+        'mean': float(acc.mean), 'std': acc.std,
+        'total': float(acc.total)
     }
 
+def bulk_stats(bulk):
+    """(avg bytes per bulk, avg packets per bulk, bulk rate in bytes/s) of a
+    flow direction's BulkState (zeros when it never carried a bulk)"""
+    if bulk is None or not bulk.bulks:
+        return 0, 0, 0
+    return (bulk.bytes / bulk.bulks, bulk.packets / bulk.bulks,
+            safe_divide(bulk.bytes, bulk.duration))
+
+def active_periods(f):
+    """Active-period accumulator including the period still in progress"""
+    current = f.end_active - f.start_active
+    if current <= 0:
+        return f.active_times
+    ongoing = RunningStats()
+    ongoing.add(current)
+    return f.active_times.merged(ongoing)
+
 def extract_features(f):
     """Extract features in EXACT order"""
     try:
-        dur = max(f['last_time'] - f['start_time'], 0.000001)
-        tot_pkt = f['fwd_packets'] + f['bwd_packets']
-        tot_bytes = f['fwd_bytes'] + f['bwd_bytes']
+        dur = max(f.last_time - f.start_time, 0.000001)
+        tot_pkt = f.total_packets
+        tot_bytes = f.total_bytes
         
-        fwd_pkt_stats = calc_stats(f['fwd_packet_lengths'])
-        bwd_pkt_stats = calc_stats(f['bwd_packet_lengths'])
-        pkt_stats = calc_stats(f['all_packet_lengths'])
-        flow_iat_stats = calc_stats(f['flow_iat'])
-        fwd_iat_stats = calc_stats(f['fwd_iat'])
-        bwd_iat_stats = calc_stats(f['bwd_iat'])
-        active_stats = calc_stats(f['active_times'])
-        idle_stats = calc_stats(f['idle_times'])
+        fwd_pkt_stats = calc_stats(f.fwd_packet_lengths)
+        bwd_pkt_stats = calc_stats(f.bwd_packet_lengths)
+        pkt_stats = calc_stats(f.fwd_packet_lengths.merged(f.bwd_packet_lengths))
+        flow_iat_stats = calc_stats(f.flow_iat)
+        fwd_iat_stats = calc_stats(f.fwd_iat)
+        bwd_iat_stats = calc_stats(f.bwd_iat)
+        active_stats = calc_stats(active_periods(f))
+        idle_stats = calc_stats(f.idle_times)
+        fwd_bulk_bytes, fwd_bulk_packets, fwd_bulk_rate = bulk_stats(f.fwd_bulk)
+        bwd_bulk_bytes, bwd_bulk_packets, bwd_bulk_rate = bulk_stats(f.bwd_bulk)
         
         features = {
-            "Destination Port": int(f['dst_port']),
+            "Destination Port": int(f.dst_port),
             "Flow Duration": dur * 1e6,
-            "Total Fwd Packets": int(f['fwd_packets']),
-            "Total Backward Packets": int(f['bwd_packets']),
-            "Total Length of Fwd Packets": int(f['fwd_bytes']),
-            "Total Length of Bwd Packets": int(f['bwd_bytes']),
+            "Total Fwd Packets": int(f.fwd_packets),
+            "Total Backward Packets": int(f.bwd_packets),
+            "Total Length of Fwd Packets": int(f.fwd_bytes),
+            "Total Length of Bwd Packets": int(f.bwd_bytes),
             "Fwd Packet Length Max": fwd_pkt_stats['max'],
             "Fwd Packet Length Min": fwd_pkt_stats['min'],
             "Fwd Packet Length Mean": fwd_pkt_stats['mean'],
@@ -65,45 +139,45 @@ def extract_features(f):
             "Bwd IAT Std": bwd_iat_stats['std'] * 1e6,
             "Bwd IAT Max": bwd_iat_stats['max'] * 1e6,
             "Bwd IAT Min": bwd_iat_stats['min'] * 1e6,
-            "Fwd PSH Flags": int(f['fwd_psh_flags']),
-            "Bwd PSH Flags": int(f['bwd_psh_flags']),
-            "Fwd URG Flags": int(f['fwd_urg_flags']),
-            "Bwd URG Flags": int(f['bwd_urg_flags']),
-            "Fwd Header Length": int(f['fwd_header_bytes']),
-            "Bwd Header Length": int(f['bwd_header_bytes']),
-            "Fwd Packets/s": safe_divide(f['fwd_packets'], dur),
-            "Bwd Packets/s": safe_divide(f['bwd_packets'], dur),
+            "Fwd PSH Flags": int(f.fwd_psh_flags),
+            "Bwd PSH Flags": int(f.bwd_psh_flags),
+            "Fwd URG Flags": int(f.fwd_urg_flags),
+            "Bwd URG Flags": int(f.bwd_urg_flags),
+            "Fwd Header Length": int(f.fwd_header_bytes),
+            "Bwd Header Length": int(f.bwd_header_bytes),
+            "Fwd Packets/s": safe_divide(f.fwd_packets, dur),
+            "Bwd Packets/s": safe_divide(f.bwd_packets, dur),
             "Min Packet Length": pkt_stats['min'],
             "Max Packet Length": pkt_stats['max'],
             "Packet Length Mean": pkt_stats['mean'],
             "Packet Length Std": pkt_stats['std'],
             "Packet Length Variance": pkt_stats['std'] ** 2,
-            "FIN Flag Count": int(f['fin_count']),
-            "SYN Flag Count": int(f['syn_count']),
-            "RST Flag Count": int(f['rst_count']),
-            "PSH Flag Count": int(f['psh_count']),
-            "ACK Flag Count": int(f['ack_count']),
-            "URG Flag Count": int(f['urg_count']),
-            "CWE Flag Count": int(f['cwe_count']),
-            "ECE Flag Count": int(f['ece_count']),
-            "Down/Up Ratio": safe_divide(f['bwd_packets'], f['fwd_packets']),
+            "FIN Flag Count": int(f.fin_count),
+            "SYN Flag Count": int(f.syn_count),
+            "RST Flag Count": int(f.rst_count),
+            "PSH Flag Count": int(f.psh_count),
+            "ACK Flag Count": int(f.ack_count),
+            "URG Flag Count": int(f.urg_count),
+            "CWE Flag Count": int(f.cwe_count),
+            "ECE Flag Count": int(f.ece_count),
+            "Down/Up Ratio": safe_divide(f.bwd_packets, f.fwd_packets),
             "Average Packet Size": safe_divide(tot_bytes, tot_pkt),
-            "Avg Fwd Segment Size": safe_divide(f['fwd_bytes'], f['fwd_packets']),
-            "Avg Bwd Segment Size": safe_divide(f['bwd_bytes'], f['bwd_packets']),
-            "Fwd Header Length.1": int(f['fwd_header_bytes']),  # Renamed to avoid duplicate
-            "Fwd Avg Bytes/Bulk": 0,
-            "Fwd Avg Packets/Bulk": 0,
-            "Fwd Avg Bulk Rate": 0,
-            "Bwd Avg Bytes/Bulk": 0,
-            "Bwd Avg Packets/Bulk": 0,
-            "Bwd Avg Bulk Rate": 0,
-            "Subflow Fwd Packets": int(f['fwd_packets']),
-            "Subflow Fwd Bytes": int(f['fwd_bytes']),
-            "Subflow Bwd Packets": int(f['bwd_packets']),
-            "Subflow Bwd Bytes": int(f['bwd_bytes']),
-            "Init_Win_bytes_forward": int(f['init_win_bytes_fwd']),
-            "Init_Win_bytes_backward": int(f['init_win_bytes_bwd']),
-            "act_data_pkt_fwd": int(max(0, f['fwd_packets'] - f['syn_count'] - f['fin_count'])),
+            "Avg Fwd Segment Size": safe_divide(f.fwd_bytes, f.fwd_packets),
+            "Avg Bwd Segment Size": safe_divide(f.bwd_bytes, f.bwd_packets),
+            "Fwd Header Length.1": int(f.fwd_header_bytes),  # Renamed to avoid duplicate
+            "Fwd Avg Bytes/Bulk": fwd_bulk_bytes,
+            "Fwd Avg Packets/Bulk": fwd_bulk_packets,
+            "Fwd Avg Bulk Rate": fwd_bulk_rate,
+            "Bwd Avg Bytes/Bulk": bwd_bulk_bytes,
+            "Bwd Avg Packets/Bulk": bwd_bulk_packets,
+            "Bwd Avg Bulk Rate": bwd_bulk_rate,
+            "Subflow Fwd Packets": int(f.fwd_packets),
+            "Subflow Fwd Bytes": int(f.fwd_bytes),
+            "Subflow Bwd Packets": int(f.bwd_packets),
+            "Subflow Bwd Bytes": int(f.bwd_bytes),
+            "Init_Win_bytes_forward": int(f.init_win_bytes_fwd),
+            "Init_Win_bytes_backward": int(f.init_win_bytes_bwd),
+            "act_data_pkt_fwd": int(max(0, f.fwd_packets - f.syn_count - f.fin_count)),
             "min_seg_size_forward": fwd_pkt_stats['min'] if fwd_pkt_stats['min'] > 0 else 20,
             "Active Mean": active_stats['mean'] * 1e6,
             "Active Std": active_stats['std'] * 1e6,
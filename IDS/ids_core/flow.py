@@ -0,0 +1,202 @@
+"""
+Compact per-flow state.
+"""
+from .config import (TCP_FIN, TCP_SYN, TCP_RST, TCP_PSH, TCP_ACK, TCP_URG,
+                     TCP_ECE, TCP_CWR)
+from .features import RunningStats
+from .utils import get_flow_key
+
+# Shared empty accumulator standing in for active/idle series until a flow
+# first goes idle (replaced, never updated)
+_NO_SAMPLES = RunningStats()
+
+# CICFlowMeter defaults: a gap longer than ACTIVITY_TIMEOUT seconds ends an
+# active period; BULK_MIN_PACKETS payload packets in one direction, each
+# within BULK_MAX_GAP seconds of the last and with no payload from the
+# other side in between, make a bulk transfer
+ACTIVITY_TIMEOUT = 5.0
+BULK_MIN_PACKETS = 4
+BULK_MAX_GAP = 1.0
+
+
+class BulkState:
+    """Bulk-transfer detector for one direction of a flow.
+
+    The current run of payload packets is tracked in four fields; once it
+    reaches BULK_MIN_PACKETS it is counted as a bulk and every further
+    packet of the run extends it. Only totals are kept.
+    """
+    __slots__ = ('run_start', 'last', 'run_packets', 'run_bytes',
+                 'bulks', 'packets', 'bytes', 'duration')
+
+    def __init__(self):
+        self.run_start = 0.0  # time of the current run's first packet
+        self.last = 0.0       # time of the last payload packet
+        self.run_packets = self.run_bytes = 0
+        self.bulks = self.packets = self.bytes = 0
+        self.duration = 0.0
+
+    def add(self, ts, size, other_last):
+        """Account a payload packet; other_last is the time of the other
+        direction's last payload packet (0 if none)"""
+        if (not self.run_packets or other_last > self.run_start or
+                ts - self.last > BULK_MAX_GAP):
+            self.run_start = ts
+            self.run_packets = 1
+            self.run_bytes = size
+        else:
+            self.run_packets += 1
+            self.run_bytes += size
+            if self.run_packets == BULK_MIN_PACKETS:
+                self.bulks += 1
+                self.packets += self.run_packets
+                self.bytes += self.run_bytes
+                self.duration += ts - self.run_start
+            elif self.run_packets > BULK_MIN_PACKETS:
+                self.packets += 1
+                self.bytes += size
+                self.duration += ts - self.last
+        self.last = ts
+
+
+class FlowRecord:
+    """Bidirectional flow state.
+
+    Uses __slots__ instead of a per-flow dict. Packet lengths and
+    inter-arrival times are folded into RunningStats accumulators as packets
+    arrive, so memory per flow is constant however many packets it carries.
+    Active/idle periods and bulk transfers are segmented the way
+    CICFlowMeter does it, as small state machines feeding the same kind of
+    accumulators; their state objects are only allocated once a flow first
+    goes idle or carries payload.
+    """
+    __slots__ = (
+        'key', 'src_ip', 'dst_ip', 'src_port', 'dst_port', 'protocol',
+        'start_time', 'last_time', 'last_fwd_packet_time', 'last_bwd_packet_time',
+        'fwd_packets', 'bwd_packets', 'fwd_bytes', 'bwd_bytes',
+        'fwd_header_bytes', 'bwd_header_bytes',
+        'fwd_packet_lengths', 'bwd_packet_lengths',
+        'fwd_iat', 'bwd_iat', 'flow_iat',
+        'fwd_psh_flags', 'bwd_psh_flags', 'fwd_urg_flags', 'bwd_urg_flags',
+        'fin_count', 'syn_count', 'rst_count', 'psh_count',
+        'ack_count', 'urg_count', 'cwe_count', 'ece_count',
+        'init_win_bytes_fwd', 'init_win_bytes_bwd',
+        'active_times', 'idle_times', 'start_active', 'end_active',
+        'fwd_bulk', 'bwd_bulk', 'deadline',
+        'next_score_packets', 'next_score_time', 'score_backoff', 'early_label',
+    )
+
+    def __init__(self, key, src_ip, dst_ip, src_port, dst_port, protocol, ts):
+        self.key = key  # flow-table key, see utils.flow_key()
+        self.src_ip = src_ip
+        self.dst_ip = dst_ip
+        self.src_port = src_port
+        self.dst_port = dst_port
+        self.protocol = protocol
+        self.start_time = ts
+        self.last_time = ts
+        self.last_fwd_packet_time = None
+        self.last_bwd_packet_time = None
+        self.fwd_packets = self.bwd_packets = 0
+        self.fwd_bytes = self.bwd_bytes = 0
+        self.fwd_header_bytes = self.bwd_header_bytes = 0
+        self.fwd_packet_lengths = RunningStats()
+        self.bwd_packet_lengths = RunningStats()
+        self.fwd_iat = RunningStats()
+        self.bwd_iat = RunningStats()
+        self.flow_iat = RunningStats()
+        self.fwd_psh_flags = self.bwd_psh_flags = 0
+        self.fwd_urg_flags = self.bwd_urg_flags = 0
+        self.fin_count = self.syn_count = self.rst_count = self.psh_count = 0
+        self.ack_count = self.urg_count = self.cwe_count = self.ece_count = 0
+        self.init_win_bytes_fwd = self.init_win_bytes_bwd = 0
+        self.active_times = _NO_SAMPLES
+        self.idle_times = _NO_SAMPLES
+        self.start_active = self.end_active = ts  # current active period
+        self.fwd_bulk = self.bwd_bulk = None
+        self.deadline = None  # idle expiry deadline, maintained by FlowTable
+        # In-flow (early) scoring schedule, maintained by the detector
+        self.next_score_packets = self.next_score_time = float('inf')
+        self.score_backoff = 1
+        self.early_label = None  # attack type already alerted on early
+
+    @property
+    def flow_id(self):
+        return get_flow_key(self.src_ip, self.dst_ip, self.src_port, self.dst_port,
+                            self.protocol)
+
+    @property
+    def total_packets(self):
+        return self.fwd_packets + self.bwd_packets
+
+    @property
+    def total_bytes(self):
+        return self.fwd_bytes + self.bwd_bytes
+
+    def update(self, src_ip, src_port, hdr_len, pkt_len, ts, tcp_flags, payload_len):
+        """Account one packet to the flow"""
+        is_fwd = (src_ip == self.src_ip and src_port == self.src_port)
+
+        if self.fwd_packets + self.bwd_packets > 0:
+            self.flow_iat.add(ts - self.last_time)
+
+        if ts - self.end_active > ACTIVITY_TIMEOUT:
+            # Idle gap: close the active period and record both
+            if self.idle_times is _NO_SAMPLES:
+                self.active_times = RunningStats()
+                self.idle_times = RunningStats()
+            if self.end_active > self.start_active:
+                self.active_times.add(self.end_active - self.start_active)
+            self.idle_times.add(ts - self.end_active)
+            self.start_active = ts
+        self.end_active = ts
+
+        if payload_len > 0:
+            fwd_bulk, bwd_bulk = self.fwd_bulk, self.bwd_bulk
+            if is_fwd:
+                if fwd_bulk is None:
+                    fwd_bulk = self.fwd_bulk = BulkState()
+                fwd_bulk.add(ts, payload_len, bwd_bulk.last if bwd_bulk is not None else 0.0)
+            else:
+                if bwd_bulk is None:
+                    bwd_bulk = self.bwd_bulk = BulkState()
+                bwd_bulk.add(ts, payload_len, fwd_bulk.last if fwd_bulk is not None else 0.0)
+
+        if is_fwd:
+            if self.last_fwd_packet_time:
+                self.fwd_iat.add(ts - self.last_fwd_packet_time)
+            self.last_fwd_packet_time = ts
+            self.fwd_packets += 1
+            self.fwd_bytes += pkt_len
+            self.fwd_header_bytes += hdr_len
+            self.fwd_packet_lengths.add(pkt_len)
+        else:
+            if self.last_bwd_packet_time:
+                self.bwd_iat.add(ts - self.last_bwd_packet_time)
+            self.last_bwd_packet_time = ts
+            self.bwd_packets += 1
+            self.bwd_bytes += pkt_len
+            self.bwd_header_bytes += hdr_len
+            self.bwd_packet_lengths.add(pkt_len)
+
+        self.last_time = ts
+
+        if tcp_flags:
+            if tcp_flags & TCP_FIN: self.fin_count += 1
+            if tcp_flags & TCP_SYN: self.syn_count += 1
+            if tcp_flags & TCP_RST: self.rst_count += 1
+            if tcp_flags & TCP_PSH:
+                self.psh_count += 1
+                if is_fwd:
+                    self.fwd_psh_flags += 1
+                else:
+                    self.bwd_psh_flags += 1
+            if tcp_flags & TCP_ACK: self.ack_count += 1
+            if tcp_flags & TCP_URG:
+                self.urg_count += 1
+                if is_fwd:
+                    self.fwd_urg_flags += 1
+                else:
+                    self.bwd_urg_flags += 1
+            if tcp_flags & TCP_CWR: self.cwe_count += 1
+            if tcp_flags & TCP_ECE: self.ece_count += 1
@@ -0,0 +1,96 @@
+"""
+Flow table with an expiry index.
+"""
+import heapq
+from itertools import count
+
+
+class FlowTable:
+    """Active flows keyed by canonical flow key.
+
+    Idle expiry uses a lazy min-heap of (deadline, seq, key) with at most one
+    live entry per flow: entries are pushed when a flow is created and only
+    re-pushed when a popped deadline turns out to be stale because the flow
+    saw more packets. Flows that saw FIN or RST go on an immediate ready
+    queue. A sweep therefore only touches flows that are actually due.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._flows = {}
+        self._heap = []
+        self._ready = {}  # insertion-ordered set of keys
+        self._retry = []  # requeued (key, flow) whose key a newer flow took
+        self._seq = count()
+
+    def __len__(self):
+        return len(self._flows)
+
+    def __contains__(self, key):
+        return key in self._flows
+
+    def __iter__(self):
+        return iter(self._flows)
+
+    def get(self, key):
+        return self._flows.get(key)
+
+    def items(self):
+        return self._flows.items()
+
+    def values(self):
+        return self._flows.values()
+
+    def add(self, key, flow):
+        """Insert a new flow and schedule its idle deadline"""
+        self._flows[key] = flow
+        self._schedule(key, flow, flow.last_time + self.timeout)
+
+    def mark_ready(self, key):
+        """Expire the flow at the next sweep (FIN/RST seen)"""
+        self._ready[key] = None
+
+    def requeue(self, key, flow):
+        """Put back a flow popped by pop_due() so the next sweep retries it.
+
+        If packets of the same 5-tuple opened a newer flow under key in the
+        meantime, that flow stays in the table and the requeued one waits
+        outside it until the next pop_due().
+        """
+        if key in self._flows:
+            self._retry.append((key, flow))
+            return
+        self._flows[key] = flow
+        self._ready[key] = None
+
+    def pop_due(self, now):
+        """Remove and return [(key, flow)] for FIN/RST flows and flows idle past the timeout"""
+        flows = self._flows
+        due = self._retry
+        self._retry = []
+
+        for key in self._ready:
+            flow = flows.pop(key, None)
+            if flow is not None:
+                due.append((key, flow))
+        self._ready.clear()
+
+        heap = self._heap
+        while heap and heap[0][0] < now:
+            deadline, _, key = heapq.heappop(heap)
+            flow = flows.get(key)
+            if flow is None or flow.deadline != deadline:
+                continue  # flow already expired, or key reused by a newer flow
+
+            deadline = flow.last_time + self.timeout
+            if deadline < now:
+                del flows[key]
+                due.append((key, flow))
+            else:
+                self._schedule(key, flow, deadline)
+
+        return due
+
+    def _schedule(self, key, flow, deadline):
+        flow.deadline = deadline
+        heapq.heappush(self._heap, (deadline, next(self._seq), key))
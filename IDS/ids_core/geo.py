@@ -1,26 +1,119 @@
 """
 Geolocation lookup functions.
 """
-from geoip2.errors import AddressNotFoundError
+import ipaddress
 
-def get_geolocation(ip, reader=None):
-    """Lookup IP geolocation using GeoIP2"""
+from .utils import LRUCache
+
+# Reader open modes accepted by open_geo_reader() -> geoip2.database constant
+GEOIP_MODES = {
+    'auto': 'MODE_AUTO',
+    'mmap': 'MODE_MMAP',
+    'memory': 'MODE_MEMORY',
+    'file': 'MODE_FILE',
+}
+
+# Networks sharing one prefix-cache entry
+IPV4_PREFIX_LEN = 24
+IPV6_PREFIX_LEN = 48
+
+def open_geo_reader(path, mode='auto'):
+    """Open a GeoIP2 database; mode='mmap' maps the file instead of reading it"""
+    import geoip2.database  # only needed once there is a database to open
+    return geoip2.database.Reader(path, mode=getattr(geoip2.database, GEOIP_MODES[mode]))
+
+def get_geolocation(ip, reader=None, cache=None):
+    """Lookup IP geolocation using GeoIP2 (through cache when given)"""
+    if cache is not None:
+        return cache.lookup(ip)
     if not reader:
         return default_geo_data()
-    
+
     try:
         response = reader.city(ip)
+        return _geo_from_response(response)
+    except Exception:
+        # AddressNotFoundError included
+        return default_geo_data()
+
+def _geo_from_response(response):
+    return {
+        'country_code': response.country.iso_code or 'Unknown',
+        'country_name': response.country.name or 'Unknown',
+        'city': response.city.name or 'Unknown',
+        'latitude': response.location.latitude or 0.0,
+        'longitude': response.location.longitude or 0.0
+    }
+
+class GeoCache:
+    """Cached GeoIP lookups.
+
+    Results are cached per IP in a bounded LRU. Behind it sits a prefix
+    cache keyed by /24 (IPv4) or /48 (IPv6): a database record whose network
+    covers the whole prefix answers every other address in it. Private,
+    reserved and unparsable addresses never reach the reader, and addresses
+    the database does not know are cached as 'Unknown'. Returned dicts are
+    shared between callers and must not be modified.
+    """
+
+    def __init__(self, reader, maxsize=65536, ttl=None):
+        self.reader = reader
+        self.ips = LRUCache(maxsize, ttl)
+        self.prefixes = LRUCache(maxsize, ttl)
+        self.negative = 0        # private / reserved / invalid, reader skipped
+        self.reader_lookups = 0
+        self._unknown = default_geo_data()
+        from geoip2.errors import AddressNotFoundError
+        self._not_found = AddressNotFoundError
+
+    def lookup(self, ip):
+        geo = self.ips.get(ip)
+        if geo is not None:
+            return geo
+
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            self.negative += 1
+            return self._unknown
+        if not addr.is_global or self.reader is None:
+            self.negative += 1
+            self.ips.put(ip, self._unknown)
+            return self._unknown
+
+        prefix_len = IPV4_PREFIX_LEN if addr.version == 4 else IPV6_PREFIX_LEN
+        prefix = (addr.version, int(addr) >> (addr.max_prefixlen - prefix_len))
+        geo = self.prefixes.get(prefix)
+        if geo is not None:
+            self.ips.put(ip, geo)
+            return geo
+
+        self.reader_lookups += 1
+        try:
+            response = self.reader.city(ip)
+            geo = _geo_from_response(response)
+            network = response.traits.network
+        except self._not_found as e:
+            geo = self._unknown
+            network = e.network
+        except Exception:
+            return default_geo_data()
+
+        if network is not None and network.prefixlen <= prefix_len:
+            self.prefixes.put(prefix, geo)
+        self.ips.put(ip, geo)
+        return geo
+
+    def metrics(self):
+        lookups = self.ips.hits + self.ips.misses
         return {
-            'country_code': response.country.iso_code or 'Unknown',
-            'country_name': response.country.name or 'Unknown',
-            'city': response.city.name or 'Unknown',
-            'latitude': response.location.latitude or 0.0,
-            'longitude': response.location.longitude or 0.0
+            'lookups': lookups,
+            'ip_hits': self.ips.hits,
+            'prefix_hits': self.prefixes.hits,
+            'negative': self.negative,
+            'reader_lookups': self.reader_lookups,
+            'hit_rate': (lookups - self.reader_lookups) / lookups if lookups else 0.0,
         }
-    except AddressNotFoundError:
-        return default_geo_data()
-    except Exception as e:
-        return default_geo_data()
 
 def default_geo_data():
     """Return default geolocation data"""
@@ -0,0 +1,170 @@
+"""
+Compiled tree-ensemble inference.
+"""
+import numpy as np
+
+# Levels walked between removals of finished (row, tree) pairs
+COMPACT_EVERY = 4
+# Batch size from which scikit-learn's predict_proba is faster than
+# CompiledForest per flow (benchmarks/bench_inference.py: 1.3x faster
+# compiled at 256 rows, 0.9x at 1024, 0.6x at 4096)
+SKLEARN_MIN_ROWS = 512
+# Rows CompiledForest walks at once; larger batches are split, as the
+# per-flow cost no longer drops but the (row, tree) arrays keep growing
+COMPILED_MAX_ROWS = 1024
+
+
+class CompiledForest:
+    """NumPy re-implementation of a fitted scikit-learn tree ensemble.
+
+    At construction every tree of a RandomForestClassifier /
+    ExtraTreesClassifier (or a single DecisionTreeClassifier) is flattened
+    into shared arrays of split features, thresholds and global child
+    indices, plus one row of normalized class probabilities per node. A
+    batch is evaluated for all trees at once: the current node of every
+    (row, tree) pair advances one level per step, with leaves pointing to
+    themselves, until every pair has reached a leaf.
+
+    predict_proba() and classes_ are drop-in replacements for the sklearn
+    model. Inputs are compared as float32 against float64 thresholds and
+    tree probabilities are summed in estimator order, like sklearn does.
+    """
+
+    # Arrays that fully describe a compiled forest (saved by ids_core.bundle)
+    ARRAYS = ('feature', 'threshold', 'children', 'is_leaf', 'value', 'roots', 'classes_')
+
+    def __init__(self, model):
+        estimators = getattr(model, 'estimators_', None)
+        if estimators is None:
+            estimators = [model]
+        if getattr(model, 'n_outputs_', 1) != 1:
+            raise ValueError("Multi-output models are not supported")
+
+        self.classes_ = model.classes_
+        self.n_features_in_ = model.n_features_in_
+        self.n_trees = len(estimators)
+
+        features, thresholds, left, right, leaves, values, roots = [], [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for est in estimators:
+            tree = est.tree_
+            is_leaf = tree.children_left < 0
+            node_ids = np.arange(tree.node_count) + offset
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            left.append(np.where(is_leaf, node_ids, tree.children_left + offset))
+            right.append(np.where(is_leaf, node_ids, tree.children_right + offset))
+            leaves.append(is_leaf)
+
+            value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(value / normalizer)
+
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds).astype(np.float64)
+        # children[2 * node + go_left]: right child, then left child
+        self.children = np.stack([np.concatenate(right), np.concatenate(left)],
+                                 axis=1).ravel().astype(np.intp)
+        self.is_leaf = np.concatenate(leaves)
+        self.value = np.concatenate(values)
+        self.roots = np.array(roots, dtype=np.intp)
+        self.max_depth = max_depth
+        self.node_count = offset
+
+    @classmethod
+    def from_arrays(cls, arrays, n_features_in, max_depth):
+        """Rebuild a compiled forest from its ARRAYS, which may be read-only
+        memory maps (nothing is copied)"""
+        forest = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(forest, name, arrays[name])
+        forest.n_features_in_ = n_features_in
+        forest.n_trees = len(forest.roots)
+        forest.max_depth = max_depth
+        forest.node_count = len(forest.feature)
+        return forest
+
+    def apply(self, X):
+        """Leaf index (global) reached by each row in each tree, shape (n, trees)"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n = X.shape[0]
+        flat = X.ravel()
+
+        # One entry per (row, tree) pair; rows whose walk already ended in a
+        # leaf are dropped from the working set every few levels
+        nodes = np.tile(self.roots, n)
+        row_base = np.repeat(np.arange(n, dtype=np.intp) * X.shape[1], self.n_trees)
+        active = None
+        current, base = nodes, row_base
+        for depth in range(self.max_depth):
+            go_left = flat[base + self.feature[current]] <= self.threshold[current]
+            current = self.children[2 * current + go_left]
+            if depth % COMPACT_EVERY == COMPACT_EVERY - 1 and depth + 1 < self.max_depth:
+                still_internal = ~self.is_leaf[current]
+                if active is None:
+                    nodes = current
+                    active = np.flatnonzero(still_internal)
+                else:
+                    nodes[active] = current
+                    active = active[still_internal]
+                current, base = nodes[active], row_base[active]
+                if not len(active):
+                    break
+
+        if active is None:
+            nodes = current
+        else:
+            nodes[active] = current
+        return nodes.reshape(n, self.n_trees)
+
+    def predict_proba(self, X):
+        if len(X) > COMPILED_MAX_ROWS:
+            return np.concatenate([self.predict_proba(X[i:i + COMPILED_MAX_ROWS])
+                                   for i in range(0, len(X), COMPILED_MAX_ROWS)])
+        leaves = self.apply(X)
+        proba = self.value[leaves[:, 0]].copy()
+        for t in range(1, self.n_trees):
+            proba += self.value[leaves[:, t]]
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+class BatchRouter:
+    """predict_proba() through the CompiledForest for batches smaller than
+    min_sklearn_rows and through the scikit-learn model from there on, each
+    engine where it is faster. Other attributes are the compiled forest's."""
+
+    def __init__(self, compiled, model, min_sklearn_rows=SKLEARN_MIN_ROWS):
+        self.compiled = compiled
+        self.model = model
+        self.min_sklearn_rows = min_sklearn_rows
+
+    def __getattr__(self, name):
+        return getattr(self.compiled, name)
+
+    def predict_proba(self, X):
+        if len(X) >= self.min_sklearn_rows:
+            return self.model.predict_proba(X)
+        return self.compiled.predict_proba(X)
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def compile_model(model):
+    """CompiledForest for model, or None if it cannot be compiled"""
+    try:
+        return CompiledForest(model)
+    except (AttributeError, ValueError) as e:
+        print(f"    ⚠ Model cannot be compiled ({e}), using scikit-learn inference")
+        return None
@@ -0,0 +1,294 @@
+"""
+Runtime metrics and the Prometheus text-format /metrics endpoint.
+
+Counters, gauges and histograms live in a Registry. Metrics updated on the
+hot path are plain Python objects without locks: an observation is a
+bisect into the bucket bounds and three additions, and concurrent updates
+from several threads may (rarely) lose an increment. Values that already
+exist elsewhere (stats_snapshot(), queue depths, cache counters) are exported
+through callbacks evaluated at scrape time instead of being mirrored.
+"""
+import time
+import threading
+
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def exponential_buckets(start, factor, count):
+    # Rounded so bucket labels read 2.5e-06 rather than 2.4999999999999998e-06
+    return tuple(float(f'{start * factor ** i:.6g}') for i in range(count))
+
+
+# 1 us .. ~16 s in x2.5 steps, for anything timed in seconds
+LATENCY_BUCKETS = exponential_buckets(1e-6, 2.5, 19)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [(n, v) for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+               for _, v in pairs)
+    return '{' + ','.join(f'{n}="{v}"' for (n, _), v in zip(pairs, escaped)) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), fn=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        self._children = {}
+        if not self.labelnames and fn is None:
+            self._default = self._children[()] = self._new_child()
+
+    def labels(self, *values):
+        """Child metric for one combination of label values"""
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self):
+        """(suffix, label values, extra label, value) tuples for rendering"""
+        if self.fn is not None:
+            value = self.fn()
+            if not self.labelnames:
+                return [('', (), None, value)]
+            return [('', tuple(str(v) for v in values), None, v)
+                    for values, v in value.items()]
+        samples = []
+        for values, child in list(self._children.items()):
+            samples.extend((suffix, values, extra, v) for suffix, extra, v in child.samples())
+        return samples
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, value in self._samples():
+            labels = _format_labels(self.labelnames, values, extra)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class _Value:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        return [('', None, self.value)]
+
+
+class Counter(_Metric):
+    """Monotonic count; fn (optional) supplies the value at scrape time"""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default.value += amount
+
+
+class Gauge(_Metric):
+    """Current value; fn (optional) supplies the value at scrape time"""
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value):
+        self._default.value = value
+
+
+class _HistogramValue:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # bisect_left: a value equal to a bound belongs to that bucket (le)
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        """Context manager observing the duration of its block"""
+        return _Timer(self)
+
+    def samples(self):
+        out = []
+        cumulative = 0
+        for bound, n in zip(self.bounds + (float('inf'),), self.counts):
+            cumulative += n
+            out.append(('_bucket', ('le', _format_value(bound)), cumulative))
+        out.append(('_sum', None, self.sum))
+        out.append(('_count', None, self.count))
+        return out
+
+
+class Histogram(_Metric):
+    """Bucketed distribution of observed values (cumulative on export)"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self.observe = self._default.observe
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def time(self):
+        return self._default.time()
+
+
+class _Timer:
+    __slots__ = ('target', 'start')
+
+    def __init__(self, target):
+        self.target = target
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.target.observe(time.perf_counter() - self.start)
+
+
+class Registry:
+    """Named collection of metrics rendered together for /metrics.
+
+    Registering a name twice returns the existing metric (a new fn replaces
+    the old callback), so several components can share one registry.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, **kwargs)
+            elif kwargs.get('fn') is not None:
+                metric.fn = kwargs['fn']
+            return metric
+
+    def counter(self, name, documentation, labelnames=(), fn=None):
+        return self._register(Counter, name, documentation, labelnames=labelnames, fn=fn)
+
+    def gauge(self, name, documentation, labelnames=(), fn=None):
+        return self._register(Gauge, name, documentation, labelnames=labelnames, fn=fn)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames=labelnames,
+                              buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        blocks = []
+        for metric in metrics:
+            try:
+                blocks.append(metric.render())
+            except Exception as e:
+                # A failing callback must not take the whole page down
+                blocks.append(f"# {metric.name} unavailable: {e}")
+        return '\n'.join(blocks) + '\n'
+
+
+class TimedLock:
+    """threading.Lock that records wait and hold times of every
+    sample_every-th acquisition in two histograms"""
+
+    def __init__(self, wait_histogram, hold_histogram, sample_every=64):
+        self._lock = threading.Lock()
+        self._wait = wait_histogram
+        self._hold = hold_histogram
+        self._sample_every = sample_every
+        self._acquisitions = 0
+        self._held_since = None
+
+    def __enter__(self):
+        self._acquisitions += 1
+        if self._acquisitions % self._sample_every:
+            self._lock.acquire()
+            return self
+        start = time.perf_counter()
+        self._lock.acquire()
+        acquired = time.perf_counter()
+        self._wait.observe(acquired - start)
+        self._held_since = acquired
+        return self
+
+    def __exit__(self, *exc):
+        since = self._held_since
+        if since is not None:
+            self._held_since = None
+            self._hold.observe(time.perf_counter() - since)
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+
+class MetricsServer:
+    """Serves registry.render() at GET /metrics from a daemon thread"""
+
+    def __init__(self, registry, port, host='127.0.0.1'):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        name='metrics-http', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
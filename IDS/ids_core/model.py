@@ -0,0 +1,176 @@
+"""
+Model loading and hot reload.
+
+load_model() reads either a model bundle (memory-mapped, see bundle.py) or
+the model / features / encoder pickles. A ModelReloader loads a new model
+on a background thread when asked to (SIGHUP calls request()) or when the
+model files change on disk (checked every poll_interval seconds), checks it
+and warms it with a test batch. Only a model that passed is handed to
+install(); the detector swaps it in between sweeps, on the thread that
+classifies, so the flow table survives the reload and no batch is scored
+by a mix of two models. A model that fails is logged and the running one
+is kept.
+"""
+import os
+import time
+import pickle
+import threading
+
+import numpy as np
+
+from .bundle import is_bundle, load_bundle, META_FILE
+from .inference import compile_model, BatchRouter
+
+# Rows in the test batch a new model must classify before it is installed
+WARMUP_ROWS = 256
+
+
+class LoadedModel:
+    """One model version: what classify_batch needs, and where it came from"""
+    __slots__ = ('model', 'predictor', 'selected_features', 'label_encoder', 'path', 'compiled')
+
+    def __init__(self, model, predictor, selected_features, label_encoder, path, compiled):
+        self.model = model
+        # Object that serves predict_proba() / classes_ for classify_batch
+        self.predictor = predictor
+        self.selected_features = selected_features
+        self.label_encoder = label_encoder
+        self.path = path
+        self.compiled = compiled
+
+
+def load_model(model_path, features_path=None, encoder_path=None, inference='sklearn'):
+    """LoadedModel from a bundle directory, or from the three pickles"""
+    if is_bundle(model_path):
+        # Pre-compiled arrays mapped from disk: no pickle, no sklearn
+        predictor, features, encoder = load_bundle(model_path)
+        return LoadedModel(predictor, predictor, features, encoder, model_path, True)
+
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    predictor = model
+    if inference == 'compiled':
+        compiled = compile_model(model)
+        if compiled is not None:
+            # Large batches still go to scikit-learn, which is faster there
+            predictor = BatchRouter(compiled, model)
+    with open(features_path, 'rb') as f:
+        features = pickle.load(f)
+    with open(encoder_path, 'rb') as f:
+        encoder = pickle.load(f)
+    return LoadedModel(model, predictor, features, encoder, model_path, predictor is not model)
+
+
+def check_model(loaded, rows=WARMUP_ROWS):
+    """Raise ValueError unless loaded can classify a test batch; returns the
+    seconds the batch took (which also faults mapped arrays into memory)"""
+    features = loaded.selected_features
+    if not len(features) or not all(isinstance(name, str) for name in features):
+        raise ValueError("selected features must be a non-empty list of names")
+    predictor = loaded.predictor
+    n_features_in = getattr(predictor, 'n_features_in_', None)
+    if n_features_in is not None and n_features_in != len(features):
+        raise ValueError(f"model expects {n_features_in} features, feature list has {len(features)}")
+    labels = loaded.label_encoder.inverse_transform(predictor.classes_)
+    if len(labels) != len(predictor.classes_):
+        raise ValueError("label encoder does not cover the model's classes")
+
+    # Feature magnitudes span zeros to byte counts in the millions
+    X = np.random.default_rng(0).exponential(1e3, size=(rows, len(features))).astype(np.float32)
+    X[0] = 0
+    start = time.perf_counter()
+    proba = predictor.predict_proba(X)
+    elapsed = time.perf_counter() - start
+    if proba.shape != (rows, len(labels)):
+        raise ValueError(f"predict_proba returned shape {proba.shape}, expected {(rows, len(labels))}")
+    if not np.isfinite(proba).all() or not np.allclose(proba.sum(axis=1), 1.0, atol=1e-3):
+        raise ValueError("predict_proba returned invalid probabilities")
+    return elapsed
+
+
+class ModelReloader:
+    """Background loader of new model versions for install(LoadedModel).
+
+    request() (safe to call from a signal handler) reloads now; with
+    poll_interval > 0 the model files are also watched, and a change is
+    picked up once they have been stable for one interval so a copy in
+    progress is not loaded.
+    """
+
+    def __init__(self, install, model_path, features_path=None, encoder_path=None,
+                 inference='sklearn', poll_interval=0):
+        self.install = install
+        self.source = (model_path, features_path, encoder_path, inference)
+        self.poll_interval = poll_interval
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+        self._signature = self.signature()
+        self._requested = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='ids-model-reload', daemon=True)
+        self._thread.start()
+
+    def signature(self):
+        """(path, inode, size, mtime) of every model file"""
+        model_path, features_path, encoder_path, _ = self.source
+        if is_bundle(model_path):
+            # meta.json is replaced last when a bundle is written
+            paths = [os.path.join(model_path, META_FILE)]
+        else:
+            paths = [p for p in (model_path, features_path, encoder_path) if p]
+        signature = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                signature.append((path, st.st_ino, st.st_size, st.st_mtime_ns))
+            except OSError:
+                signature.append((path, None))
+        return tuple(signature)
+
+    def request(self):
+        self._requested.set()
+
+    def close(self):
+        self._stopping = True
+        self._requested.set()
+        self._thread.join(timeout=5)
+
+    def metrics(self):
+        return {'reloaded': self.reloads, 'failed': self.failures}
+
+    def _run(self):
+        settling = None
+        while True:
+            requested = self._requested.wait(self.poll_interval or None)
+            if self._stopping:
+                return
+            self._requested.clear()
+            signature = self.signature()
+            if not requested:
+                if signature == self._signature:
+                    continue
+                if signature != settling:
+                    # Still changing: look again after another interval
+                    settling = signature
+                    continue
+            settling = None
+            self._signature = signature
+            self.reload()
+
+    def reload(self):
+        """Load, check and install the model now; False if it failed"""
+        start = time.perf_counter()
+        try:
+            loaded = load_model(*self.source)
+            warmup = check_model(loaded)
+            self.install(loaded)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            print(f"[!] Model reload from {self.source[0]} failed, keeping the current model: {e}")
+            return False
+        self.reloads += 1
+        print(f"[*] Model reloaded from {loaded.path} in {time.perf_counter() - start:.2f}s "
+              f"(test batch {warmup * 1000:.1f} ms)")
+        return True
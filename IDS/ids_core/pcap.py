@@ -0,0 +1,136 @@
+"""
+Offline capture file reading (pcap / pcapng).
+
+The reader memory-maps the capture and walks the record headers with
+struct, yielding (timestamp, linktype, frame) tuples where the frame is a
+zero-copy memoryview into the file for ids_core.decoder. No scapy objects
+are created.
+"""
+import os
+import mmap
+import struct
+
+PCAP_EXTENSIONS = ('.pcap', '.pcapng', '.cap')
+
+_PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+_PCAPNG_SHB = b'\x0a\x0d\x0d\x0a'
+_PCAPNG_SHB_TYPE = 0x0A0D0D0A  # palindromic, reads the same in either byte order
+# Smallest valid length of the blocks whose fields are read
+_PCAPNG_MIN_BLOCK = {_PCAPNG_SHB_TYPE: 28, 1: 20, 3: 16, 6: 32}
+
+
+def iter_pcap(path):
+    """Yield (ts, linktype, frame) for every packet in a pcap or pcapng file"""
+    with open(path, 'rb') as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            buf = memoryview(mm)
+            magic = bytes(buf[:4])
+            if magic in _PCAP_MAGIC:
+                yield from _iter_classic(buf, *_PCAP_MAGIC[magic])
+            elif magic == _PCAPNG_SHB:
+                yield from _iter_pcapng(buf)
+            else:
+                raise ValueError(f"Not a pcap/pcapng file: {path}")
+            buf.release()
+        finally:
+            try:
+                mm.close()
+            except BufferError:
+                # A consumer still holds a frame view; the map is freed with it
+                pass
+
+
+def _iter_classic(buf, endian, ts_unit):
+    if len(buf) < 24:
+        raise ValueError("Truncated pcap file header")
+    linktype = struct.unpack_from(endian + 'I', buf, 20)[0] & 0x0FFFFFFF
+    record = struct.Struct(endian + 'IIII')
+    offset, end = 24, len(buf)
+
+    while offset + 16 <= end:
+        ts_sec, ts_frac, incl_len, _ = record.unpack_from(buf, offset)
+        offset += 16
+        if offset + incl_len > end:
+            break  # truncated last record
+        yield ts_sec + ts_frac * ts_unit, linktype, buf[offset:offset + incl_len]
+        offset += incl_len
+
+
+def _iter_pcapng(buf):
+    end = len(buf)
+    offset = 0
+    endian = '<'
+    interfaces = []  # (linktype, ts_unit) per interface id
+    last_ts = 0.0
+
+    if end < 12:
+        raise ValueError("Truncated pcapng section header")
+
+    while offset + 12 <= end:
+        block_type, block_len = struct.unpack_from(endian + 'II', buf, offset)
+
+        if block_type == _PCAPNG_SHB_TYPE:
+            # Section header: byte order may change per section
+            endian = '<' if bytes(buf[offset + 8:offset + 12]) == b'\x4d\x3c\x2b\x1a' else '>'
+            block_len = struct.unpack_from(endian + 'I', buf, offset + 4)[0]
+            interfaces = []
+
+        if block_len < _PCAPNG_MIN_BLOCK.get(block_type, 12) or block_len % 4:
+            raise ValueError(f"Corrupt pcapng block at offset {offset}")
+        if offset + block_len > end:
+            break  # truncated last block
+
+        if block_type == 1:
+            # Interface description block
+            linktype = struct.unpack_from(endian + 'H', buf, offset + 8)[0]
+            ts_unit = _pcapng_tsresol(buf, endian, offset + 16, offset + block_len - 4)
+            interfaces.append((linktype, ts_unit))
+        elif block_type == 6:
+            # Enhanced packet block
+            iface, ts_high, ts_low, cap_len, _ = struct.unpack_from(
+                endian + 'IIIII', buf, offset + 8)
+            if iface < len(interfaces):
+                linktype, ts_unit = interfaces[iface]
+                last_ts = ((ts_high << 32) | ts_low) * ts_unit
+                data = offset + 28
+                yield last_ts, linktype, buf[data:data + min(cap_len, block_len - 32)]
+        elif block_type == 3:
+            # Simple packet block (no timestamp, always interface 0)
+            if interfaces:
+                orig_len = struct.unpack_from(endian + 'I', buf, offset + 8)[0]
+                cap_len = min(orig_len, block_len - 16)
+                data = offset + 12
+                yield last_ts, interfaces[0][0], buf[data:data + cap_len]
+
+        offset += block_len
+
+
+def _pcapng_tsresol(buf, endian, offset, end):
+    """Read the if_tsresol option of an interface block (default microseconds)"""
+    while offset + 4 <= end:
+        code, length = struct.unpack_from(endian + 'HH', buf, offset)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            value = buf[offset + 4]
+            if value & 0x80:
+                return 2.0 ** -(value & 0x7F)
+            return 10.0 ** -value
+        offset += 4 + ((length + 3) & ~3)
+    return 1e-6
+
+
+def list_capture_files(directory):
+    """Return capture files in a directory, sorted by name"""
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(PCAP_EXTENSIONS)
+    )
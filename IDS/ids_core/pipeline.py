@@ -0,0 +1,180 @@
+"""
+Live-capture pipeline: capture -> flow tracking -> scoring on separate threads.
+
+The capture thread decodes packets and appends the decoded tuples to a
+bounded deque. A flow thread is the only one to touch the flow table: it
+drains the deque, updates flows, and every save_interval hands the finished
+flows (with their features already extracted) to a scoring thread through a
+queue. The scoring thread classifies and writes the outputs. Early scoring
+works the same way: the flow thread snapshots the open flows that are due,
+and the scoring thread sends their new backoffs back through a deque for the
+flow thread to apply, so scheduling fields have a single writer. No lock is
+shared by the three stages: the deque has a single producer and a single
+consumer, and append() / popleft() are atomic in CPython.
+
+When the deque is full the capture thread drops the packet and counts it
+(overflow) instead of waiting. When scoring falls behind, the flow thread
+blocks on the scoring queue (counted as a stall), so the deque fills up and
+the overload shows as overflow rather than as unbounded memory growth.
+"""
+import time
+import queue
+import threading
+
+from collections import deque
+
+# Decoded packets buffered between the capture and flow threads
+INGEST_QUEUE_SIZE = 65536
+# Packets the flow thread ingests between housekeeping checks
+INGEST_BATCH = 512
+# Sleep of the flow thread when the deque is empty
+INGEST_IDLE_WAIT = 0.002
+# Sweeps and early-scoring batches waiting for the scoring thread
+SCORE_QUEUE_SIZE = 64
+
+
+class IngestPipeline:
+    """Flow and scoring threads fed by push() from the capture thread.
+
+    ids is the RealtimeIDS whose flow table, classifier and outputs are
+    used; sweeps run every ids.save_interval seconds and early scoring every
+    early_tick seconds (when enabled) on the wall clock.
+    """
+
+    def __init__(self, ids, capacity=INGEST_QUEUE_SIZE, early_tick=0.25):
+        self.ids = ids
+        self.capacity = max(1, int(capacity))
+        self.early_tick = early_tick
+        self._packets = deque()
+        self._scores = queue.Queue(SCORE_QUEUE_SIZE)
+        # Flows whose classification batch failed, back to the flow thread
+        self._returned = deque()
+        # Early-scoring backoffs for the flow thread to apply
+        self._rescheduled = deque()
+        self._stopping = False
+        self.queued = 0
+        self.overflow = 0
+        self.high_water = 0
+        self.stalls = 0
+        self._flow_thread = threading.Thread(target=self._run_flows, name='ids-flows', daemon=True)
+        self._score_thread = threading.Thread(target=self._run_scoring, name='ids-scoring', daemon=True)
+
+    def start(self):
+        self._flow_thread.start()
+        self._score_thread.start()
+        return self
+
+    def push(self, packet):
+        """Queue one decoded packet tuple (capture thread); False if dropped"""
+        if len(self._packets) >= self.capacity:
+            self.overflow += 1
+            return False
+        self._packets.append(packet)
+        self.queued += 1
+        return True
+
+    def close(self):
+        """Stop after the packets already queued: ingest them, run a final
+        sweep and wait until it has been scored and written"""
+        if self._stopping:
+            return
+        self._stopping = True
+        if self._flow_thread.is_alive():
+            self._flow_thread.join()
+            self._score_thread.join()
+
+    def metrics(self):
+        return {
+            'queued': self.queued,
+            'overflow': self.overflow,
+            'depth': len(self._packets),
+            'high_water': self.high_water,
+            'capacity': self.capacity,
+            'score_depth': self._scores.qsize(),
+            'stalls': self.stalls,
+        }
+
+    def _submit(self, item):
+        try:
+            self._scores.put_nowait(item)
+        except queue.Full:
+            self.stalls += 1
+            self._scores.put(item)
+
+    def _requeue(self, key, flow):
+        self._returned.append((key, flow))
+
+    def _reschedule(self, flow, backoff, packets, ts):
+        self._rescheduled.append((flow, backoff, packets, ts))
+
+    def _apply_returns(self):
+        ids = self.ids
+        while self._returned:
+            ids.flows.requeue(*self._returned.popleft())
+        while self._rescheduled:
+            ids._reschedule(*self._rescheduled.popleft())
+
+    def _ingest(self, limit):
+        """Account up to limit queued packets to their flows; returns the count"""
+        packets = self._packets
+        depth = len(packets)
+        if depth > self.high_water:
+            self.high_water = depth
+        n = min(depth, limit)
+        if n:
+            self.ids._ingest_queued(packets, n)
+        return n
+
+    def _housekeeping(self, now, next_sweep, next_score):
+        ids = self.ids
+        self._apply_returns()
+        if now >= next_sweep:
+            self._submit(('sweep', ids._collect_due(now), now))
+            next_sweep = now + ids.save_interval
+        if ids.early_scoring and now >= next_score:
+            due = ids._collect_early()
+            if due:
+                self._submit(('early', due, now))
+            next_score = now + self.early_tick
+        return next_sweep, next_score
+
+    def _run_flows(self):
+        ids = self.ids
+        now = time.time()
+        next_sweep = now + ids.save_interval
+        next_score = now + self.early_tick
+        try:
+            while not self._stopping:
+                try:
+                    if not self._ingest(INGEST_BATCH):
+                        time.sleep(INGEST_IDLE_WAIT)
+                    next_sweep, next_score = self._housekeeping(time.time(), next_sweep,
+                                                                next_score)
+                except Exception as e:
+                    ids.flow_stats['errors'] += 1
+                    print(f"[!] Flow thread error: {e}")
+            self._ingest(len(self._packets))
+            self._apply_returns()
+            now = time.time()
+            self._submit(('sweep', ids._collect_due(now), now))
+        finally:
+            self._scores.put(None)
+
+    def _run_scoring(self):
+        ids = self.ids
+        while True:
+            item = self._scores.get()
+            if item is None:
+                return
+            kind, flows, now = item
+            try:
+                if kind == 'sweep':
+                    start = time.perf_counter()
+                    ids._score_ready(flows, now, self._requeue)
+                    if ids.metrics is not None:
+                        ids.sweep_seconds.observe(time.perf_counter() - start)
+                else:
+                    ids._score_early(flows, now, self._reschedule)
+            except Exception as e:
+                ids.score_stats['errors'] += 1
+                print(f"[!] Scoring error: {e}")
@@ -0,0 +1,148 @@
+"""
+Capture-side load shedding: BPF whitelists (or their software equivalent
+for pcap replay) and flow sampling.
+"""
+import time
+import zlib
+import ipaddress
+
+# Resolution of the flow-hash sampling threshold
+_HASH_SPACE = 1 << 32
+# Width of a packed utils.flow_key()
+_KEY_BYTES = 37
+
+
+def build_bpf_filter(user_filter=None, trusted_nets=(), trusted_ports=()):
+    """Compile trusted subnets and ports into a BPF expression.
+
+    Packets to or from a trusted subnet, or on a trusted port (either
+    direction), are dropped in the kernel. The user's own filter, if any,
+    is kept and ANDed with the exclusions. Raises ValueError for malformed
+    subnets or ports.
+    """
+    clauses = []
+    if trusted_nets:
+        nets = [str(ipaddress.ip_network(net, strict=False)) for net in trusted_nets]
+        clauses.append("not (" + " or ".join(f"net {net}" for net in nets) + ")")
+    if trusted_ports:
+        ports = []
+        for port in trusted_ports:
+            port = int(port)
+            if not 0 < port < 65536:
+                raise ValueError(f"Invalid port: {port}")
+            ports.append(port)
+        clauses.append("not (" + " or ".join(f"port {port}" for port in ports) + ")")
+
+    if user_filter:
+        clauses.insert(0, f"({user_filter})")
+    return " and ".join(clauses) or None
+
+
+class TrustFilter:
+    """Software form of build_bpf_filter()'s exclusions, for pcap replay.
+
+    excludes() is true for a decoded packet to or from a trusted subnet or
+    on a trusted port (either direction). Verdicts per address are cached,
+    as replayed traffic reuses few addresses. Raises ValueError for
+    malformed subnets or ports.
+    """
+
+    # Addresses remembered before the cache is reset
+    CACHE_SIZE = 65536
+
+    def __init__(self, trusted_nets=(), trusted_ports=()):
+        self.nets = [ipaddress.ip_network(net, strict=False) for net in trusted_nets]
+        self.ports = set()
+        for port in trusted_ports:
+            port = int(port)
+            if not 0 < port < 65536:
+                raise ValueError(f"Invalid port: {port}")
+            self.ports.add(port)
+        self._trusted = {}
+
+    def __bool__(self):
+        return bool(self.nets or self.ports)
+
+    def _in_nets(self, ip):
+        trusted = self._trusted.get(ip)
+        if trusted is None:
+            address = ipaddress.ip_address(ip)
+            trusted = any(address in net for net in self.nets)
+            if len(self._trusted) >= self.CACHE_SIZE:
+                self._trusted.clear()
+            self._trusted[ip] = trusted
+        return trusted
+
+    def excludes(self, decoded):
+        """True if a decode_frame() tuple would be dropped by the BPF whitelist"""
+        src_ip, dst_ip, _, src_port, dst_port = decoded[:5]
+        if self.ports and (src_port in self.ports or dst_port in self.ports):
+            return True
+        return bool(self.nets) and (self._in_nets(src_ip) or self._in_nets(dst_ip))
+
+
+class FlowSampler:
+    """Flow-consistent sampling with an optional automatic rate controller.
+
+    keep() decides per packed flow key (utils.flow_key()), so all packets of
+    a flow share one decision: a flow is kept when its CRC32 falls below
+    1/rate of the hash space. Thresholds are nested, so raising the rate only sheds flows
+    and lowering it only re-admits them. The detector asks only for flows
+    that are not in the flow table yet; tracked flows are never cut.
+
+    With adaptive=True, adjust() doubles the rate (up to max_rate) while
+    the flow table exceeds max_flows or processing lags the capture clock by
+    more than max_lag seconds, and halves it again (down to the configured
+    rate) once both are below half their threshold for `cooldown` seconds.
+    """
+
+    def __init__(self, rate=1, adaptive=False, max_rate=64, max_flows=200000,
+                 max_lag=1.0, cooldown=10.0):
+        self.base_rate = max(1, int(rate))
+        self.rate = self.base_rate
+        self.adaptive = adaptive
+        self.max_rate = max(self.base_rate, int(max_rate))
+        self.max_flows = max_flows
+        self.max_lag = max_lag
+        self.cooldown = cooldown
+        self._threshold = _HASH_SPACE // self.rate
+        self._last_change = time.monotonic()
+        self._calm_since = None
+
+    @property
+    def active(self):
+        return self.rate > 1 or self.adaptive
+
+    def keep(self, key):
+        if self.rate == 1:
+            return True
+        return zlib.crc32(key.to_bytes(_KEY_BYTES, 'little')) < self._threshold
+
+    def adjust(self, active_flows, lag=None):
+        """Re-evaluate the sampling rate; returns the new rate if it changed"""
+        if not self.adaptive:
+            return None
+        now = time.monotonic()
+        overloaded = active_flows > self.max_flows or (lag is not None and lag > self.max_lag)
+        calm = active_flows < self.max_flows / 2 and (lag is None or lag < self.max_lag / 2)
+
+        if overloaded:
+            self._calm_since = None
+            # Give the previous step a moment to take effect
+            if self.rate < self.max_rate and now - self._last_change >= 1.0:
+                return self._set_rate(min(self.rate * 2, self.max_rate), now)
+        elif calm and self.rate > self.base_rate:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.cooldown:
+                self._calm_since = now
+                return self._set_rate(max(self.rate // 2, self.base_rate), now)
+        else:
+            self._calm_since = None
+        return None
+
+    def _set_rate(self, rate, now):
+        self.rate = rate
+        self._threshold = _HASH_SPACE // rate
+        self._last_change = now
+        return rate
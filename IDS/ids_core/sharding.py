@@ -0,0 +1,440 @@
+"""
+Sharded multi-process pipeline.
+
+One capture process decodes frames and hashes each packet's canonical
+5-tuple to one of N worker processes. Every worker owns a shard of the flow
+table and runs its own feature extraction and classification. Results come
+back over a queue to a single merge stage in the capture process, which
+writes the output files, posts to the backend and keeps the combined
+statistics.
+
+Workers share one read-only copy of the model: a model bundle is mapped by
+every worker, and a pickled model with --inference compiled is converted
+into a temporary bundle once. Model reloads are loaded and checked by the
+coordinator, which then republishes the bundle and signals the workers
+(SIGHUP) to swap it in.
+"""
+import os
+import sys
+import time
+import queue
+import select
+import signal
+import shutil
+import tempfile
+import threading
+import multiprocessing
+
+from .detector import RealtimeIDS, EARLY_SCORE_TICK
+from .pcap import iter_pcap
+from .decoder import decode_frame, linktype_for_layer
+from .ring import PacketRing, RING_SIZE
+from .alerting import log_message
+from .bundle import is_bundle, save_bundle
+from .model import load_model, ModelReloader
+
+# Packets buffered per worker before a queue put
+DISPATCH_BATCH = 512
+# Maximum age of a partially filled dispatch buffer (live capture)
+DISPATCH_MAX_AGE = 0.1
+# Batches queued per worker before the capture process blocks
+QUEUE_DEPTH = 64
+
+# Statistics owned by the workers; the coordinator sums their snapshots
+_WORKER_STATS = ('tcp_packets', 'udp_packets', 'icmp_packets',
+                 'total_flows', 'benign_flows', 'malicious_flows', 'early_alerts',
+                 'cache_hits', 'cache_misses', 'aggregated_flows', 'sampled_out_packets')
+
+
+def shard_for(src_ip, dst_ip, src_port, dst_port, proto, workers):
+    """Direction-independent shard index (same symmetry as flow_key)"""
+    a = (src_ip, src_port)
+    b = (dst_ip, dst_port)
+    return hash((a, b, proto) if a <= b else (b, a, proto)) % workers
+
+
+def _shard_worker(worker_id, ids_kwargs, clock, in_queue, out_queue):
+    """Worker process: track and classify the flows of one shard.
+
+    clock='packet' sweeps on packet timestamps (pcap replay), clock='wall'
+    sweeps on the wall clock (live capture).
+    """
+    # The coordinator handles Ctrl+C and tells workers to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    def sink(alerts, csv_records, ml_records):
+        out_queue.put(('results', worker_id, alerts, csv_records, ml_records,
+                       ids.stats_snapshot(), len(ids.flows)))
+
+    ids = RealtimeIDS(**ids_kwargs, result_sink=sink)
+    out_queue.put(('ready', worker_id))
+    # SIGHUP from the coordinator: its new model passed and is published
+    ids.enable_hot_reload()
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda sig, frame: ids.reload_model())
+    next_sweep = None
+    next_score = None
+    last_ts = None
+
+    while True:
+        try:
+            batch = in_queue.get(timeout=1.0)
+        except queue.Empty:
+            batch = ()
+        if batch is None:
+            break
+
+        if batch:
+            with ids.lock:
+                for record in batch:
+                    ids._ingest(*record)
+            last_ts = batch[-1][0]
+            if ids.sampler is not None:
+                ids.check_load(time.time() - last_ts if clock == 'wall' else None)
+
+        now = time.time() if clock == 'wall' else last_ts
+        if now is None:
+            continue
+        if ids.early_scoring and (next_score is None or now >= next_score):
+            ids.score_flows(now=now)
+            next_score = now + EARLY_SCORE_TICK
+        if next_sweep is None:
+            next_sweep = now + ids.save_interval
+        elif now >= next_sweep:
+            ids.process_flows(now=now)
+            next_sweep = now + ids.save_interval
+
+    if clock == 'wall':
+        ids.process_flows()
+    elif last_ts is not None:
+        # Flush everything that is still open at the end of the capture
+        ids.process_flows(now=last_ts + ids.flow_timeout + 1)
+    ids.flush_alert_groups()
+
+    out_queue.put(('done', worker_id, ids.stats_snapshot(), len(ids.flows)))
+
+
+class ShardedIDS:
+    """Capture/dispatch front end plus merge stage for N shard workers"""
+
+    def __init__(self, ids_kwargs, workers, clock='wall'):
+        self.workers = workers
+
+        # Workers never touch the backend or the output files, and only the
+        # coordinator serves /metrics
+        worker_kwargs = dict(ids_kwargs, backend_url=None, enable_backend=False,
+                             metrics_port=None)
+
+        self.model_source = (ids_kwargs['model_path'], ids_kwargs.get('features_path'),
+                             ids_kwargs.get('encoder_path'), ids_kwargs.get('inference', 'sklearn'))
+        self.shared_bundle = self._share_model(worker_kwargs)
+
+        ctx = multiprocessing.get_context()
+        self.in_queues = [ctx.Queue(QUEUE_DEPTH) for _ in range(workers)]
+        self.out_queue = ctx.Queue()
+        self.processes = [
+            ctx.Process(target=_shard_worker, name=f"ids-shard-{i}",
+                        args=(i, worker_kwargs, clock, self.in_queues[i], self.out_queue),
+                        daemon=True)
+            for i in range(workers)
+        ]
+        for proc in self.processes:
+            proc.start()
+        self._wait_ready()
+
+        # The coordinator owns outputs, backend delivery and combined stats;
+        # it never classifies, so it does not load the model
+        self.ids = RealtimeIDS(**dict(ids_kwargs, classify=False))
+        log_message(self.ids.backend_url, f"[*] Sharded mode: {workers} worker processes")
+
+        self._buffers = [[] for _ in range(workers)]
+        self._worker_stats = {}
+        self._worker_flows = {}
+        self._capture_errors = 0
+        self._stopping = False
+
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.collector.start()
+
+    def _wait_ready(self):
+        """Block until every worker has loaded its model; the coordinator does
+        not load one, so a broken model only shows up here"""
+        ready = set()
+        while len(ready) < self.workers:
+            try:
+                message = self.out_queue.get(timeout=1.0)
+            except queue.Empty:
+                failed = [i for i, proc in enumerate(self.processes)
+                          if i not in ready and not proc.is_alive()]
+                if failed:
+                    for proc in self.processes:
+                        if proc.is_alive():
+                            proc.terminate()
+                    raise RuntimeError(f"Shard worker {failed[0]} failed to start")
+                continue
+            if message[0] == 'ready':
+                ready.add(message[1])
+
+    def _share_model(self, worker_kwargs):
+        """Point worker_kwargs at a model every worker can map; returns the
+        temporary bundle directory, if one was written"""
+        model_path, features_path, encoder_path, inference = self.model_source
+        if is_bundle(model_path):
+            return None
+        if inference != 'compiled':
+            print(f"[*] Each worker loads its own copy of the model "
+                  f"(--inference compiled or a model bundle shares one)")
+            return None
+        loaded = load_model(*self.model_source)
+        if not loaded.compiled:
+            return None
+        path = tempfile.mkdtemp(prefix='ids-model-')
+        save_bundle(path, loaded.model, loaded.selected_features, loaded.label_encoder)
+        worker_kwargs['model_path'] = path
+        print(f"[*] Model shared with the workers through {path}")
+        return path
+
+    def enable_hot_reload(self, poll_interval=0):
+        """Reload on reload_model() and, with poll_interval > 0, when the
+        model files change; the coordinator checks the model, then the workers
+        swap it in from their next sweep"""
+        if self.ids.reloader is None:
+            self.ids.reloader = ModelReloader(self._publish_model, *self.model_source,
+                                              poll_interval=poll_interval)
+        return self.ids.reloader
+
+    def reload_model(self):
+        """Ask for a model reload (safe from signal handlers)"""
+        self.ids.reload_model()
+
+    def _publish_model(self, loaded):
+        if self.shared_bundle is not None:
+            save_bundle(self.shared_bundle, loaded.model, loaded.selected_features,
+                        loaded.label_encoder)
+        if hasattr(signal, 'SIGHUP'):
+            for proc in self.processes:
+                if proc.is_alive():
+                    os.kill(proc.pid, signal.SIGHUP)
+        self.ids.model_generation += 1
+
+    def _dispatch(self, ts, decoded):
+        shard = shard_for(decoded[0], decoded[1], decoded[3], decoded[4],
+                          decoded[2], self.workers)
+        buf = self._buffers[shard]
+        buf.append((ts,) + decoded)
+        if len(buf) >= DISPATCH_BATCH:
+            self.in_queues[shard].put(buf)
+            self._buffers[shard] = []
+
+    def _flush_buffers(self):
+        for shard, buf in enumerate(self._buffers):
+            if buf:
+                self.in_queues[shard].put(buf)
+                self._buffers[shard] = []
+
+    def _dispatch_block(self, ring, limit=None):
+        """Decode and dispatch the next block of a capture ring; returns frames read"""
+        frames = ring.read_block(timeout=DISPATCH_MAX_AGE)
+        if limit is not None:
+            frames = frames[:limit]
+        ids = self.ids
+        for ts, frame in frames:
+            self._count_packet()
+            if ids.packets_processed % 100 == 0:
+                ids._print_periodic_stats()
+            decoded = decode_frame(frame, ring.linktype)
+            if decoded is not None:
+                self._dispatch(ts, decoded)
+        return len(frames)
+
+    def _count_packet(self):
+        ids = self.ids
+        ids.packets_processed += 1
+        ids.stats['total_packets'] += 1
+        if ids.packets_processed == 1:
+            ids.log_first_packet()
+
+    def _collect(self):
+        """Merge stage: deliver worker results and combine their statistics"""
+        done = set()
+        while len(done) < self.workers:
+            try:
+                message = self.out_queue.get(timeout=1.0)
+            except queue.Empty:
+                for worker_id, proc in enumerate(self.processes):
+                    if worker_id not in done and not proc.is_alive():
+                        print(f"[!] Shard worker {worker_id} exited unexpectedly")
+                        done.add(worker_id)
+                continue
+            if message[0] == 'results':
+                _, worker_id, alerts, csv_records, ml_records, stats, active = message
+                self._update_stats(worker_id, stats, active)
+                self.ids._emit(alerts, csv_records, ml_records)
+            elif message[0] == 'done':
+                _, worker_id, stats, active = message
+                self._update_stats(worker_id, stats, active)
+                done.add(worker_id)
+
+    def _update_stats(self, worker_id, stats, active):
+        self._worker_stats[worker_id] = stats
+        self._worker_flows[worker_id] = active
+
+        # The coordinator never tracks or scores flows itself, so the worker
+        # totals replace its scoring counters in one assignment; its capture
+        # thread keeps counting packets in ids.stats
+        combined = {key: sum(s[key] for s in self._worker_stats.values())
+                    for key in _WORKER_STATS}
+        combined['errors'] = self._capture_errors + sum(
+            s['errors'] for s in self._worker_stats.values())
+
+        attack_types = {}
+        for s in self._worker_stats.values():
+            for attack, count in s['attack_types'].items():
+                attack_types[attack] = attack_types.get(attack, 0) + count
+        combined['attack_types'] = attack_types
+        self.ids.score_stats = combined
+        self.ids.shard_flows = sum(self._worker_flows.values())
+
+    def shutdown(self):
+        """Stop the workers, wait for their final sweep and merge the results"""
+        if self.ids.reloader is not None:
+            self.ids.reloader.close()
+        self._flush_buffers()
+        for q in self.in_queues:
+            try:
+                q.put(None, timeout=5)
+            except queue.Full:
+                pass
+        self.collector.join()
+        for proc in self.processes:
+            proc.join(timeout=5)
+        if self.shared_bundle is not None:
+            shutil.rmtree(self.shared_bundle, ignore_errors=True)
+
+    def stop(self):
+        """Ask a running live capture to stop (safe from signal handlers)"""
+        self._stopping = True
+
+    def replay_pcaps(self, paths, packet_count=0, trust=None):
+        """Replay capture files across the shard workers (trust as for
+        RealtimeIDS.replay_pcaps())"""
+        ids = self.ids
+        log_message(ids.backend_url, f"[*] Replaying {len(paths)} capture file(s)...")
+
+        wall_start = time.time()
+        replayed = 0
+        for path in paths:
+            log_message(ids.backend_url, f"[*] Reading {path}")
+            try:
+                for ts, linktype, frame in iter_pcap(path):
+                    if packet_count and replayed >= packet_count:
+                        break
+                    decoded = decode_frame(frame, linktype)
+                    if trust and decoded is not None and trust.excludes(decoded):
+                        continue
+                    replayed += 1
+                    self._count_packet()
+                    if decoded is not None:
+                        self._dispatch(ts, decoded)
+            except (OSError, ValueError) as e:
+                self._capture_errors += 1
+                print(f"[!] Error reading {path}: {e}")
+
+        self.shutdown()
+
+        elapsed = max(time.time() - wall_start, 1e-9)
+        flows = ids.stats_snapshot()['total_flows']
+        log_message(ids.backend_url, f"\n[+] Replay finished in {elapsed:.2f}s")
+        log_message(ids.backend_url, f"    - Packets: {replayed:,} ({replayed / elapsed:,.0f} packets/s)")
+        log_message(ids.backend_url, f"    - Flows:   {flows:,} ({flows / elapsed:,.0f} flows/s)")
+
+    def start_capture(self, interface=None, packet_count=0, filter_exp=None,
+                      capture='socket', ring_size=RING_SIZE, fanout_group=None):
+        """Live capture with the raw decoder, dispatching packets to the shards.
+
+        capture='ring' reads from a TPACKET_V3 ring instead of a scapy socket
+        (see RealtimeIDS.start_capture).
+        """
+        ids = self.ids
+        log_message(ids.backend_url, f"[*] Starting real-time intrusion detection...")
+        log_message(ids.backend_url, f"[*] Interface: {interface or 'default'}")
+        log_message(ids.backend_url, f"[*] Filter: {filter_exp or 'none'}")
+        if capture == 'ring':
+            fanout = f", fanout group {fanout_group}" if fanout_group is not None else ""
+            log_message(ids.backend_url, f"[*] Capture: TPACKET_V3 ring, {ring_size >> 20} MiB{fanout}")
+        log_message(ids.backend_url, f"[*] Press Ctrl+C to stop\n")
+
+        signal.signal(signal.SIGINT, lambda sig, frame: self.stop())
+        from scapy.all import conf
+
+        def stats_printer():
+            while True:
+                time.sleep(60)
+                ids.print_stats()
+
+        threading.Thread(target=stats_printer, daemon=True).start()
+
+        try:
+            if capture == 'ring':
+                sock = PacketRing(interface or str(conf.iface), ring_size=ring_size,
+                                  filter_exp=filter_exp, fanout_group=fanout_group)
+                ids.capture_ring = sock
+            else:
+                sock = conf.L2listen(iface=interface, filter=filter_exp)
+        except PermissionError:
+            print(f"\n[!] Permission denied!")
+            print("Run with elevated privileges (sudo/Administrator)\n")
+            self.shutdown()
+            sys.exit(1)
+        except (OSError, ValueError, RuntimeError, ImportError) as e:
+            print(f"\n[!] Error: {e}\n")
+            self.shutdown()
+            sys.exit(1)
+
+        captured = 0
+        last_flush = time.monotonic()
+        try:
+            while not self._stopping and (not packet_count or captured < packet_count):
+                if capture == 'ring':
+                    captured += self._dispatch_block(
+                        sock, packet_count - captured if packet_count else None)
+                else:
+                    readable, _, _ = select.select([sock], [], [], DISPATCH_MAX_AGE)
+                    if readable:
+                        layer, frame, ts = sock.recv_raw()
+                        if frame is not None:
+                            captured += 1
+                            self._count_packet()
+                            if ids.packets_processed % 100 == 0:
+                                ids._print_periodic_stats()
+                            decoded = decode_frame(frame, linktype_for_layer(layer))
+                            if decoded is not None:
+                                self._dispatch(time.time() if ts is None else ts, decoded)
+
+                if time.monotonic() - last_flush >= DISPATCH_MAX_AGE:
+                    self._flush_buffers()
+                    last_flush = time.monotonic()
+        except Exception as e:
+            print(f"\n[!] Error: {e}\n")
+        finally:
+            sock.close()
+
+        print("\n" + "="*70)
+        print("  SHUTTING DOWN GRACEFULLY")
+        print("="*70)
+        print("[*] Processing remaining flows...")
+        self.shutdown()
+        ids.close()
+        ids.print_stats()
+
+        print(f"\n{'='*70}")
+        print("  RESULTS SAVED")
+        print(f"{'='*70}")
+        print(f"[+] Malicious flows (JSON): {ids.json_output}")
+        print(f"\n[+] Malicious flows (CSV):  {ids.csv_output}")
+        print(f"\n[+] ML features (all):      {ids.features_output}")
+        print(f"\n{'='*70}")
+        print("  IDS STOPPED")
+        print(f"{'='*70}\n")
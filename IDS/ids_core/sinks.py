@@ -0,0 +1,374 @@
+"""
+Append-only alert sinks.
+"""
+import os
+import io
+import json
+import glob
+import gzip
+import time
+import shutil
+import threading
+
+from collections import deque
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# pyarrow takes a noticeable part of startup, so it is imported by the
+# first ColumnarSink rather than with this module
+pa = None
+
+# Suffix added to rotated segments per compression codec
+COMPRESS_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+# File extension per columnar format
+COLUMNAR_EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+
+def _import_pyarrow():
+    global pa
+    if pa is None:
+        try:
+            import pyarrow
+            import pyarrow.ipc
+            import pyarrow.parquet
+        except ImportError:
+            return None
+        pa = pyarrow
+    return pa
+
+
+class JsonlSink:
+    """JSON Lines (NDJSON) alert file.
+
+    Every write() serializes a whole sweep and appends it with a single
+    buffered write to a file that stays open, so the cost per alert does not
+    depend on how large the file already is. The active file is rotated to
+    <name>.<timestamp>-<n>.jsonl once it exceeds rotate_bytes or is older than
+    rotate_seconds; rotated segments are compressed with gzip or zstd on a
+    background thread.
+
+    fsync policy: 'always' after every write, 'rotate' when a segment is
+    closed, 'never', or a number of seconds between fsyncs.
+    """
+
+    def __init__(self, path, rotate_bytes=0, rotate_seconds=0, compress=None, fsync='rotate'):
+        if compress == 'zstd' and zstandard is None:
+            print("[!] zstandard is not installed, rotated alert files will use gzip")
+            compress = 'gzip'
+        if compress not in COMPRESS_SUFFIXES:
+            raise ValueError(f"Unknown compression: {compress}")
+
+        self.path = path
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compress = compress
+        self.fsync_interval = None
+        if fsync not in ('always', 'rotate', 'never'):
+            self.fsync_interval = float(fsync)
+            fsync = 'interval'
+        self.fsync = fsync
+
+        self.records = 0
+        self.rotations = 0
+        self._lock = threading.Lock()
+        self._compressors = []
+
+        # Keep whatever a previous run left behind as a rotated segment
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self._rotate_file()
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, 'a', encoding='utf-8', buffering=1 << 16)
+        self._size = self._file.tell()
+        self._opened_at = time.time()
+        self._last_fsync = self._opened_at
+
+    def write(self, records):
+        """Append records (one JSON document per line) with one write call"""
+        if not records:
+            return
+        data = ''.join(json.dumps(r) + '\n' for r in records)
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+            self.records += len(records)
+
+            now = time.time()
+            if self.fsync == 'always' or (
+                    self.fsync == 'interval' and now - self._last_fsync >= self.fsync_interval):
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+
+            if ((self.rotate_bytes and self._size >= self.rotate_bytes) or
+                    (self.rotate_seconds and now - self._opened_at >= self.rotate_seconds)):
+                self._close_file()
+                self._rotate_file()
+                self._open()
+
+    def close(self):
+        with self._lock:
+            self._close_file()
+        for thread in self._compressors:
+            thread.join()
+
+    def _close_file(self):
+        self._file.flush()
+        if self.fsync != 'never':
+            os.fsync(self._file.fileno())
+        self._file.close()
+
+    def _rotate_file(self):
+        stem, ext = os.path.splitext(self.path)
+        stamp = time.strftime('%Y%m%dT%H%M%S')
+        n = 0
+        while True:
+            target = f"{stem}.{stamp}-{n:03d}{ext}"
+            if not os.path.exists(target) and not os.path.exists(target + COMPRESS_SUFFIXES[self.compress]):
+                break
+            n += 1
+        os.replace(self.path, target)
+        self.rotations += 1
+
+        if self.compress:
+            thread = threading.Thread(target=_compress_file, args=(target, self.compress),
+                                      name='jsonl-compress', daemon=True)
+            thread.start()
+            self._compressors = [t for t in self._compressors if t.is_alive()] + [thread]
+
+
+class ColumnarSink:
+    """Partitioned Parquet or Arrow IPC table output.
+
+    append() only queues records; a background thread turns them into typed
+    record batches and writes one row group whenever row_group_size rows are
+    pending or the oldest pending row is flush_interval seconds old. Output
+    is a directory of part-<timestamp>-<n>.<ext> files, each closed (and so
+    readable) after rows_per_file rows or when the sink closes.
+
+    fields is a list of (column_name, record_key, type_name) with type names
+    as in config.ENHANCED_CSV_TYPES; column names must be unique.
+    """
+
+    def __init__(self, directory, fields, fmt='parquet', row_group_size=50000,
+                 flush_interval=60, rows_per_file=1000000, compression='zstd'):
+        if _import_pyarrow() is None:
+            raise RuntimeError("pyarrow is required for Parquet/Arrow outputs (pip install pyarrow)")
+        if fmt not in COLUMNAR_EXTENSIONS:
+            raise ValueError(f"Unknown columnar format: {fmt}")
+
+        self.directory = directory
+        self.fmt = fmt
+        self.row_group_size = row_group_size
+        self.flush_interval = flush_interval
+        self.rows_per_file = rows_per_file
+        self.compression = compression
+        self._keys = [key for _, key, _ in fields]
+        self.schema = pa.schema([(name, pa.type_for_alias(type_name))
+                                 for name, _, type_name in fields])
+
+        os.makedirs(directory, exist_ok=True)
+        self._pending = deque()
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._closing = False
+        self._writer = None
+        self._file_rows = 0
+
+        self.rows_written = 0
+        self.row_groups = 0
+        self.files = 0
+        self.errors = 0
+
+        self._thread = threading.Thread(target=self._run, name=f'{fmt}-writer', daemon=True)
+        self._thread.start()
+
+    def append(self, records):
+        """Queue records (dicts) for the next row group"""
+        if not records:
+            return
+        with self._cond:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.extend(records)
+            if len(self._pending) >= self.row_group_size:
+                self._cond.notify()
+
+    def close(self):
+        """Write everything still queued and close the current part file"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closing and not self._due():
+                    self._cond.wait(self._wait_time())
+                closing = self._closing
+                size = len(self._pending) if closing else self.row_group_size
+                rows = [self._pending.popleft() for _ in range(min(size, len(self._pending)))]
+                if not self._pending:
+                    self._oldest = None
+
+            for start in range(0, len(rows), self.row_group_size):
+                self._write(rows[start:start + self.row_group_size])
+            if closing:
+                self._close_writer()
+                return
+
+    def _due(self):
+        return (len(self._pending) >= self.row_group_size or
+                (self._pending and time.monotonic() - self._oldest >= self.flush_interval))
+
+    def _wait_time(self):
+        if not self._pending:
+            return self.flush_interval
+        return max(0.01, self.flush_interval - (time.monotonic() - self._oldest))
+
+    def _write(self, rows):
+        try:
+            batch = pa.record_batch(
+                [self._column(rows, key, field.type) for key, field in zip(self._keys, self.schema)],
+                schema=self.schema)
+            if self._writer is None:
+                self._open_writer()
+            if self.fmt == 'parquet':
+                self._writer.write_batch(batch, row_group_size=len(rows))
+            else:
+                self._writer.write_batch(batch)
+            self.rows_written += len(rows)
+            self.row_groups += 1
+            self._file_rows += len(rows)
+            if self._file_rows >= self.rows_per_file:
+                self._close_writer()
+        except Exception as e:
+            self.errors += 1
+            print(f"[!] Error writing {self.fmt} rows to {self.directory}: {e}")
+
+    @staticmethod
+    def _column(rows, key, arrow_type):
+        values = [row.get(key) for row in rows]
+        try:
+            return pa.array(values, type=arrow_type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+            # e.g. confidence already formatted as text for the CSV record
+            return pa.array(values).cast(arrow_type)
+
+    def _open_writer(self):
+        stamp = time.strftime('%Y%m%dT%H%M%S')
+        ext = COLUMNAR_EXTENSIONS[self.fmt]
+        n = 0
+        while os.path.exists(os.path.join(self.directory, f"part-{stamp}-{n:03d}{ext}")):
+            n += 1
+        path = os.path.join(self.directory, f"part-{stamp}-{n:03d}{ext}")
+        if self.fmt == 'parquet':
+            self._writer = pa.parquet.ParquetWriter(path, self.schema, compression=self.compression)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=self.compression)
+            self._writer = pa.ipc.new_file(path, self.schema, options=options)
+        self._file_rows = 0
+        self.files += 1
+
+    def _close_writer(self):
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except Exception as e:
+                self.errors += 1
+                print(f"[!] Error closing {self.fmt} file in {self.directory}: {e}")
+            self._writer = None
+
+
+def columnar_fields(columns, types=None, default_type='float64'):
+    """(name, key, type) fields for ColumnarSink; repeated column names get
+    a .1, .2, ... suffix the same way pandas.read_csv names them"""
+    seen = {}
+    fields = []
+    for col in columns:
+        n = seen.get(col, 0)
+        seen[col] = n + 1
+        name = f"{col}.{n}" if n else col
+        fields.append((name, col, (types or {}).get(col, default_type)))
+    return fields
+
+
+def _compress_file(path, codec):
+    target = path + COMPRESS_SUFFIXES[codec]
+    try:
+        with open(path, 'rb') as src, open(target + '.tmp', 'wb') as raw:
+            if codec == 'gzip':
+                with gzip.GzipFile(fileobj=raw, mode='wb') as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+            else:
+                with zstandard.ZstdCompressor().stream_writer(raw) as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(target + '.tmp', target)
+        os.remove(path)
+    except Exception as e:
+        print(f"[!] Error compressing {path}: {e}")
+
+
+def _open_segment(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        raw = open(path, 'rb')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True),
+                                encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def jsonl_segments(path):
+    """Rotated segments of a JSONL sink (oldest first), then the active file"""
+    stem, ext = os.path.splitext(path)
+    rotated = [p for p in glob.glob(f"{glob.escape(stem)}.*{ext}*")
+               if not p.endswith('.tmp') and p != path]
+    # A segment whose compression finished shadows the uncompressed original
+    rotated = [p for p in rotated
+               if not any(p + s in rotated for s in ('.gz', '.zst'))]
+    segments = sorted(rotated)
+    if os.path.exists(path):
+        segments.append(path)
+    return segments
+
+
+def iter_jsonl(path, include_rotated=True):
+    """Stream alert records back from a JSONL sink.
+
+    Reads gzip/zstd segments transparently. A truncated last line (crash
+    while writing) is skipped.
+    """
+    paths = jsonl_segments(path) if include_rotated else [path]
+    for segment in paths:
+        with _open_segment(segment) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Stream alerts from a JSONL alert file')
+    parser.add_argument('path', help='Active JSONL file (rotated segments are read too)')
+    parser.add_argument('--no-rotated', action='store_true',
+                        help='Only read the active file')
+    args = parser.parse_args()
+    try:
+        for record in iter_jsonl(args.path, include_rotated=not args.no_rotated):
+            print(json.dumps(record))
+    except BrokenPipeError:
+        pass
@@ -0,0 +1,30 @@
+"""
+Startup phase timing.
+
+PROCESS_START is taken when this module is first imported; ids.py imports
+it before anything else, so phases are measured from (nearly) process start.
+"""
+import time
+
+PROCESS_START = time.perf_counter()
+
+
+class StartupTimer:
+    """Durations of consecutive startup phases; each mark() ends one"""
+
+    def __init__(self):
+        self.phases = []
+        self._last = PROCESS_START
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def elapsed(self):
+        """Seconds since PROCESS_START"""
+        return time.perf_counter() - PROCESS_START
+
+    def summary(self):
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases)
+        return f"{phases} (ready after {self._last - PROCESS_START:.2f}s)"
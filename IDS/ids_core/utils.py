@@ -1,6 +1,11 @@
 """
 Utility functions for IDS.
 """
+import time
+import socket
+import threading
+from collections import OrderedDict
+
 import numpy as np
 
 def safe_divide(num, denom, default=0.0):
@@ -28,6 +33,95 @@ def protocol_name(proto_num):
     return protocols.get(proto_num, f'Protocol-{proto_num}')
 
 def get_flow_key(src_ip, dst_ip, src_port, dst_port, protocol):
+    """Human-readable flow id, only built when an alert or record is emitted"""
     f = f"{src_ip}:{src_port}-{dst_ip}:{dst_port}-{protocol}"
     b = f"{dst_ip}:{dst_port}-{src_ip}:{src_port}-{protocol}"
     return min(f, b)
+
+
+# Addresses memoized by ip_to_int(); the memo is dropped when it fills up
+IP_INT_CACHE_SIZE = 65536
+# IPv4 addresses are packed as IPv4-mapped IPv6 (::ffff:a.b.c.d)
+_IPV4_MAPPED = 0xFFFF << 32
+
+_ip_ints = {}
+_inet_aton = socket.inet_aton
+_inet_pton = socket.inet_pton
+_AF_INET6 = socket.AF_INET6
+_from_bytes = int.from_bytes
+
+
+def ip_to_int(ip):
+    """Pack an IPv4/IPv6 address string into a 128-bit int"""
+    value = _ip_ints.get(ip)
+    if value is None:
+        if ':' in ip:
+            value = _from_bytes(_inet_pton(_AF_INET6, ip), 'big')
+        else:
+            value = _from_bytes(_inet_aton(ip), 'big') | _IPV4_MAPPED
+        if len(_ip_ints) >= IP_INT_CACHE_SIZE:
+            _ip_ints.clear()
+        _ip_ints[ip] = value
+    return value
+
+
+def flow_key(src_ip, dst_ip, src_port, dst_port, protocol):
+    """Direction-independent flow key packed into one 296-bit int.
+
+    Each endpoint is address << 16 | port; the numerically smaller one goes
+    first: protocol (8 bits) | endpoint (144) | endpoint (144). Hashing and
+    comparing it is much cheaper than building the get_flow_key() string.
+    """
+    a = ip_to_int(src_ip) << 16 | src_port
+    b = ip_to_int(dst_ip) << 16 | dst_port
+    if a > b:
+        a, b = b, a
+    return protocol << 288 | a << 144 | b
+
+
+_MISSING = object()
+
+class LRUCache:
+    """Bounded, thread-safe LRU mapping with optional TTL and hit/miss counters"""
+
+    def __init__(self, maxsize=4096, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
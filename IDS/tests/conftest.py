@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+IDS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [IDS_DIR, os.path.join(IDS_DIR, 'benchmarks')]
+
+
+@pytest.fixture
+def make_ids(tmp_path):
+    """Factory for an offline RealtimeIDS on the benchmark stub model;
+    malicious and benign alerts are collected in ids.alerts"""
+    from stubs import write_artifacts
+    from ids_core.detector import RealtimeIDS
+
+    model, features, encoder = write_artifacts(str(tmp_path))
+
+    def make(**kwargs):
+        alerts = []
+        kwargs.setdefault('result_sink', lambda malicious, records, ml: alerts.extend(malicious))
+        ids = RealtimeIDS(model, features, encoder, geoip_db_path=str(tmp_path / 'none.mmdb'),
+                          enable_backend=False,
+                          json_output=str(tmp_path / 'alerts.json'),
+                          csv_output=str(tmp_path / 'flows.csv'),
+                          features_output=str(tmp_path / 'features.csv'), **kwargs)
+        ids.alerts = alerts
+        return ids
+    return make
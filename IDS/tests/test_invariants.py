@@ -0,0 +1,174 @@
+"""
+Invariants of the hot-path data structures, checked on synthetic data
+against straightforward reference implementations.
+"""
+import numpy as np
+import pytest
+
+from ids_core.features import RunningStats, calc_stats
+from ids_core.flow import FlowRecord
+from ids_core.flowtable import FlowTable
+from ids_core.utils import flow_key
+from ids_core.decoder import decode_frame
+from ids_core.pcap import iter_pcap
+from traffic import build_mix, write_pcap
+
+
+def test_running_stats_match_numpy():
+    values = np.random.default_rng(0).lognormal(5, 2, size=5000)
+    acc = RunningStats()
+    for x in values:
+        acc.add(float(x))
+    stats = calc_stats(acc)
+    assert acc.count == len(values)
+    assert stats['total'] == pytest.approx(values.sum())
+    assert stats['min'] == values.min() and stats['max'] == values.max()
+    assert stats['mean'] == pytest.approx(values.mean())
+    assert stats['std'] == pytest.approx(values.std())
+
+
+def test_running_stats_merge_matches_single_pass():
+    values = np.random.default_rng(1).normal(100, 30, size=1001)
+    left, right = RunningStats(), RunningStats()
+    for x in values[:400]:
+        left.add(float(x))
+    for x in values[400:]:
+        right.add(float(x))
+    merged = left.merged(right)
+    assert merged.count == len(values)
+    assert merged.mean == pytest.approx(values.mean())
+    assert merged.std == pytest.approx(values.std())
+    assert (merged.min, merged.max) == (values.min(), values.max())
+    assert RunningStats().merged(left).mean == left.mean
+
+
+def _flow(key, ts):
+    return FlowRecord(key, '10.0.0.1', '10.0.0.2', 1000 + key, 80, 6, ts)
+
+
+def test_flow_table_expires_idle_flows_in_deadline_order():
+    table = FlowTable(timeout=10)
+    flows = {key: _flow(key, ts) for key, ts in ((1, 5.0), (2, 0.0), (3, 3.0))}
+    for key, flow in flows.items():
+        table.add(key, flow)
+
+    assert table.pop_due(9.0) == []
+    assert [key for key, _ in table.pop_due(16.0)] == [2, 3, 1]
+    assert len(table) == 0
+
+
+def test_flow_table_reschedules_flows_that_saw_packets():
+    table = FlowTable(timeout=10)
+    flow = _flow(1, 0.0)
+    table.add(1, flow)
+    flow.update('10.0.0.1', 1001, 40, 60, 8.0, 0x10, 0)
+
+    assert table.pop_due(12.0) == []
+    assert table.get(1) is flow
+    assert table.pop_due(18.5) == [(1, flow)]
+
+
+def test_flow_table_ready_flows_come_first():
+    table = FlowTable(timeout=10)
+    idle, closed = _flow(1, 0.0), _flow(2, 5.0)
+    table.add(1, idle)
+    table.add(2, closed)
+    table.mark_ready(2)
+
+    assert table.pop_due(11.0) == [(2, closed), (1, idle)]
+
+
+def test_flow_table_requeue_returns_flows_at_next_sweep():
+    table = FlowTable(timeout=10)
+    first, second = _flow(1, 0.0), _flow(2, 0.0)
+    table.add(1, first)
+    table.add(2, second)
+    table.mark_ready(1)
+    table.mark_ready(2)
+    assert table.pop_due(1.0) == [(1, first), (2, second)]
+
+    table.requeue(2, second)
+    table.requeue(1, first)
+    assert table.pop_due(2.0) == [(2, second), (1, first)]
+    assert table.pop_due(30.0) == []
+
+
+def test_flow_key_is_direction_independent():
+    forward = flow_key('192.168.1.10', '93.184.216.34', 51000, 443, 6)
+    assert forward == flow_key('93.184.216.34', '192.168.1.10', 443, 51000, 6)
+    assert forward != flow_key('192.168.1.10', '93.184.216.34', 51001, 443, 6)
+    assert forward != flow_key('192.168.1.10', '93.184.216.34', 51000, 443, 17)
+    # Swapping only the ports is a different conversation
+    assert forward != flow_key('192.168.1.10', '93.184.216.34', 443, 51000, 6)
+
+    v6 = flow_key('2001:db8::1', '2001:db8::2', 5353, 53, 17)
+    assert v6 == flow_key('2001:db8::2', '2001:db8::1', 53, 5353, 17)
+    assert v6 != flow_key('::ffff:10.0.0.1', '2001:db8::2', 5353, 53, 17)
+
+
+def _forest(kind):
+    ensemble = pytest.importorskip('sklearn.ensemble')
+    rng = np.random.default_rng(0)
+    X = rng.lognormal(3, 2, size=(3000, 12)).astype(np.float32)
+    y = (X[:, 0] > X[:, 1]).astype(int) + (X[:, 2] > 40) + 2 * (X[:, 3] > X[:, 4] * 3)
+    model = getattr(ensemble, kind)(n_estimators=15, max_depth=12, random_state=0).fit(X, y)
+    rows = rng.lognormal(3, 2, size=(2500, 12)).astype(np.float32)
+    rows[:5] = 0
+    return model, rows
+
+
+@pytest.mark.parametrize('kind', ['RandomForestClassifier', 'ExtraTreesClassifier'])
+def test_compiled_forest_matches_predict_proba(kind):
+    from ids_core.inference import CompiledForest, BatchRouter, COMPILED_MAX_ROWS
+
+    model, rows = _forest(kind)
+    compiled = CompiledForest(model)
+    assert len(rows) > COMPILED_MAX_ROWS
+    for n in (1, 7, len(rows)):
+        assert np.array_equal(compiled.predict_proba(rows[:n]), model.predict_proba(rows[:n]))
+    assert np.array_equal(compiled.predict(rows), model.predict(rows))
+
+    router = BatchRouter(compiled, model)
+    assert np.array_equal(router.predict_proba(rows), model.predict_proba(rows))
+    assert np.array_equal(router.predict_proba(rows[:3]), model.predict_proba(rows[:3]))
+
+
+def test_compiled_forest_survives_a_bundle_round_trip(tmp_path):
+    from ids_core.bundle import save_bundle, load_bundle
+
+    model, rows = _forest('RandomForestClassifier')
+    encoder = pytest.importorskip('sklearn.preprocessing').LabelEncoder().fit(model.classes_)
+    features = [f'f{i}' for i in range(rows.shape[1])]
+    save_bundle(str(tmp_path / 'model.bundle'), model, features, encoder)
+
+    forest, loaded_features, labels = load_bundle(str(tmp_path / 'model.bundle'))
+    assert loaded_features == features
+    assert np.array_equal(forest.predict_proba(rows), model.predict_proba(rows))
+    assert list(labels.inverse_transform(forest.classes_)) == [str(c) for c in model.classes_]
+
+
+@pytest.fixture(scope='module')
+def mixed_traffic():
+    return build_mix('mixed', scale=0.02)
+
+
+def test_struct_decoder_matches_scapy(mixed_traffic):
+    scapy = pytest.importorskip('scapy.all')
+    from ids_core.detector import RealtimeIDS
+
+    for _, frame in mixed_traffic:
+        expected = RealtimeIDS._decode_packet(scapy.Ether(frame))
+        assert decode_frame(frame) == expected
+
+
+def test_pcap_reader_matches_scapy(mixed_traffic, tmp_path):
+    scapy = pytest.importorskip('scapy.all')
+    path = str(tmp_path / 'mixed.pcap')
+    write_pcap(path, mixed_traffic)
+
+    ours = list(iter_pcap(path))
+    theirs = scapy.rdpcap(path)
+    assert len(ours) == len(theirs) == len(mixed_traffic)
+    for (ts, _, frame), packet in zip(ours, theirs):
+        assert frame == bytes(packet)
+        assert ts == pytest.approx(float(packet.time), abs=1e-6)
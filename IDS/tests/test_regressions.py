@@ -0,0 +1,208 @@
+"""
+Regression tests for fixed detector, capture-file and pipeline bugs.
+"""
+import os
+import time
+import struct
+import types
+
+import pytest
+
+from ids_core.alerting import AlertAggregator, create_summary_alert
+from ids_core.flow import FlowRecord
+from ids_core.flowtable import FlowTable
+from ids_core.pcap import iter_pcap
+from ids_core.pipeline import IngestPipeline
+from traffic import build_mix, write_pcap
+
+TCP_SYN, TCP_RST = 0x02, 0x04
+
+_SHB = (b'\x0a\x0d\x0d\x0a' + struct.pack('<I', 28) + b'\x4d\x3c\x2b\x1a'
+        + struct.pack('<HHq', 1, 0, -1) + struct.pack('<I', 28))
+_IDB = struct.pack('<II', 1, 20) + struct.pack('<HHI', 1, 0, 65535) + struct.pack('<I', 20)
+_EPB = struct.pack('<IIIIIII', 6, 92, 0, 0, 1, 60, 60) + b'\0' * 60 + struct.pack('<I', 92)
+
+
+def _read(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return list(iter_pcap(str(path)))
+
+
+# user-002: short or corrupt capture files must raise ValueError, which the
+# replay loops catch, instead of struct.error or an endless loop
+
+@pytest.mark.parametrize('name, data', [
+    ('short.pcap', b'\xd4\xc3\xb2\xa1' + b'\0' * 6),
+    ('short.pcapng', b'\x0a\x0d\x0d\x0a' + b'\0' * 4),
+    ('badlen.pcapng', _SHB + _IDB + struct.pack('<II', 6, 8) + b'\0' * 20),
+    ('garbage.pcap', b'not a capture file'),
+])
+def test_corrupt_capture_files_raise_value_error(tmp_path, name, data):
+    with pytest.raises(ValueError):
+        _read(tmp_path, name, data)
+
+
+def test_truncated_last_packet_is_dropped(tmp_path):
+    assert len(_read(tmp_path, 'ok.pcapng', _SHB + _IDB + _EPB)) == 1
+    assert _read(tmp_path, 'cut.pcapng', _SHB + _IDB + _EPB[:50]) == []
+
+
+# user-014: an early alert must not reuse the flow id of the final alert
+
+def test_early_alert_has_its_own_flow_id(make_ids):
+    ids = make_ids(early_packets=2, confidence_threshold=0.0)
+    ids._ingest(1.0, '10.0.0.1', '1.2.3.4', 6, 40000, 80, 40, 40, TCP_SYN, 0)
+    ids._ingest(1.1, '10.0.0.1', '1.2.3.4', 6, 40000, 80, 40, 40, TCP_SYN, 0)
+    ids.score_flows(now=1.2)
+    ids._ingest(1.3, '1.2.3.4', '10.0.0.1', 6, 80, 40000, 40, 40, TCP_RST, 0)
+    ids.process_flows(now=2.0)
+
+    flow_ids = [alert['flow_id'] for alert in ids.alerts]
+    assert len(flow_ids) == 2
+    assert len(set(flow_ids)) == 2
+    assert flow_ids[0].endswith('-early-' + ids.alerts[0]['prediction'])
+    assert ids.stats_snapshot()['early_alerts'] == 1
+
+
+# user-016: the first flow of a group is alerted on by itself and must not
+# be counted again in the group's summary alert
+
+def test_summary_alert_counts_only_collapsed_flows():
+    aggregator = AlertAggregator(10)
+    result = {'prediction': 'DDoS', 'confidence': 0.9, 'is_malicious': True,
+              'probabilities': {}, 'processing_time_ms': 0}
+    flows = []
+    for i in range(3):
+        flow = FlowRecord(i, '10.0.0.9', '10.0.0.1', 1000 + i, 80, 6, float(i))
+        flow.update('10.0.0.9', 1000 + i, 40, 100, float(i), TCP_SYN, 0)
+        flows.append(flow)
+
+    assert [aggregator.add(flow, result, {}, 0.0) for flow in flows] == [True, False, False]
+    group, = aggregator.pop_closed(20.0)
+    geo = dict.fromkeys(('country_code', 'country_name', 'city', 'latitude', 'longitude'))
+    alert = create_summary_alert(group, geo)
+    assert alert['flow_count'] == 2
+    assert alert['total_packets'] == 2
+    assert alert['total_bytes'] == 200
+
+    # A lone flow opens a group but produces no summary
+    aggregator.add(flows[0], result, {}, 30.0)
+    assert aggregator.pop_closed(50.0) == []
+
+
+# user-021: live-capture pipeline
+
+def test_requeued_flow_does_not_replace_a_newer_one():
+    table = FlowTable(120)
+    old = FlowRecord(1, 'a', 'b', 1, 2, 6, 0.0)
+    table.add(1, old)
+    table.mark_ready(1)
+    assert table.pop_due(1.0) == [(1, old)]
+
+    new = FlowRecord(1, 'a', 'b', 1, 2, 6, 2.0)
+    table.add(1, new)
+    table.requeue(1, old)
+    assert table.get(1) is new
+    assert table.pop_due(3.0) == [(1, old)]
+    assert table.get(1) is new
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_flow_thread_survives_housekeeping_errors():
+    sweeps = []
+
+    class FailingIDS:
+        save_interval = 0.01
+        early_scoring = False
+        metrics = None
+        flows = types.SimpleNamespace(requeue=lambda key, flow: None)
+        flow_stats = {'errors': 0}
+        score_stats = {'errors': 0}
+
+        def _ingest_queued(self, packets, n):
+            for _ in range(n):
+                packets.popleft()
+                sweeps.append('packet')
+
+        def _collect_due(self, now):
+            sweeps.append('sweep')
+            if sweeps.count('sweep') == 1:
+                raise RuntimeError('boom')
+            return []
+
+        def _score_ready(self, flows, now, requeue):
+            pass
+
+    ids = FailingIDS()
+    pipeline = IngestPipeline(ids).start()
+    try:
+        assert _wait_for(lambda: ids.flow_stats['errors'] == 1)
+        for i in range(10):
+            pipeline.push(i)
+        assert _wait_for(lambda: sweeps.count('packet') == 10)
+        assert pipeline._flow_thread.is_alive()
+    finally:
+        pipeline.close()
+
+
+def test_early_scoring_leaves_flow_fields_to_the_flow_thread(make_ids):
+    ids = make_ids(early_packets=2, confidence_threshold=0.0)
+    ids._ingest(1.0, '10.0.0.1', '1.2.3.4', 6, 40000, 80, 40, 40, TCP_SYN, 0)
+    ids._ingest(1.1, '10.0.0.1', '1.2.3.4', 6, 40000, 80, 40, 40, TCP_SYN, 0)
+    due = ids._collect_early()
+    flow = due[0][0]
+    # The flow keeps receiving packets after the snapshot was taken
+    ids._ingest(1.15, '10.0.0.1', '1.2.3.4', 6, 40000, 80, 40, 40, TCP_SYN, 0)
+
+    rescheduled = []
+    ids._score_early(due, 1.2, lambda *args: rescheduled.append(args))
+    assert flow.score_backoff == 1
+    assert flow.next_score_packets == float('inf')
+    assert rescheduled == [(flow, 2, 2, 1.1)]
+
+    ids._reschedule(*rescheduled[0])
+    assert flow.score_backoff == 2
+    assert flow.next_score_packets == 2 + 2 * 2
+
+
+def test_live_pipeline_applies_early_backoff_on_flow_thread(make_ids):
+    ids = make_ids(early_packets=2, confidence_threshold=0.0)
+    pipeline = IngestPipeline(ids, early_tick=0.02).start()
+    now = time.time()
+    for _ in range(6):
+        pipeline.push((now, '10.0.0.1', '1.2.3.4', 6, 40000, 80, 40, 40, TCP_SYN, 0))
+        time.sleep(0.05)
+    pipeline.close()
+
+    flow, = ids.flows.values()
+    assert flow.score_backoff > 1
+    assert not pipeline._rescheduled
+    assert [alert['flow_id'].rsplit('-', 2)[1] for alert in ids.alerts] == ['early']
+
+
+def test_stage_counters_add_up(make_ids, tmp_path):
+    packets = build_mix('mixed', scale=0.02)
+    path = str(tmp_path / 'mixed.pcap')
+    write_pcap(path, packets)
+    ids = make_ids()
+    ids.replay_pcaps([path])
+    ids.close()
+
+    stats = ids.stats_snapshot()
+    assert stats['total_packets'] == len(packets)
+    assert stats['tcp_packets'] + stats['udp_packets'] + stats['icmp_packets'] == len(packets)
+    assert stats['total_flows'] == stats['benign_flows'] + stats['malicious_flows'] > 0
+    assert sum(stats['attack_types'].values()) == stats['malicious_flows']
+    assert stats['errors'] == 0
+    # Each counter has one writing stage
+    parts = (ids.stats, ids.flow_stats, ids.score_stats)
+    for key in stats:
+        if key != 'errors':
+            assert sum(key in part for part in parts) == 1, key